@@ -3,6 +3,9 @@ ASGI config for backend_prestacao project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Deploy: gunicorn backend_prestacao.asgi:application -k uvicorn.workers.UvicornWorker
+(o settings força CONN_MAX_AGE=0). Os estáticos ficam fora da cadeia de middlewares (core.estaticos).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +15,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_prestacao.settings')
+os.environ['SERVIDOR_ASGI'] = '1'
 
 application = get_asgi_application()
+
+from core.estaticos import ArquivosEstaticos  # noqa: E402 (depois do setup do Django)
+
+application = ArquivosEstaticos(application)
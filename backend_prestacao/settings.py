@@ -5,6 +5,7 @@ Django settings for backend_prestacao project.
 from pathlib import Path
 import os
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -36,6 +37,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.metricas.MetricasMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
@@ -44,6 +46,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
 ]
+# No deploy ASGI os estáticos são servidos fora da cadeia (backend_prestacao/asgi.py).
+if os.environ.get('SERVIDOR_ASGI'):
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
 
 ROOT_URLCONF = 'backend_prestacao.urls'
 
@@ -67,7 +72,7 @@ WSGI_APPLICATION = 'backend_prestacao.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
-        conn_max_age=600
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600))
     )
 }
 if 'RENDER' not in os.environ:
@@ -75,8 +80,15 @@ if 'RENDER' not in os.environ:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Banco de teste em arquivo: os testes com threads (ConcorrenciaTests)
+            # precisam de mais de uma conexão, o que o SQLite em memória não permite.
+            'TEST': {'NAME': BASE_DIR / 'db_teste.sqlite3'},
         }
     }
+# Sem conexões persistentes no deploy ASGI, como pede a documentação do Django:
+# cada thread do sync_to_async manteria a sua aberta, sem nunca fechá-la.
+if os.environ.get('SERVIDOR_ASGI'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
 
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator', },
@@ -103,6 +115,8 @@ CORS_ALLOWED_ORIGINS = [
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:5173',
 ]
+# Idempotency-Key: repetição segura das aprovações (core.idempotencia).
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 if RENDER_EXTERNAL_HOSTNAME:
     CORS_ALLOWED_ORIGINS.append(f"https://{RENDER_EXTERNAL_HOSTNAME}")
@@ -115,12 +129,92 @@ if NETLIFY_URL:
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.autenticacao.TokenEmCacheAuthentication',
         'rest_framework.authentication.SessionAuthentication', 
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated', 
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CursorPadrao',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 50)),
+}
+
+# Cache compartilhado entre os workers do gunicorn em produção (mesma máquina).
+# Em desenvolvimento (e nos testes) fica o cache em memória padrão.
+# Com DJANGO_CACHE_TABLE o cache vai para o banco, compartilhado também entre
+# máquinas (criar a tabela com `python manage.py createcachetable`).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('DJANGO_CACHE_TABLE'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ['DJANGO_CACHE_TABLE'],
+    }
+elif 'RENDER' in os.environ:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', '/tmp/prestacao-cache'),
+    }
+
+# Segundos que o conjunto de subordinados de um aprovador fica em cache (core.hierarchy).
+HIERARQUIA_CACHE_TIMEOUT = 300
+
+# Segundos que o usuário autenticado por token (com perfil) fica em cache
+# (core.autenticacao). Alterações no usuário, perfil ou token já invalidam.
+AUTENTICACAO_CACHE_TIMEOUT = 60
+
+# Validade dos tokens em segundos, contada da criação ou da última renovação
+# (0 = não expiram). O cliente estende um token válido em POST
+# /api/login/renovar/ (core.autenticacao).
+TOKEN_VALIDADE = int(os.environ.get('TOKEN_VALIDADE', 0))
+
+# Segundos que o resumo financeiro de uma viagem fica em cache (core.resumos).
+# Alterações em despesas/adiantamentos já invalidam o resumo; o prazo só limita a memória usada.
+RESUMO_CACHE_TIMEOUT = 3600
+
+# Segundos que uma resposta de listagem fica em cache (core.respostas). Também
+# invalidada por versão sempre que os dados de que ela depende mudam.
+RESPOSTAS_CACHE_TIMEOUT = 3600
+
+# Segundos que a resposta de uma aprovação/rejeição com Idempotency-Key fica
+# guardada para ser devolvida nas novas tentativas (core.idempotencia).
+IDEMPOTENCIA_TIMEOUT = 24 * 60 * 60
+
+# Processos que calculam os hashes de senha na importação da organização
+# (core.organizacao); 0 = um por CPU.
+ORGANIZACAO_PROCESSOS = int(os.environ.get('ORGANIZACAO_PROCESSOS', 0))
+
+# Usuários aceitos por POST /api/users/importar/. Na requisição os hashes são
+# calculados um a um (~0,5 s cada), dentro do timeout do gunicorn; importações
+# maiores vão pelo comando importar_organizacao.
+ORGANIZACAO_MAXIMO_REQUISICAO = int(os.environ.get('ORGANIZACAO_MAXIMO_REQUISICAO', 25))
+
+# Instrumentação (core.metricas): requisições com mais consultas que o limite
+# são registradas no log com a consulta mais repetida. Com METRICAS_TOKEN
+# definido, /metrics exige "Authorization: Bearer <token>"; sem ele, só
+# usuários da equipe logados no admin.
+METRICAS_LIMITE_CONSULTAS = int(os.environ.get('METRICAS_LIMITE_CONSULTAS', 30))
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simples': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simples'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.environ.get('CORE_LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
 }
 
 # --- INÍCIO DA CORREÇÃO (ARMAZENAMENTO DE MÍDIA - SUPABASE S3) ---
@@ -158,4 +252,21 @@ STORAGES = {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
 }
-# --- FIM DA CORREÇÃO ---
\ No newline at end of file
+# --- FIM DA CORREÇÃO ---
+
+# Upload direto para o bucket (core.uploads): validade da URL pré-assinada em
+# segundos e tamanho máximo aceito pelo bucket em bytes.
+UPLOAD_DIRETO_EXPIRACAO = 900
+UPLOAD_DIRETO_TAMANHO_MAXIMO = 10 * 1024 * 1024
+
+# Otimização de imagens (core.imagens): lado maior, em pixels, da versão
+# otimizada e da miniatura, qualidade do WebP/JPEG e tamanho do pool de threads.
+IMAGENS_TAMANHO_OTIMIZADO = 1600
+IMAGENS_TAMANHO_MINIATURA = 320
+IMAGENS_QUALIDADE = 80
+IMAGENS_WORKERS = 2
+IMAGENS_EM_SEGUNDO_PLANO = True
+
+# Threads que gravam os comprovantes no storage em POST /api/despesas/lote/
+# (core.envio_lote).
+DESPESAS_LOTE_WORKERS = 8
@@ -1,13 +1,15 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework.authtoken import views
 from django.conf import settings
 from django.conf.urls.static import static
+from core import metricas
+from core.views import ObterToken
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
-    path('api-token-auth/', views.obtain_auth_token),
+    path('api-token-auth/', ObterToken.as_view()),
+    path('metrics', metricas.metricas, name='metricas'),
 ]
 
 if settings.DEBUG:
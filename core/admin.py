@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa
+from .models import Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa, SaldoUsuario
 
 # Define um inline para o PerfilUsuario aparecer dentro da tela de criação de Usuário padrão
 class PerfilUsuarioInline(admin.StackedInline):
@@ -37,4 +37,13 @@ class AdiantamentoAdmin(admin.ModelAdmin):
 class DespesaAdmin(admin.ModelAdmin):
     list_display = ('descricao', 'valor', 'usuario', 'viagem', 'status', 'categoria')
     list_filter = ('status', 'viagem', 'usuario', 'categoria')
-    search_fields = ('descricao',)
\ No newline at end of file
+    search_fields = ('descricao',)
+
+@admin.register(SaldoUsuario)
+class SaldoUsuarioAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'viagem', 'total_adiantamentos', 'total_despesas', 'atualizado_em')
+    list_filter = ('viagem',)
+    readonly_fields = ('usuario', 'viagem', 'total_adiantamentos', 'total_despesas', 'atualizado_em')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,108 @@
+"""Views assíncronas (ORM assíncrono) dos endpoints de leitura mais acessados."""
+import hashlib
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Count, Q
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+from rest_framework.request import ForcedAuthentication, Request
+
+from . import autenticacao
+from .models import FilaAprovacao
+from .pagination import DespesaPagination
+from .prefetch import despesas_enxutas, usuarios_com_viagem_atual
+from .renderers import dumps
+from .serializers import DespesaListaSerializer
+from .views import dados_do_painel, despesas_pendentes
+
+
+async def autenticar(request):
+    """
+    Equivalente assíncrono de DEFAULT_AUTHENTICATION_CLASSES: primeiro o
+    cabeçalho "Authorization: Token <chave>", depois a sessão.
+    """
+    cabecalho = get_authorization_header(request).split()
+    if cabecalho and cabecalho[0].lower() == b'token':
+        if len(cabecalho) != 2:
+            return None
+        try:
+            key = cabecalho[1].decode()
+        except UnicodeError:
+            return None
+        # Mesmo cache de core.autenticacao (cache e ORM síncronos, numa thread).
+        user = await sync_to_async(autenticacao.usuario_do_token)(key)
+        if user is None or not user.is_active or autenticacao.expirado(user.auth_token):
+            return None
+        return user
+
+    user = await request.auser()
+    return None if isinstance(user, AnonymousUser) else user
+
+
+def resposta_json(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def nao_autenticado():
+    response = resposta_json({'detail': str(exceptions.NotAuthenticated.default_detail)}, status=401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+@require_GET
+async def me(request):
+    user = await autenticar(request)
+    if user is None:
+        return nao_autenticado()
+
+    usuario = await usuarios_com_viagem_atual(user, date.today()).aget()
+    data = dados_do_painel(usuario, {'request': request})
+
+    # O frontend consulta /users/me/ com frequência: com o ETag o navegador
+    # revalida e recebe 304 quando nada mudou.
+    conteudo = dumps(data)
+    etag = quote_etag(hashlib.md5(conteudo).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(conteudo, content_type='application/json')
+    # O 304 também repete os validadores (RFC 9110, 15.4.5).
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@require_GET
+async def despesas_para_aprovacao(request):
+    user = await autenticar(request)
+    if user is None:
+        return nao_autenticado()
+
+    queryset = despesas_enxutas(despesas_pendentes(user))
+    return resposta_json(await sync_to_async(_paginar)(request, user, queryset))
+
+
+@require_GET
+async def contagem_fila(request):
+    # Para os badges do frontend: total pendente e quantas ainda não foram abertas.
+    user = await autenticar(request)
+    if user is None:
+        return nao_autenticado()
+
+    contagem = await FilaAprovacao.objects.filter(
+        aprovador=user, despesa__status='PENDENTE'
+    ).aaggregate(pendentes=Count('id'), nao_lidas=Count('id', filter=Q(lida=False)))
+    return resposta_json(contagem)
+
+
+def _paginar(request, user, queryset):
+    drf_request = Request(request, authenticators=(ForcedAuthentication(user, None),))
+    paginator = DespesaPagination()
+    pagina = paginator.paginate_queryset(queryset, drf_request)
+    data = DespesaListaSerializer(pagina, many=True, context={'request': drf_request}).data
+    return paginator.get_paginated_response(data).data
@@ -0,0 +1,124 @@
+"""
+Autenticação por token com usuário, perfil e token em cache; expiração opcional
+(settings.TOKEN_VALIDADE).
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import hierarchy
+from .models import PerfilUsuario
+
+
+def _chave(key):
+    return f'autenticacao:{hierarchy.versao()}:{hashlib.md5(key.encode()).hexdigest()}'
+
+
+def _campos(instancia, excluir=()):
+    # Valores como vieram do banco (instância recém-carregada).
+    return {
+        campo.attname: instancia.__dict__[campo.attname]
+        for campo in instancia._meta.concrete_fields if campo.attname not in excluir
+    }
+
+
+def _instancia(modelo, campos):
+    # Campos ausentes ficam adiados, como num .only().
+    return modelo.from_db(DEFAULT_DB_ALIAS, list(campos), list(campos.values()))
+
+
+def _para_cache(user):
+    perfil = getattr(user, 'perfil', None)
+    return {
+        # Sem o hash da senha: só é lido (do banco) se alguém acessar user.password.
+        'user': _campos(user, excluir=('password',)),
+        'perfil': _campos(perfil) if perfil is not None else None,
+        'token': _campos(user.auth_token),
+    }
+
+
+def _do_cache(dados):
+    user = _instancia(User, dados['user'])
+    if dados['perfil'] is None:
+        User.perfil.related.set_cached_value(user, None)
+    else:
+        user.perfil = _instancia(PerfilUsuario, dados['perfil'])
+    user.auth_token = _instancia(Token, dados['token'])
+    return user
+
+
+def usuario_do_token(key):
+    """Usuário (com perfil e auth_token) dono do token, ou None."""
+    chave = _chave(key)
+    dados = cache.get(chave)
+    if dados is not None:
+        return _do_cache(dados)
+    # Token (OneToOne reverso) e perfil no mesmo SELECT do usuário.
+    user = User.objects.select_related('perfil', 'auth_token').filter(auth_token__key=key).first()
+    if user is not None:
+        cache.set(chave, _para_cache(user), settings.AUTENTICACAO_CACHE_TIMEOUT)
+    return user
+
+
+def expiracao(token):
+    validade = settings.TOKEN_VALIDADE
+    return token.created + timedelta(seconds=validade) if validade else None
+
+
+def expirado(token):
+    fim = expiracao(token)
+    return fim is not None and fim <= timezone.now()
+
+
+def renovar(token):
+    """
+    Estende a validade do token, contada de agora. O token é o mesmo em todos
+    os dispositivos do usuário: trocá-lo desconectaria os outros.
+    """
+    token.created = timezone.now()
+    if not Token.objects.filter(pk=token.pk).update(created=token.created):
+        # Removido enquanto isso (usuário apagado ou token revogado).
+        return Token.objects.get_or_create(user_id=token.user_id)[0]
+    key = token.key
+    transaction.on_commit(lambda: invalidar_tokens(key))
+    return token
+
+
+def token_do_usuario(user):
+    """Token atual do usuário (criado no primeiro login); um expirado é renovado."""
+    token, criado = Token.objects.get_or_create(user=user)
+    if not criado and expirado(token):
+        token = renovar(token)
+    return token
+
+
+def invalidar_tokens(*keys):
+    cache.delete_many([_chave(key) for key in keys])
+
+
+def invalidar_usuario(user_id):
+    invalidar_tokens(*Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class TokenEmCacheAuthentication(TokenAuthentication):
+    """Mesmo cabeçalho e mesmas respostas de erro do TokenAuthentication."""
+
+    def authenticate_credentials(self, key):
+        user = usuario_do_token(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        if expirado(user.auth_token):
+            raise exceptions.AuthenticationFailed('Token expirado.')
+
+        return (user, user.auth_token)
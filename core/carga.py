@@ -0,0 +1,54 @@
+"""
+Gerador de carga simples: N chamadas com C em paralelo, com a latência de cada
+uma. Usado pelos comandos teste_carga e medir_desempenho.
+"""
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentil(valores, p):
+    # Método nearest-rank sobre os valores já ordenados.
+    if not valores:
+        return None
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def estatisticas(latencias, duracao, erros=0):
+    latencias = sorted(latencias)
+    return {
+        'requisicoes': len(latencias) + erros,
+        'erros': erros,
+        'duracao_s': round(duracao, 3),
+        'por_segundo': round((len(latencias) + erros) / duracao, 1) if duracao else None,
+        'p50_ms': _ms(percentil(latencias, 50)),
+        'p95_ms': _ms(percentil(latencias, 95)),
+        'p99_ms': _ms(percentil(latencias, 99)),
+        'max_ms': _ms(latencias[-1] if latencias else None),
+    }
+
+
+def _ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+def disparar(chamada, total, concorrencia):
+    """
+    Executa chamada() `total` vezes em `concorrencia` threads. chamada() deve
+    devolver True em caso de sucesso; exceções e False contam como erro.
+    """
+    def medir(_):
+        inicio = time.perf_counter()
+        try:
+            ok = chamada()
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(medir, range(total)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = [latencia for ok, latencia in resultados if ok]
+    return estatisticas(latencias, duracao, erros=len(resultados) - len(latencias))
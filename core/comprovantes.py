@@ -0,0 +1,207 @@
+"""
+Comprovantes das despesas endereçados pelo SHA-256 do conteúdo, com o aviso de
+possíveis duplicatas.
+"""
+import hashlib
+import os
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import imagens, uploads
+from .hierarchy import subordinados_ids
+from .models import Despesa
+
+PREFIXO = 'comprovantes/sha256'
+
+# Duplicatas informadas por despesa.
+MAXIMO_DUPLICATAS = 10
+
+
+def _storage():
+    return Despesa._meta.get_field('comprovante').storage
+
+
+def calcular_hash(arquivo):
+    """SHA-256 lido em blocos (arquivo enviado ou aberto do storage)."""
+    sha256 = hashlib.sha256()
+    for bloco in arquivo.chunks():
+        sha256.update(bloco)
+    return sha256.hexdigest()
+
+
+def nome_por_conteudo(hash_, nome_original):
+    extensao = os.path.splitext(nome_original)[1].lower()
+    return f'{PREFIXO}/{hash_[:2]}/{hash_}{extensao}'
+
+
+def _hash_da_origem(origem):
+    # origem: arquivo enviado ou chave de um upload direto já no bucket.
+    if not isinstance(origem, str):
+        return calcular_hash(origem)
+    storage = _storage()
+    if hasattr(storage, 'bucket_name'):
+        # Sem baixar o objeto: só o checksum conferido pelo bucket no upload.
+        # Sem ele (None), o hash fica para indexar_upload, fora da requisição.
+        return uploads.sha256_armazenado(storage, origem)
+    with storage.open(origem, 'rb') as arquivo:
+        return calcular_hash(arquivo)
+
+
+def _gravar(hash_, origem):
+    storage = _storage()
+    nome = nome_por_conteudo(hash_, origem if isinstance(origem, str) else origem.name)
+    if storage.exists(nome):
+        return nome
+    if isinstance(origem, str):
+        # Upload direto de conteúdo novo: o objeto fica onde o cliente enviou.
+        return origem
+    return storage.save(nome, origem)
+
+
+def _existentes(hashes):
+    existentes = {}
+    linhas = Despesa.objects.filter(comprovante_hash__in=hashes).order_by('id').values(
+        'comprovante_hash', 'comprovante', 'comprovante_otimizado', 'comprovante_miniatura'
+    )
+    for linha in linhas:
+        existentes.setdefault(linha['comprovante_hash'], linha)
+    return existentes
+
+
+def armazenar(origens, mapa=map):
+    """
+    Para cada origem (arquivo enviado ou chave de upload direto) devolve os
+    campos da despesa: comprovante, comprovante_hash e, se o conteúdo já tinha
+    derivados de imagem, os derivados. Devolve também as chaves de upload
+    direto que sobraram. `mapa` permite ler e gravar em paralelo
+    (executor.map); a consulta ao banco é uma só para todas as origens. Um
+    upload direto sem checksum sai com comprovante_hash vazio: quem cria a
+    despesa chama agendar_indexacao.
+    """
+    hashes = list(mapa(_hash_da_origem, origens))
+    existentes = _existentes({hash_ for hash_ in hashes if hash_})
+
+    novos = {}
+    for hash_, origem in zip(hashes, origens):
+        if hash_ and hash_ not in existentes:
+            novos.setdefault(hash_, origem)
+    gravados = dict(zip(novos, mapa(_gravar, novos, novos.values())))
+
+    campos, sobras = [], []
+    for hash_, origem in zip(hashes, origens):
+        existente = existentes.get(hash_)
+        if hash_ is None:
+            # Upload direto sem checksum: fica onde está, com o hash agendado.
+            item = {'comprovante': origem, 'comprovante_hash': ''}
+        elif existente is None:
+            item = {'comprovante': gravados[hash_], 'comprovante_hash': hash_}
+        else:
+            item = {'comprovante': existente['comprovante'], 'comprovante_hash': hash_}
+            if existente['comprovante_miniatura']:
+                item['comprovante_otimizado'] = existente['comprovante_otimizado']
+                item['comprovante_miniatura'] = existente['comprovante_miniatura']
+        if isinstance(origem, str) and origem != item['comprovante']:
+            sobras.append(origem)
+        campos.append(item)
+    return campos, sobras
+
+
+def indexar_upload(nome):
+    """Hash de um upload direto sem checksum, lido do bucket fora da requisição."""
+    storage = _storage()
+    if not storage.exists(nome):
+        return
+    with storage.open(nome, 'rb') as arquivo:
+        hash_ = calcular_hash(arquivo)
+    # update() direto, como em indexar_comprovantes: só onde o arquivo não foi trocado.
+    Despesa.objects.filter(comprovante=nome, comprovante_hash='').update(comprovante_hash=hash_)
+
+
+def agendar_indexacao(despesa):
+    """Depois do commit da despesa já gravada (precisa da linha no banco)."""
+    if despesa.comprovante and not despesa.comprovante_hash:
+        imagens.em_segundo_plano(indexar_upload, despesa.comprovante.name)
+
+
+def apagar(nomes):
+    storage = _storage()
+    for nome in nomes:
+        storage.delete(nome)
+
+
+def precisa_indexar(despesa, update_fields=None):
+    if update_fields is not None and 'comprovante' not in update_fields:
+        return False
+    arquivo = despesa.comprovante
+    if not arquivo:
+        return False
+    return not arquivo._committed or arquivo.name != getattr(despesa, '_comprovante_original', None)
+
+
+def indexar(despesa):
+    """Antes do save() de uma despesa com comprovante novo (sinal pre_save)."""
+    # Derivados só voltam se o conteúdo novo já tiver os seus (armazenar).
+    imagens.limpar_derivados(despesa)
+    arquivo = despesa.comprovante
+    if arquivo._committed and not arquivo.storage.exists(arquivo.name):
+        # Nome gravado sem o arquivo (scripts, dados de teste): fica sem hash.
+        return
+    origem = arquivo.name if arquivo._committed else arquivo.file
+    (campos,), sobras = armazenar([origem])
+    for campo, valor in campos.items():
+        setattr(despesa, campo, valor)
+    despesa._comprovante_original = despesa.comprovante.name
+    # Upload direto sem checksum: o sinal post_save agenda o hash.
+    despesa._hash_pendente = not despesa.comprovante_hash
+    if sobras:
+        transaction.on_commit(lambda: apagar(sobras))
+
+
+def duplicatas(despesas, user):
+    """
+    {id: [{'id', 'motivo'}]} com as outras despesas de mesmo comprovante
+    (motivo 'comprovante') ou do mesmo usuário com o mesmo valor e data
+    (motivo 'valor_data'), entre as que `user` pode ver: as dele e as dos
+    subordinados (todas, para o superusuário). Duas consultas, pelos índices,
+    para o lote inteiro.
+    """
+    if not despesas:
+        return {}
+    visiveis = Despesa.objects.all()
+    if not user.is_superuser:
+        visiveis = visiveis.filter(usuario_id__in={user.pk, *subordinados_ids(user)})
+
+    por_hash = defaultdict(list)
+    hashes = {despesa.comprovante_hash for despesa in despesas if despesa.comprovante_hash}
+    if hashes:
+        for pk, hash_ in visiveis.filter(comprovante_hash__in=hashes).order_by('id').values_list('id', 'comprovante_hash'):
+            por_hash[hash_].append(pk)
+
+    lancamentos = defaultdict(lambda: (set(), set()))
+    for despesa in despesas:
+        datas, valores = lancamentos[despesa.usuario_id]
+        datas.add(despesa.data_despesa)
+        valores.add(despesa.valor)
+    filtro = Q()
+    for usuario_id, (datas, valores) in lancamentos.items():
+        filtro |= Q(usuario_id=usuario_id, data_despesa__in=datas, valor__in=valores)
+    por_lancamento = defaultdict(list)
+    for pk, usuario_id, data, valor in visiveis.filter(filtro).order_by('id').values_list(
+        'id', 'usuario_id', 'data_despesa', 'valor'
+    ):
+        por_lancamento[(usuario_id, data, valor)].append(pk)
+
+    resultado = {}
+    for despesa in despesas:
+        encontradas = {}
+        for pk in por_hash.get(despesa.comprovante_hash, ()):
+            encontradas.setdefault(pk, 'comprovante')
+        for pk in por_lancamento[(despesa.usuario_id, despesa.data_despesa, despesa.valor)]:
+            encontradas.setdefault(pk, 'valor_data')
+        encontradas.pop(despesa.pk, None)
+        resultado[despesa.pk] = [
+            {'id': pk, 'motivo': motivo} for pk, motivo in list(encontradas.items())[:MAXIMO_DUPLICATAS]
+        ]
+    return resultado
@@ -0,0 +1,88 @@
+"""
+Envio de despesas em lote (POST /api/despesas/lote/) com id_cliente para os
+reenvios.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import comprovantes, fila, imagens, respostas, resumos
+from .models import Despesa, SaldoUsuario
+
+# Mesmo limite padrão de arquivos por requisição do Django
+# (DATA_UPLOAD_MAX_NUMBER_FILES): um comprovante por despesa.
+ENVIO_MAXIMO = 100
+
+# Novas leituras quando outro envio grava o mesmo id_cliente entre a leitura e o INSERT.
+TENTATIVAS = 3
+
+
+def enviadas(user, ids_cliente):
+    """{id_cliente: id} das despesas do usuário já criadas com esses id_cliente."""
+    ids_cliente = [id_cliente for id_cliente in ids_cliente if id_cliente]
+    if not ids_cliente:
+        return {}
+    return dict(
+        Despesa.objects.filter(usuario=user, id_cliente__in=ids_cliente).values_list('id_cliente', 'pk')
+    )
+
+
+def armazenar_comprovantes(origens):
+    """
+    core.comprovantes.armazenar com o hash e a gravação no storage em
+    paralelo: devolve os campos de comprovante de cada origem (arquivo enviado
+    ou chave de upload direto) e as chaves de upload direto que sobraram.
+    """
+    if not origens:
+        return [], []
+    with ThreadPoolExecutor(
+        max_workers=min(settings.DESPESAS_LOTE_WORKERS, len(origens)),
+        thread_name_prefix='despesas-lote',
+    ) as executor:
+        return comprovantes.armazenar(origens, executor.map)
+
+
+def criar(user, itens):
+    """
+    Cria as despesas (dicts com os campos do model, viagem como viagem_id, o
+    id_cliente e os campos de armazenar_comprovantes) numa transação. Devolve
+    as instâncias criadas, com pk, e {id_cliente: id} dos itens que outro
+    envio já tinha criado. A constraint (usuario, id_cliente) garante um só
+    INSERT por item mesmo com reenvios simultâneos.
+    """
+    for tentativa in range(TENTATIVAS):
+        try:
+            return _criar(user, itens)
+        except IntegrityError:
+            # O outro envio já fez commit: a próxima leitura encontra a despesa.
+            if tentativa == TENTATIVAS - 1:
+                raise
+
+
+def _criar(user, itens):
+    with transaction.atomic():
+        anteriores = enviadas(user, [item.get('id_cliente') for item in itens])
+        novos = [item for item in itens if item.get('id_cliente') not in anteriores]
+        if not novos:
+            return [], anteriores
+        despesas = Despesa.objects.bulk_create([Despesa(usuario=user, **item) for item in novos])
+
+        totais = defaultdict(Decimal)
+        for despesa in despesas:
+            totais[despesa.viagem_id] += despesa.valor
+        for viagem_id, valor in totais.items():
+            SaldoUsuario.objects.movimentar(Despesa.campo_saldo, user.pk, viagem_id, valor)
+
+        fila.sincronizar([despesa.pk for despesa in despesas])
+        for despesa in despesas:
+            comprovantes.agendar_indexacao(despesa)
+            if imagens.precisa_processar(despesa):
+                imagens.agendar(despesa)
+
+        viagens = set(totais)
+        transaction.on_commit(lambda: resumos.invalidar(*viagens))
+        transaction.on_commit(lambda: respostas.invalidar(Despesa))
+    return despesas, anteriores
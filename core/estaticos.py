@@ -0,0 +1,33 @@
+"""Estáticos do deploy ASGI servidos pelo WhiteNoise antes da cadeia de middlewares."""
+from asgiref.sync import sync_to_async
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from django.http import Http404
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+async def _ler(arquivo):
+    # O arquivo é fechado por response.close(), como no FileResponse.
+    ler = sync_to_async(arquivo.read, thread_sensitive=False)
+    while bloco := await ler(64 * 1024):
+        yield bloco
+
+
+class ArquivosEstaticos(ASGIStaticFilesHandler):
+    """Requisições em STATIC_URL vão para o WhiteNoise; as demais, para o Django."""
+
+    def __init__(self, application):
+        super().__init__(application)
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def serve(self, request):
+        if self.whitenoise.autorefresh:
+            arquivo = self.whitenoise.find_file(request.path_info)
+        else:
+            arquivo = self.whitenoise.files.get(request.path_info)
+        if arquivo is None:
+            raise Http404
+        response = self.whitenoise.serve(arquivo, request)
+        if response.file_to_stream is not None:
+            # Em blocos, sem carregar o arquivo inteiro como o ASGIStaticFilesHandler.
+            response.streaming_content = _ler(response.file_to_stream)
+        return response
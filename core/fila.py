@@ -0,0 +1,98 @@
+"""Manutenção da FilaAprovacao (caixa de entrada dos aprovadores)."""
+from collections import defaultdict
+
+from .models import Departamento, Despesa, FilaAprovacao, PerfilUsuario
+
+LOTE = 2000
+
+
+def aprovadores_por_usuario(usuario_ids):
+    """{usuario_id: {ids dos aprovadores}} para os donos de despesas informados."""
+    aprovadores = defaultdict(set)
+    tipos = dict(PerfilUsuario.objects.filter(user_id__in=usuario_ids).values_list('user_id', 'tipo'))
+
+    gestores = [usuario_id for usuario_id, tipo in tipos.items() if tipo == 'GESTOR']
+    if gestores:
+        diretores = set(PerfilUsuario.objects.filter(tipo='DIRETOR').values_list('user_id', flat=True))
+        for usuario_id in gestores:
+            aprovadores[usuario_id] = diretores - {usuario_id}
+
+    colaboradores = [usuario_id for usuario_id, tipo in tipos.items() if tipo == 'COLABORADOR']
+    if colaboradores:
+        vinculos = PerfilUsuario.objects.filter(
+            user_id__in=colaboradores,
+            departamentos__gestor__perfil__tipo='GESTOR',
+        ).values_list('user_id', 'departamentos__gestor_id')
+        for usuario_id, gestor_id in vinculos:
+            aprovadores[usuario_id].add(gestor_id)
+
+    return aprovadores
+
+
+def sincronizar(despesa_ids):
+    despesa_ids = list(set(despesa_ids))
+    for inicio in range(0, len(despesa_ids), LOTE):
+        _sincronizar_lote(despesa_ids[inicio:inicio + LOTE])
+
+
+def _sincronizar_lote(despesa_ids):
+    pendentes = dict(
+        Despesa.objects.filter(pk__in=despesa_ids, status='PENDENTE').values_list('id', 'usuario_id')
+    )
+    aprovadores = aprovadores_por_usuario(set(pendentes.values()))
+    desejadas = {
+        (aprovador_id, despesa_id)
+        for despesa_id, usuario_id in pendentes.items()
+        for aprovador_id in aprovadores[usuario_id]
+    }
+
+    existentes = {
+        (aprovador_id, despesa_id): pk
+        for pk, aprovador_id, despesa_id in FilaAprovacao.objects.filter(
+            despesa_id__in=despesa_ids
+        ).values_list('id', 'aprovador_id', 'despesa_id')
+    }
+
+    sobrando = [pk for chave, pk in existentes.items() if chave not in desejadas]
+    if sobrando:
+        FilaAprovacao.objects.filter(pk__in=sobrando).delete()
+    faltando = [
+        FilaAprovacao(aprovador_id=aprovador_id, despesa_id=despesa_id)
+        for aprovador_id, despesa_id in desejadas if (aprovador_id, despesa_id) not in existentes
+    ]
+    FilaAprovacao.objects.bulk_create(faltando, batch_size=LOTE, ignore_conflicts=True)
+
+
+def remover(despesa_ids):
+    # Despesas aprovadas/rejeitadas (inclusive pelos update() em lote).
+    FilaAprovacao.objects.filter(despesa_id__in=despesa_ids).delete()
+
+
+def sincronizar_donos(usuario_ids):
+    sincronizar(Despesa.objects.filter(usuario_id__in=usuario_ids, status='PENDENTE').values_list('id', flat=True))
+
+
+def sincronizar_perfil(usuario_id):
+    """
+    Um perfil alterado muda quem aprova as despesas do usuário e, se ele é
+    (ou era) aprovador, as despesas que ele aprova.
+    """
+    donos = {usuario_id}
+    donos |= set(
+        PerfilUsuario.objects.filter(
+            departamentos__in=Departamento.objects.filter(gestor_id=usuario_id)
+        ).values_list('user_id', flat=True)
+    )
+    if PerfilUsuario.objects.filter(user_id=usuario_id, tipo='DIRETOR').exists():
+        donos |= set(PerfilUsuario.objects.filter(tipo='GESTOR').values_list('user_id', flat=True))
+
+    despesa_ids = set(
+        Despesa.objects.filter(usuario_id__in=donos, status='PENDENTE').values_list('id', flat=True)
+    )
+    despesa_ids |= set(FilaAprovacao.objects.filter(aprovador_id=usuario_id).values_list('despesa_id', flat=True))
+    sincronizar(despesa_ids)
+
+
+def reconciliar():
+    FilaAprovacao.objects.exclude(despesa__status='PENDENTE').delete()
+    sincronizar(Despesa.objects.filter(status='PENDENTE').values_list('id', flat=True))
@@ -0,0 +1,43 @@
+"""
+Subordinados de cada aprovador (DIRETOR: gestores; GESTOR: colaboradores dos
+seus departamentos), em cache pela versão da hierarquia.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from . import versoes
+
+CHAVE_VERSAO = 'hierarquia:versao'
+
+
+def versao():
+    return versoes.atuais([CHAVE_VERSAO])[CHAVE_VERSAO]
+
+
+def invalidar():
+    versoes.incrementar(CHAVE_VERSAO)
+
+
+def _calcular(user, tipo):
+    if tipo == 'DIRETOR':
+        subordinados = User.objects.filter(perfil__tipo='GESTOR')
+    else:
+        subordinados = User.objects.filter(
+            perfil__tipo='COLABORADOR',
+            perfil__departamentos__gestor=user
+        )
+    return frozenset(subordinados.values_list('id', flat=True).distinct())
+
+
+def subordinados_ids(user):
+    perfil = getattr(user, 'perfil', None)
+    if not perfil or perfil.tipo not in ('DIRETOR', 'GESTOR'):
+        return frozenset()
+
+    chave = f'hierarquia:{versao()}:{user.pk}'
+    ids = cache.get(chave)
+    if ids is None:
+        ids = _calcular(user, perfil.tipo)
+        cache.set(chave, ids, settings.HIERARQUIA_CACHE_TIMEOUT)
+    return ids
@@ -0,0 +1,71 @@
+"""Cabeçalho Idempotency-Key nos endpoints de aprovação/rejeição."""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+TAMANHO_MAXIMO_CHAVE = 255
+
+# Segundos que a marca "em andamento" segura a chave se o processo morrer no meio.
+TRAVA_TIMEOUT = 60
+
+
+def _assinatura(request):
+    corpo = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path} {corpo}'.encode()).hexdigest()
+
+
+def idempotente(view):
+    """Decorator para views de função do DRF (abaixo de @api_view)."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        chave = request.headers.get('Idempotency-Key', None)
+        if not chave:
+            return view(request, *args, **kwargs)
+        if len(chave) > TAMANHO_MAXIMO_CHAVE:
+            return Response(
+                {'error': f'Idempotency-Key deve ter no máximo {TAMANHO_MAXIMO_CHAVE} caracteres.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        chave_cache = 'idempotencia:' + hashlib.md5(f'{request.user.pk}:{chave}'.encode()).hexdigest()
+        assinatura = _assinatura(request)
+
+        if not cache.add(chave_cache, {'assinatura': assinatura, 'em_andamento': True}, TRAVA_TIMEOUT):
+            salvo = cache.get(chave_cache)
+            if salvo is not None:
+                if salvo['assinatura'] != assinatura:
+                    return Response(
+                        {'error': 'Idempotency-Key já usada com outro conteúdo.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if salvo.get('em_andamento'):
+                    return Response(
+                        {'error': 'Requisição com esta Idempotency-Key ainda em andamento.'},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                return Response(salvo['data'], status=salvo['status'], headers={'Idempotent-Replayed': 'true'})
+            # A entrada expirou entre o add() e o get(): processa normalmente.
+            cache.add(chave_cache, {'assinatura': assinatura, 'em_andamento': True}, TRAVA_TIMEOUT)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(chave_cache)
+            raise
+
+        if response.status_code < 500:
+            cache.set(
+                chave_cache,
+                {'assinatura': assinatura, 'status': response.status_code, 'data': response.data},
+                settings.IDEMPOTENCIA_TIMEOUT,
+            )
+        else:
+            cache.delete(chave_cache)
+        return response
+
+    return wrapper
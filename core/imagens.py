@@ -0,0 +1,161 @@
+"""
+Derivados otimizados e miniaturas das imagens (comprovantes e fotos de perfil),
+gerados em segundo plano.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from . import respostas
+from .models import PerfilUsuario, Despesa
+
+logger = logging.getLogger(__name__)
+
+# model -> (campo original, campo otimizado, campo miniatura)
+CAMPOS = {
+    Despesa: ('comprovante', 'comprovante_otimizado', 'comprovante_miniatura'),
+    PerfilUsuario: ('foto_perfil', 'foto_perfil_otimizada', 'foto_perfil_miniatura'),
+}
+
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff', '.heic')
+
+if features.check('webp'):
+    FORMATO, EXTENSAO = 'WEBP', 'webp'
+else:
+    FORMATO, EXTENSAO = 'JPEG', 'jpg'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGENS_WORKERS,
+            thread_name_prefix='imagens',
+        )
+    return _executor
+
+
+def prefixo_derivado(nome_original, sufixo):
+    return f"derivados/{os.path.splitext(nome_original)[0]}_{sufixo}"
+
+
+def original_trocado(instance, update_fields=None):
+    origem = CAMPOS[type(instance)][0]
+    if update_fields is not None and origem not in update_fields:
+        return False
+    arquivo = getattr(instance, origem)
+    if arquivo and not arquivo._committed:
+        return True
+    return (arquivo.name or None) != getattr(instance, f'_{origem}_original', None)
+
+
+def limpar_derivados(instance):
+    """
+    Antes do save() com o original trocado: os derivados do arquivo anterior
+    saem e os campos ficam vazios até gerar_derivados rodar para o novo.
+    """
+    _, campo_otimizado, campo_miniatura = CAMPOS[type(instance)]
+    setattr(instance, campo_otimizado, None)
+    setattr(instance, campo_miniatura, None)
+
+
+def precisa_processar(instance):
+    origem, _, campo_miniatura = CAMPOS[type(instance)]
+    arquivo = getattr(instance, origem)
+    if not arquivo or not arquivo.name.lower().endswith(EXTENSOES_IMAGEM):
+        return False
+    miniatura = getattr(instance, campo_miniatura).name or ''
+    return not miniatura.startswith(prefixo_derivado(arquivo.name, 'miniatura'))
+
+
+def agendar(instance):
+    model, pk = type(instance), instance.pk
+
+    if settings.IMAGENS_EM_SEGUNDO_PLANO:
+        transaction.on_commit(lambda: _get_executor().submit(processar_em_thread, model, pk))
+    else:
+        transaction.on_commit(lambda: gerar_derivados(model, pk))
+
+
+def processar_em_thread(model, pk):
+    try:
+        gerar_derivados(model, pk)
+    except Exception:
+        logger.exception("Falha ao gerar derivados de %s %s", model.__name__, pk)
+    finally:
+        # Cada thread do pool abre a própria conexão; não deixa ela pendurada.
+        connection.close()
+
+
+def em_segundo_plano(funcao, *args):
+    """Outra leitura de arquivo depois do commit, no mesmo pool (core.comprovantes)."""
+    if settings.IMAGENS_EM_SEGUNDO_PLANO:
+        transaction.on_commit(lambda: _get_executor().submit(_executar_em_thread, funcao, *args))
+    else:
+        transaction.on_commit(lambda: funcao(*args))
+
+
+def _executar_em_thread(funcao, *args):
+    try:
+        funcao(*args)
+    except Exception:
+        logger.exception("Falha em segundo plano: %s%r", funcao.__name__, args)
+    finally:
+        connection.close()
+
+
+def _codificar(imagem, tamanho):
+    copia = imagem.copy()
+    copia.thumbnail((tamanho, tamanho), Image.LANCZOS)
+    if FORMATO == 'JPEG' and copia.mode != 'RGB':
+        copia = copia.convert('RGB')
+    buffer = BytesIO()
+    # Sem o parâmetro exif, nada dos metadados originais é gravado.
+    copia.save(buffer, format=FORMATO, quality=settings.IMAGENS_QUALIDADE, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def gerar_derivados(model, pk):
+    origem, campo_otimizado, campo_miniatura = CAMPOS[model]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not precisa_processar(instance):
+        return
+
+    arquivo = getattr(instance, origem)
+    try:
+        with arquivo.open('rb') as f:
+            imagem = Image.open(f)
+            imagem.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        logger.warning("Imagem ignorada (%s %s): %s", model.__name__, pk, exc)
+        return
+
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() else 'RGB')
+
+    storage = arquivo.storage
+    nomes = {}
+    for campo, sufixo, tamanho in (
+        (campo_otimizado, 'otimizado', settings.IMAGENS_TAMANHO_OTIMIZADO),
+        (campo_miniatura, 'miniatura', settings.IMAGENS_TAMANHO_MINIATURA),
+    ):
+        nome = f"{prefixo_derivado(arquivo.name, sufixo)}.{EXTENSAO}"
+        nomes[campo] = storage.save(nome, _codificar(imagem, tamanho))
+
+    if any(campo.name == 'atualizado_em' for campo in model._meta.fields):
+        nomes['atualizado_em'] = timezone.now()
+
+    # update() direto: não dispara sinais de novo e só grava se o original
+    # não foi trocado enquanto os derivados eram gerados.
+    if model.objects.filter(pk=pk, **{origem: arquivo.name}).update(**nomes):
+        respostas.invalidar(model)
@@ -0,0 +1,175 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core import hierarchy, respostas
+from core.models import Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa
+
+LOTE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria uma organização sintética (diretores, gestores, departamentos, colaboradores, "
+        "viagens, adiantamentos e despesas) para medições de desempenho. Os usuários "
+        "ficam com o prefixo informado e a senha 'sintetico'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--diretores', type=int, default=2)
+        parser.add_argument('--gestores', type=int, default=10)
+        parser.add_argument('--departamentos', type=int, default=10)
+        parser.add_argument('--colaboradores', type=int, default=300)
+        parser.add_argument('--viagens', type=int, default=2000)
+        parser.add_argument('--participantes', type=int, default=5, help='Participantes por viagem.')
+        parser.add_argument('--adiantamentos', type=int, default=20000)
+        parser.add_argument('--despesas', type=int, default=200000)
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório (dados reprodutíveis).')
+        parser.add_argument('--prefixo', default='sint', help='Prefixo dos usernames gerados.')
+        parser.add_argument('--forcar', action='store_true', help='Permite rodar com DEBUG=False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forcar']:
+            raise CommandError("DEBUG=False: use --forcar para gerar dados sintéticos neste banco.")
+        prefixo = options['prefixo']
+        if User.objects.filter(username__startswith=f'{prefixo}-').exists():
+            raise CommandError(f"Já existem usuários com o prefixo '{prefixo}-'. Use outro --prefixo.")
+
+        aleatorio = random.Random(options['semente'])
+        # Um único hash para todos: make_password por usuário levaria minutos.
+        senha = make_password('sintetico')
+
+        with transaction.atomic():
+            departamentos = Departamento.objects.bulk_create(
+                [Departamento(nome=f'{prefixo} departamento {i}') for i in range(options['departamentos'])]
+            )
+            diretores = self.criar_usuarios(prefixo, 'diretor', options['diretores'], senha)
+            gestores = self.criar_usuarios(prefixo, 'gestor', options['gestores'], senha)
+            colaboradores = self.criar_usuarios(prefixo, 'colaborador', options['colaboradores'], senha)
+
+            perfis = PerfilUsuario.objects.bulk_create(
+                [PerfilUsuario(user=u, tipo='DIRETOR') for u in diretores]
+                + [PerfilUsuario(user=u, tipo='GESTOR') for u in gestores]
+                + [PerfilUsuario(user=u, tipo='COLABORADOR') for u in colaboradores]
+            )
+            perfil_de = {perfil.user_id: perfil for perfil in perfis}
+
+            # Cada departamento tem um gestor; colaboradores ficam num departamento.
+            if gestores:
+                for i, departamento in enumerate(departamentos):
+                    departamento.gestor = gestores[i % len(gestores)]
+                Departamento.objects.bulk_update(departamentos, ['gestor'], batch_size=LOTE)
+
+            Vinculo = PerfilUsuario.departamentos.through
+            vinculos = []
+            if departamentos:
+                for i, gestor in enumerate(gestores):
+                    vinculos.append(Vinculo(perfilusuario_id=perfil_de[gestor.pk].pk, departamento_id=departamentos[i % len(departamentos)].pk))
+                for colaborador in colaboradores:
+                    vinculos.append(Vinculo(perfilusuario_id=perfil_de[colaborador.pk].pk, departamento_id=aleatorio.choice(departamentos).pk))
+            Vinculo.objects.bulk_create(vinculos, batch_size=LOTE)
+
+            viagens, participantes = self.criar_viagens(aleatorio, options, colaboradores + gestores)
+            self.criar_adiantamentos(aleatorio, options['adiantamentos'], viagens, participantes)
+            self.criar_despesas(aleatorio, options['despesas'], viagens, participantes, gestores + diretores)
+
+        # bulk_create não passa pelo MovimentoSaldo.save() nem pelos sinais:
+        # saldo e fila de aprovação são recalculados de uma vez.
+        call_command('reconstruir_saldos', stdout=self.stdout)
+        call_command('reconstruir_fila_aprovacao', stdout=self.stdout)
+        hierarchy.invalidar()
+        respostas.invalidar(User, Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa)
+        self.stdout.write(self.style.SUCCESS(
+            f"Organização '{prefixo}' criada: {len(diretores)} diretor(es), {len(gestores)} gestor(es), "
+            f"{len(colaboradores)} colaborador(es), {len(viagens)} viagem(ns), "
+            f"{options['adiantamentos']} adiantamento(s), {options['despesas']} despesa(s)."
+        ))
+
+    def criar_usuarios(self, prefixo, papel, quantidade, senha):
+        return User.objects.bulk_create([
+            User(username=f'{prefixo}-{papel}-{i}', first_name=papel.capitalize(), last_name=str(i), password=senha)
+            for i in range(quantidade)
+        ], batch_size=LOTE)
+
+    def criar_viagens(self, aleatorio, options, pessoas):
+        hoje = timezone.now().date()
+        inicio_periodo = hoje - timedelta(days=3 * 365)
+        viagens = []
+        for i in range(options['viagens']):
+            # Maioria no passado, algumas em andamento e algumas futuras.
+            inicio = inicio_periodo + timedelta(days=aleatorio.randint(0, 3 * 365 + 60))
+            viagens.append(Viagem(
+                titulo=f'Viagem {i}',
+                data_inicio=inicio,
+                data_fim=inicio + timedelta(days=aleatorio.randint(1, 15)),
+                status='CANCELADA' if aleatorio.random() < 0.03 else 'ATIVA',
+            ))
+        viagens = Viagem.objects.bulk_create(viagens, batch_size=LOTE)
+
+        Participacao = Viagem.participantes.through
+        participantes = {}
+        linhas = []
+        for viagem in viagens:
+            escolhidos = aleatorio.sample(pessoas, min(options['participantes'], len(pessoas)))
+            participantes[viagem.pk] = [pessoa.pk for pessoa in escolhidos]
+            linhas += [Participacao(viagem_id=viagem.pk, user_id=pessoa.pk) for pessoa in escolhidos]
+        Participacao.objects.bulk_create(linhas, batch_size=LOTE)
+        return viagens, participantes
+
+    def criar_adiantamentos(self, aleatorio, quantidade, viagens, participantes):
+        if not viagens:
+            return
+        lote = []
+        for _ in range(quantidade):
+            viagem = aleatorio.choice(viagens)
+            if not participantes[viagem.pk]:
+                continue
+            lote.append(Adiantamento(
+                viagem_id=viagem.pk,
+                usuario_id=aleatorio.choice(participantes[viagem.pk]),
+                valor=Decimal(aleatorio.randint(20000, 300000)) / 100,
+            ))
+            if len(lote) == LOTE:
+                Adiantamento.objects.bulk_create(lote)
+                lote = []
+        Adiantamento.objects.bulk_create(lote)
+
+    def criar_despesas(self, aleatorio, quantidade, viagens, participantes, aprovadores):
+        if not viagens:
+            return
+        categorias = [categoria for categoria, _ in Despesa.CATEGORIAS]
+        agora = timezone.now()
+        lote = []
+        for i in range(quantidade):
+            viagem = aleatorio.choice(viagens)
+            if not participantes[viagem.pk]:
+                continue
+            duracao = (viagem.data_fim - viagem.data_inicio).days
+            sorteio = aleatorio.random()
+            status = 'APROVADO' if sorteio < 0.6 else 'PENDENTE' if sorteio < 0.85 else 'REJEITADO'
+            processada = status != 'PENDENTE' and aprovadores
+            lote.append(Despesa(
+                viagem_id=viagem.pk,
+                usuario_id=aleatorio.choice(participantes[viagem.pk]),
+                valor=Decimal(aleatorio.randint(500, 80000)) / 100,
+                data_despesa=viagem.data_inicio + timedelta(days=aleatorio.randint(0, duracao)),
+                descricao=f'Despesa sintética {i}',
+                categoria=aleatorio.choice(categorias),
+                comprovante='comprovantes/sintetico.pdf',
+                status=status,
+                aprovador_id=aleatorio.choice(aprovadores).pk if processada else None,
+                data_aprovacao=agora if processada else None,
+                observacao_rejeicao='Comprovante ilegível.' if status == 'REJEITADO' else None,
+            ))
+            if len(lote) == LOTE:
+                Despesa.objects.bulk_create(lote)
+                lote = []
+        Despesa.objects.bulk_create(lote)
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import organizacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa usuários, perfis e departamentos de um CSV (colunas username, first_name, "
+        "last_name, senha, tipo, departamentos separados por ';') ou de uma lista JSON com "
+        "as mesmas chaves. Usernames já cadastrados são ignorados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=['csv', 'json'],
+                            help='Padrão: pela extensão do arquivo.')
+        parser.add_argument('--processos', type=int,
+                            help='Processos para os hashes de senha (padrão: settings.ORGANIZACAO_PROCESSOS).')
+        parser.add_argument('--lote', type=int, default=organizacao.LOTE, help='Usuários por INSERT (a importação é uma transação só).')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or os.path.splitext(options['arquivo'])[1].lstrip('.').lower()
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                registros = organizacao.ler(arquivo.read(), formato)
+        except (OSError, organizacao.ImportacaoInvalida) as exc:
+            raise CommandError(str(exc))
+
+        resultado = organizacao.importar(registros, options['processos'], options['lote'])
+
+        for erro in resultado['erros']:
+            self.stderr.write(f"linha {erro['linha']} ({erro['username'] or '-'}): {erro['error']}")
+        self.stdout.write(
+            f"{resultado['criados']} usuários e {resultado['departamentos_criados']} departamentos criados, "
+            f"{len(resultado['erros'])} registros ignorados."
+        )
+        self.stdout.write(
+            f"hash das senhas {resultado['hash_s']} s, gravação {resultado['escrita_s']} s, "
+            f"{resultado['usuarios_por_segundo']} usuários/s"
+        )
+        self.stdout.write(self.style.SUCCESS('Importação concluída.'))
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import comprovantes
+from core.models import Despesa
+
+LOTE = 200
+
+
+def _hash(nome):
+    storage = Despesa._meta.get_field('comprovante').storage
+    if not storage.exists(nome):
+        return None
+    with storage.open(nome, 'rb') as arquivo:
+        return comprovantes.calcular_hash(arquivo)
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche Despesa.comprovante_hash das despesas enviadas antes do índice de "
+        "comprovantes (core.comprovantes), lendo os arquivos do storage. Os arquivos "
+        "não são movidos: só os próximos envios reaproveitam o conteúdo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.DESPESAS_LOTE_WORKERS,
+                            help='Arquivos lidos em paralelo.')
+
+    def handle(self, *args, **options):
+        pendentes = Despesa.objects.filter(comprovante_hash='').exclude(comprovante='')
+        indexadas, faltando, ultimo = 0, 0, 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                linhas = list(pendentes.filter(pk__gt=ultimo).order_by('pk').values_list('pk', 'comprovante')[:LOTE])
+                if not linhas:
+                    break
+                ultimo = linhas[-1][0]
+                for (pk, nome), hash_ in zip(linhas, executor.map(_hash, [nome for _, nome in linhas])):
+                    if hash_ is None:
+                        faltando += 1
+                        continue
+                    # update() direto: só grava se o comprovante não foi trocado enquanto era lido.
+                    indexadas += Despesa.objects.filter(pk=pk, comprovante=nome).update(comprovante_hash=hash_)
+
+        if faltando:
+            self.stdout.write(self.style.WARNING(f"{faltando} comprovante(s) não encontrado(s) no storage."))
+        self.stdout.write(self.style.SUCCESS(f"{indexadas} comprovante(s) indexado(s)."))
@@ -0,0 +1,218 @@
+import json
+import logging
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+
+from core import carga
+from core.hierarchy import subordinados_ids
+from core.models import Departamento, Viagem, Adiantamento, Despesa
+
+PAPEIS = ('ADMIN', 'DIRETOR', 'GESTOR', 'COLABORADOR')
+
+
+def rotas_get(prefixo='api/'):
+    """
+    Rotas GET de core/urls.py, como (nome, padrão, kwargs). As rotas só de
+    escrita ficam de fora: o benchmark não altera o banco.
+    """
+    rotas = []
+    for padrao in get_resolver().url_patterns:
+        if isinstance(padrao, URLResolver) and str(padrao.pattern) == prefixo:
+            _coletar(padrao.url_patterns, prefixo, rotas)
+    return rotas
+
+
+def _coletar(padroes, prefixo, rotas):
+    for padrao in padroes:
+        texto = prefixo + str(padrao.pattern).lstrip('^').rstrip('$')
+        if isinstance(padrao, URLResolver):
+            _coletar(padrao.url_patterns, texto, rotas)
+        elif isinstance(padrao, URLPattern) and 'format' not in padrao.pattern.regex.groupindex:
+            if _aceita_get(padrao.callback):
+                rotas.append((padrao.name, texto, list(padrao.pattern.regex.groupindex)))
+
+
+def _aceita_get(callback):
+    acoes = getattr(callback, 'actions', None)
+    if acoes is not None:
+        return 'get' in acoes
+    cls = getattr(callback, 'cls', None)
+    if cls is not None:
+        return hasattr(cls, 'get')
+    # Views Django comuns (core.assincronas) são todas GET.
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede latência (p50/p95/p99) e número de consultas de todas as rotas GET de "
+        "core/urls.py, para cada papel de usuário, e grava o resultado em JSON para "
+        "comparação entre commits. Use com um banco populado por gerar_dados_sinteticos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saida', default='desempenho.json', help='Arquivo JSON de saída.')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para mostrar a diferença.')
+        parser.add_argument('--repeticoes', type=int, default=20, help='Requisições sequenciais por rota.')
+        parser.add_argument('--concorrencia', type=int, default=0,
+                            help='Se maior que zero, também dispara as rotas em paralelo com essa concorrência.')
+        parser.add_argument('--papel', action='append', dest='papeis', choices=PAPEIS, help='Papéis medidos (repetível).')
+        parser.add_argument('--rota', action='append', dest='rotas', help='Mede só as rotas com este nome (repetível).')
+        parser.add_argument('--sem-cache', action='store_true', help='Limpa o cache antes de cada requisição.')
+
+    def handle(self, *args, **options):
+        rotas = [rota for rota in rotas_get() if not options['rotas'] or rota[0] in options['rotas']]
+        # 404/403 esperados (ex.: papel sem acesso à rota) não precisam poluir a saída.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        resultado = {
+            'commit': self.commit_atual(),
+            'banco': connection.vendor,
+            'gerado_em': timezone.now().isoformat(),
+            'parametros': {
+                'repeticoes': options['repeticoes'],
+                'concorrencia': options['concorrencia'],
+                'sem_cache': options['sem_cache'],
+                'despesas': Despesa.objects.count(),
+                'viagens': Viagem.objects.count(),
+            },
+            'rotas': {},
+        }
+
+        # O Client usa o host "testserver".
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for papel in options['papeis'] or PAPEIS:
+                user = self.usuario_do_papel(papel)
+                if user is None:
+                    self.stdout.write(self.style.WARNING(f"Nenhum usuário com papel {papel}; ignorado."))
+                    continue
+                client = Client()
+                client.force_login(user)
+                amostras = self.amostras(user)
+
+                for nome, padrao, parametros in rotas:
+                    for url in self.urls(padrao, parametros, amostras):
+                        medicao = self.medir(client, url, options)
+                        if options['concorrencia'] > 0:
+                            medicao['concorrente'] = self.medir_concorrente(client, url, options)
+                        resultado['rotas'].setdefault(papel, {})[url] = {'nome': nome, **medicao}
+                        self.stdout.write(
+                            f"{papel:<12} {url:<55} {medicao['status']} "
+                            f"p50 {medicao['p50_ms']} ms  p95 {medicao['p95_ms']} ms  {medicao['consultas']} consulta(s)"
+                        )
+
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}."))
+
+        if options['comparar']:
+            self.comparar(options['comparar'], resultado)
+
+    def amostras(self, user):
+        # Para cada prefixo de rota, um registro que o usuário pode ver (usado no <pk>).
+        viagens = Viagem.objects.filter(despesas__isnull=False)
+        despesas = Despesa.objects.all()
+        adiantamentos = Adiantamento.objects.all()
+        if not user.is_superuser:
+            viagens = viagens.filter(participantes=user)
+            if user.perfil.tipo in ('DIRETOR', 'GESTOR'):
+                despesas = despesas.filter(usuario_id__in=subordinados_ids(user))
+            else:
+                despesas = despesas.filter(usuario=user)
+                adiantamentos = adiantamentos.filter(usuario=user)
+        return {
+            'viagens': viagens.order_by('-id').first() or Viagem.objects.order_by('-id').first(),
+            'despesas': despesas.order_by('-id').first(),
+            'adiantamentos': adiantamentos.order_by('-id').first(),
+            'users': user,
+            'departamentos': Departamento.objects.order_by('-id').first(),
+        }
+
+    def usuario_do_papel(self, papel):
+        if papel == 'ADMIN':
+            return User.objects.filter(is_superuser=True, is_active=True).first()
+        return User.objects.filter(perfil__tipo=papel, is_active=True).order_by('id').first()
+
+    def urls(self, padrao, parametros, amostras):
+        if not parametros:
+            return [padrao]
+        if parametros == ['pk']:
+            instancia = amostras.get(padrao.split('/')[1])
+            return [padrao.replace('(?P<pk>[^/.]+)', str(instancia.pk)).replace('<int:pk>', str(instancia.pk))] if instancia else []
+        if parametros == ['formato']:
+            return [padrao.replace(r'\.(?P<formato>csv|xlsx)', f'.{formato}') for formato in ('csv', 'xlsx')]
+        self.stdout.write(self.style.WARNING(f"Rota {padrao} ignorada: parâmetros {parametros} sem amostra."))
+        return []
+
+    def requisitar(self, client, url, sem_cache):
+        if sem_cache:
+            cache.clear()
+        response = client.get('/' + url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def medir(self, client, url, options):
+        latencias, consultas = [], []
+        status = None
+        for _ in range(options['repeticoes']):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                response = self.requisitar(client, url, options['sem_cache'])
+                latencias.append(time.perf_counter() - inicio)
+            consultas.append(len(capturadas))
+            status = response.status_code
+        medicao = carga.estatisticas(latencias, sum(latencias))
+        medicao.update(status=status, consultas=int(statistics.median(consultas)))
+        return medicao
+
+    def medir_concorrente(self, client_logado, url, options):
+        def chamada():
+            # Um Client por chamada (o Client não é thread-safe), reaproveitando
+            # a sessão já criada para não gravar no banco durante a medição.
+            client = Client()
+            client.cookies = client_logado.cookies
+            return self.requisitar(client, url, options['sem_cache']).status_code < 400
+
+        total = max(options['repeticoes'], options['concorrencia'] * 5)
+        return carga.disparar(chamada, total, options['concorrencia'])
+
+    def commit_atual(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def comparar(self, caminho, atual):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f"Não foi possível ler {caminho}: {erro}")
+
+        self.stdout.write(f"\nComparação com {anterior.get('commit') or caminho}:")
+        for papel, rotas in atual['rotas'].items():
+            for url, medicao in rotas.items():
+                antes = anterior.get('rotas', {}).get(papel, {}).get(url)
+                if not antes:
+                    continue
+                delta_p95 = (medicao['p95_ms'] or 0) - (antes['p95_ms'] or 0)
+                delta_consultas = medicao['consultas'] - antes['consultas']
+                estilo = self.style.ERROR if delta_consultas > 0 or delta_p95 > 0.2 * (antes['p95_ms'] or 0) else self.style.SUCCESS
+                self.stdout.write(estilo(
+                    f"{papel:<12} {url:<55} p95 {delta_p95:+.2f} ms  consultas {delta_consultas:+d}"
+                ))
@@ -0,0 +1,82 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from core import carga
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo do login até os dados da primeira tela: fluxo antigo "
+        "(POST /api-token-auth/ + GET /api/users/me/) contra POST /api/login/, e a "
+        "renovação do token (POST /api/login/renovar/), que dispensa o hash da senha. "
+        "Por padrão usa o colaborador criado por gerar_dados_sinteticos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', default='sint-colaborador-0')
+        parser.add_argument('--senha', default='sintetico')
+        parser.add_argument('--repeticoes', type=int, default=10)
+        parser.add_argument('--rtt', type=float, default=0,
+                            help='Ida e volta de rede simulada por requisição, em ms (ex.: 150 para 4G).')
+        parser.add_argument('--saida', help='Grava o resultado neste arquivo JSON.')
+
+    def handle(self, *args, **options):
+        credenciais = {'username': options['usuario'], 'password': options['senha']}
+        self.rtt = options['rtt'] / 1000
+        fluxos = {
+            'token + users/me': self.fluxo_antigo,
+            'login': self.fluxo_login,
+            'renovar': self.fluxo_renovar,
+        }
+
+        resultado = {}
+        # O Client usa o host "testserver".
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client = Client()
+            response = client.post('/api/login/', credenciais, content_type='application/json')
+            if response.status_code != 200:
+                raise CommandError(f"Não foi possível entrar como {options['usuario']}.")
+            self.token = response.json()['token']
+
+            for nome, fluxo in fluxos.items():
+                latencias = []
+                for _ in range(options['repeticoes']):
+                    inicio = time.perf_counter()
+                    fluxo(client, credenciais)
+                    latencias.append(time.perf_counter() - inicio)
+                resultado[nome] = carga.estatisticas(latencias, sum(latencias))
+                self.stdout.write(
+                    f"{nome:<18} p50 {resultado[nome]['p50_ms']} ms  p95 {resultado[nome]['p95_ms']} ms"
+                )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}."))
+
+    def fluxo_antigo(self, client, credenciais):
+        token = self.post(client, '/api-token-auth/', credenciais)['token']
+        time.sleep(self.rtt)
+        response = client.get('/api/users/me/', HTTP_AUTHORIZATION=f'Token {token}')
+        self.conferir(response, '/api/users/me/')
+
+    def fluxo_login(self, client, credenciais):
+        self.post(client, '/api/login/', credenciais)
+
+    def fluxo_renovar(self, client, credenciais):
+        self.token = self.post(client, '/api/login/renovar/', {}, HTTP_AUTHORIZATION=f'Token {self.token}')['token']
+
+    def post(self, client, url, dados, **extra):
+        time.sleep(self.rtt)
+        response = client.post(url, dados, content_type='application/json', **extra)
+        self.conferir(response, url)
+        return response.json()
+
+    def conferir(self, response, url):
+        if response.status_code != 200:
+            raise CommandError(f"{url} respondeu {response.status_code}: {response.content[:200]!r}")
@@ -0,0 +1,101 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from core import carga
+from core.models import Adiantamento, Despesa
+from core.prefetch import adiantamentos_detalhados, adiantamentos_enxutos, despesas_detalhadas, despesas_enxutas
+from core.renderers import ORJSONRenderer
+from core.serializers import (
+    AdiantamentoListaSerializer, AdiantamentoSerializer, DespesaListaSerializer, DespesaSerializer
+)
+
+# (rótulo, plano de carregamento, serializer, renderer) por listagem.
+VARIANTES = {
+    'despesas': (Despesa, [
+        ('completo + json', despesas_detalhadas, DespesaSerializer, JSONRenderer),
+        ('enxuto + json', despesas_enxutas, DespesaListaSerializer, JSONRenderer),
+        ('enxuto + orjson', despesas_enxutas, DespesaListaSerializer, ORJSONRenderer),
+    ]),
+    'adiantamentos': (Adiantamento, [
+        ('completo + json', adiantamentos_detalhados, AdiantamentoSerializer, JSONRenderer),
+        ('enxuto + json', adiantamentos_enxutos, AdiantamentoListaSerializer, JSONRenderer),
+        ('enxuto + orjson', adiantamentos_enxutos, AdiantamentoListaSerializer, ORJSONRenderer),
+    ]),
+}
+
+
+def _mediana(segundos):
+    return carga.estatisticas(segundos, sum(segundos))['p50_ms']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o custo de montar uma listagem grande (consulta, serializer e render) "
+        "com o serializer completo e o JSONRenderer do DRF, com o serializer enxuto e com "
+        "o renderer orjson. Use com um banco populado por gerar_dados_sinteticos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=10000, help='Linhas por listagem.')
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--listagem', action='append', dest='listagens', choices=list(VARIANTES),
+                            help='Listagens medidas (repetível).')
+        parser.add_argument('--saida', help='Grava o resultado neste arquivo JSON.')
+
+    def handle(self, *args, **options):
+        resultado = {}
+        for listagem in options['listagens'] or VARIANTES:
+            modelo, variantes = VARIANTES[listagem]
+            ids = list(modelo.objects.order_by('id').values_list('id', flat=True)[:options['linhas']])
+            if len(ids) < options['linhas']:
+                raise CommandError(
+                    f"Só há {len(ids)} {listagem} no banco; rode gerar_dados_sinteticos ou use --linhas menor."
+                )
+            base = modelo.objects.filter(id__lte=ids[-1]).order_by('id')
+
+            self.stdout.write(f"\n{listagem} ({len(ids)} linhas, {options['repeticoes']} repetições):")
+            referencia = None
+            for rotulo, plano, serializer, renderer in variantes:
+                medicao = self.medir(base, plano, serializer, renderer, options['repeticoes'])
+                referencia = referencia or medicao['total_ms']
+                medicao['ganho'] = round(referencia / medicao['total_ms'], 2)
+                resultado.setdefault(listagem, {})[rotulo] = medicao
+                self.stdout.write(
+                    f"  {rotulo:<18} total {medicao['total_ms']:>8} ms  (consulta {medicao['consulta_ms']}, "
+                    f"serializer {medicao['serializer_ms']}, render {medicao['render_ms']})  "
+                    f"{medicao['linhas_por_segundo']:>9} linhas/s  {medicao['bytes']} bytes  x{medicao['ganho']}"
+                )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}."))
+
+    def medir(self, base, plano, serializer, renderer, repeticoes):
+        consultas, serializacoes, renders, totais = [], [], [], []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            linhas = list(plano(base.all()))
+            consultado = time.perf_counter()
+            data = serializer(linhas, many=True).data
+            serializado = time.perf_counter()
+            conteudo = renderer().render(data)
+            fim = time.perf_counter()
+
+            consultas.append(consultado - inicio)
+            serializacoes.append(serializado - consultado)
+            renders.append(fim - serializado)
+            totais.append(fim - inicio)
+
+        total_ms = _mediana(totais)
+        return {
+            'total_ms': total_ms,
+            'consulta_ms': _mediana(consultas),
+            'serializer_ms': _mediana(serializacoes),
+            'render_ms': _mediana(renders),
+            'linhas_por_segundo': round(len(linhas) / (total_ms / 1000)),
+            'bytes': len(conteudo),
+        }
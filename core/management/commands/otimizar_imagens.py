@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core import imagens
+
+
+class Command(BaseCommand):
+    help = "Gera os derivados (otimizado/miniatura) das imagens que ainda não os têm."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Threads usadas para processar as imagens.')
+
+    def handle(self, *args, **options):
+        pendentes = []
+        for model, (origem, _, _) in imagens.CAMPOS.items():
+            queryset = model.objects.exclude(**{origem: ''}).exclude(**{f'{origem}__isnull': True})
+            for instance in queryset.iterator(chunk_size=500):
+                if imagens.precisa_processar(instance):
+                    pendentes.append((model, instance.pk))
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            list(executor.map(lambda item: imagens.processar_em_thread(*item), pendentes))
+
+        self.stdout.write(self.style.SUCCESS(f"{len(pendentes)} imagem(ns) processada(s)."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import fila
+from core.models import FilaAprovacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula a FilaAprovacao a partir das despesas pendentes e da hierarquia "
+        "atual (use após cargas que não passam pelos sinais)."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            antes = FilaAprovacao.objects.count()
+            fila.reconciliar()
+            depois = FilaAprovacao.objects.count()
+        self.stdout.write(self.style.SUCCESS(f"Fila de aprovação reconstruída: {antes} -> {depois} item(ns)."))
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core import respostas
+from core.models import Adiantamento, Despesa, SaldoUsuario
+
+
+class Command(BaseCommand):
+    help = "Recalcula a tabela SaldoUsuario a partir de Adiantamento e Despesa e corrige divergências."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Apenas relata as divergências, sem alterar o banco.',
+        )
+
+    def calcular_totais(self):
+        zero = Decimal('0.00')
+        totais = defaultdict(lambda: {'total_adiantamentos': zero, 'total_despesas': zero})
+
+        for model in (Adiantamento, Despesa):
+            campo = model.campo_saldo
+            linhas = model.objects.values('usuario_id', 'viagem_id').annotate(soma=Sum('valor')).order_by()
+            for linha in linhas:
+                totais[(linha['usuario_id'], linha['viagem_id'])][campo] += linha['soma']
+                totais[(linha['usuario_id'], None)][campo] += linha['soma']
+        return totais
+
+    def handle(self, *args, **options):
+        verificar = options['verificar']
+
+        with transaction.atomic():
+            esperados = self.calcular_totais()
+            existentes = {
+                (saldo.usuario_id, saldo.viagem_id): saldo
+                for saldo in SaldoUsuario.objects.select_for_update()
+            }
+
+            agora = timezone.now()
+            criar, atualizar, divergentes = [], [], 0
+            for chave, totais in esperados.items():
+                saldo = existentes.pop(chave, None)
+                if saldo is None:
+                    divergentes += 1
+                    criar.append(SaldoUsuario(usuario_id=chave[0], viagem_id=chave[1], **totais))
+                elif (saldo.total_adiantamentos, saldo.total_despesas) != (totais['total_adiantamentos'], totais['total_despesas']):
+                    divergentes += 1
+                    saldo.total_adiantamentos = totais['total_adiantamentos']
+                    saldo.total_despesas = totais['total_despesas']
+                    saldo.atualizado_em = agora
+                    atualizar.append(saldo)
+
+            # Linhas com valores mas sem nenhum lançamento correspondente.
+            orfaos = [
+                saldo.pk for saldo in existentes.values()
+                if saldo.total_adiantamentos or saldo.total_despesas
+            ]
+            divergentes += len(orfaos)
+
+            if verificar:
+                estilo = self.style.WARNING if divergentes else self.style.SUCCESS
+                self.stdout.write(estilo(f"{divergentes} saldo(s) divergente(s) encontrados."))
+                return
+
+            SaldoUsuario.objects.bulk_create(criar, batch_size=500)
+            SaldoUsuario.objects.bulk_update(atualizar, ['total_adiantamentos', 'total_despesas', 'atualizado_em'], batch_size=500)
+            SaldoUsuario.objects.filter(pk__in=orfaos).delete()
+            transaction.on_commit(lambda: respostas.invalidar(SaldoUsuario))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Saldos reconstruídos: {len(criar)} criado(s), {len(atualizar)} corrigido(s), {len(orfaos)} removido(s)."
+        ))
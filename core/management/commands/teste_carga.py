@@ -0,0 +1,51 @@
+import json
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand
+
+from core import carga
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispara requisições concorrentes contra um servidor em execução e mostra "
+        "vazão e latências (p50/p95/p99). Para comparar WSGI e ASGI, rode o mesmo "
+        "teste contra os dois modos de deploy descritos em backend_prestacao/asgi.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url_base', help='Ex.: http://127.0.0.1:8000')
+        parser.add_argument('--rota', action='append', dest='rotas', help='Rota a testar (repetível). Padrão: /api/users/me/')
+        parser.add_argument('--token', help='Token de autenticação (cabeçalho "Authorization: Token ...").')
+        parser.add_argument('--requisicoes', type=int, default=500, help='Total de requisições por rota.')
+        parser.add_argument('--concorrencia', type=int, default=50, help='Requisições simultâneas.')
+        parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON.')
+
+    def handle(self, *args, **options):
+        cabecalhos = {'Authorization': f"Token {options['token']}"} if options['token'] else {}
+        resultados = {}
+
+        for rota in options['rotas'] or ['/api/users/me/']:
+            url = options['url_base'].rstrip('/') + rota
+
+            def chamada():
+                requisicao = urllib.request.Request(url, headers=cabecalhos)
+                try:
+                    with urllib.request.urlopen(requisicao, timeout=60) as resposta:
+                        resposta.read()
+                        return resposta.status < 400
+                except urllib.error.HTTPError:
+                    return False
+
+            resultados[rota] = carga.disparar(chamada, options['requisicoes'], options['concorrencia'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+        for rota, estatisticas in resultados.items():
+            self.stdout.write(
+                f"{rota}: {estatisticas['por_segundo']} req/s, "
+                f"p50 {estatisticas['p50_ms']} ms, p95 {estatisticas['p95_ms']} ms, "
+                f"p99 {estatisticas['p99_ms']} ms, {estatisticas['erros']} erro(s)"
+            )
@@ -0,0 +1,285 @@
+"""
+Métricas por requisição (MetricasMiddleware) e endpoint /metrics no formato do
+Prometheus.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=()):
+    pares = [*zip(nomes, valores), *extra]
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._trava = threading.Lock()
+        REGISTRO.append(self)
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        with self._trava:
+            itens = sorted(self._valores.items())
+            for chave, valor in itens:
+                linhas += self._linhas(chave, valor)
+        return linhas
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, *rotulos, valor=1):
+        with self._trava:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def _linhas(self, chave, valor):
+        return [f'{self.nome}_total{_rotulos(self.rotulos, chave)} {_numero(valor)}']
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, *rotulos):
+        with self._trava:
+            contagens, soma, total = self._valores.get(rotulos) or ([0] * len(self.buckets), 0, 0)
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            self._valores[rotulos] = (contagens, soma + valor, total + 1)
+
+    def _linhas(self, chave, valor):
+        contagens, soma, total = valor
+        linhas = [
+            f'{self.nome}_bucket{_rotulos(self.rotulos, chave, [("le", _numero(limite))])} {contagem}'
+            for limite, contagem in zip(self.buckets, contagens)
+        ]
+        linhas.append(f'{self.nome}_bucket{_rotulos(self.rotulos, chave, [("le", "+Inf")])} {total}')
+        linhas.append(f'{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}')
+        linhas.append(f'{self.nome}_count{_rotulos(self.rotulos, chave)} {total}')
+        return linhas
+
+
+REGISTRO = []
+
+REQUISICOES = Contador(
+    'prestacao_requisicoes', 'Requisições atendidas.', ('view', 'metodo', 'status'))
+DURACAO = Histograma(
+    'prestacao_requisicao_duracao_segundos', 'Duração total da requisição.', ('view', 'metodo'))
+CONSULTAS = Histograma(
+    'prestacao_requisicao_consultas', 'Consultas SQL por requisição.', ('view', 'metodo'), BUCKETS_CONSULTAS)
+TEMPO_BANCO = Histograma(
+    'prestacao_requisicao_banco_segundos', 'Tempo gasto em consultas SQL por requisição.', ('view', 'metodo'))
+SERIALIZACAO = Histograma(
+    'prestacao_requisicao_serializacao_segundos', 'Tempo em to_representation dos serializers por requisição.',
+    ('view', 'metodo'))
+RENDERIZACAO = Histograma(
+    'prestacao_requisicao_renderizacao_segundos', 'Tempo de renderização do corpo da resposta (DRF).', ('view', 'metodo'))
+TAMANHO = Histograma(
+    'prestacao_resposta_bytes', 'Tamanho do corpo da resposta (exceto streaming).', ('view', 'metodo'), BUCKETS_BYTES)
+CONSULTAS_EXCESSIVAS = Contador(
+    'prestacao_consultas_excessivas', 'Requisições acima de METRICAS_LIMITE_CONSULTAS.', ('view',))
+
+
+def impressao_digital(sql):
+    """Normaliza o SQL para agrupar consultas que só diferem nos valores."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?+)', sql)
+    return ' '.join(sql.split())
+
+
+def exportar():
+    linhas = []
+    for metrica in REGISTRO:
+        linhas += metrica.exportar()
+    return '\n'.join(linhas) + '\n'
+
+
+class _Consultas:
+    # Conta, cronometra e guarda as impressões digitais das consultas de uma requisição.
+    def __init__(self):
+        self.total = 0
+        self.tempo = 0.0
+        self.impressoes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo += time.perf_counter() - inicio
+            self.total += 1
+            self.impressoes[impressao_digital(sql)] += 1
+
+
+# Requisição em andamento. Um ContextVar acompanha a requisição até as threads
+# em que o ORM roda nas views assíncronas (sync_to_async copia o contexto).
+_consultas = ContextVar('metricas_consultas', default=None)
+
+
+def _registrar_consulta(execute, sql, params, many, context):
+    consultas = _consultas.get()
+    if consultas is None:
+        return execute(sql, params, many, context)
+    return consultas(execute, sql, params, many, context)
+
+
+class _Serializacao:
+    def __init__(self):
+        self.tempo = 0.0
+        self.medidas = 0
+        self.ativa = False
+
+
+_serializacao = ContextVar('metricas_serializacao', default=None)
+
+
+class SerializacaoMedida:
+    """
+    Mixin de serializer: soma o tempo de to_representation ao da requisição.
+    Com many=True cada item é medido; serializers aninhados entram no tempo
+    do que os contém.
+    """
+
+    def to_representation(self, instance):
+        medicao = _serializacao.get()
+        if medicao is None or medicao.ativa:
+            return super().to_representation(instance)
+        medicao.ativa = True
+        inicio = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            medicao.tempo += time.perf_counter() - inicio
+            medicao.medidas += 1
+            medicao.ativa = False
+
+
+def _instrumentar_conexao():
+    # Fica instalado na conexão da thread; fora de uma requisição só repassa.
+    if _registrar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_registrar_consulta)
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _instrumentar_conexao()
+        consultas, serializacao = _Consultas(), _Serializacao()
+        marcadores = _consultas.set(consultas), _serializacao.set(serializacao)
+        request._metricas_renderizacao = None
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _consultas.reset(marcadores[0])
+            _serializacao.reset(marcadores[1])
+        self.registrar(request, response, time.perf_counter() - inicio, consultas, serializacao)
+        return response
+
+    async def __acall__(self, request):
+        # O ORM das views assíncronas roda na thread de sync_to_async(thread_sensitive=True).
+        await sync_to_async(_instrumentar_conexao)()
+        consultas, serializacao = _Consultas(), _Serializacao()
+        marcadores = _consultas.set(consultas), _serializacao.set(serializacao)
+        request._metricas_renderizacao = None
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _consultas.reset(marcadores[0])
+            _serializacao.reset(marcadores[1])
+        self.registrar(request, response, time.perf_counter() - inicio, consultas, serializacao)
+        return response
+
+    def registrar(self, request, response, duracao, consultas, serializacao):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'sem_rota'
+        metodo = request.method
+
+        REQUISICOES.incrementar(view, metodo, str(response.status_code))
+        DURACAO.observar(duracao, view, metodo)
+        CONSULTAS.observar(consultas.total, view, metodo)
+        TEMPO_BANCO.observar(consultas.tempo, view, metodo)
+        if serializacao.medidas:
+            SERIALIZACAO.observar(serializacao.tempo, view, metodo)
+        if request._metricas_renderizacao is not None:
+            RENDERIZACAO.observar(request._metricas_renderizacao, view, metodo)
+        if not response.streaming:
+            TAMANHO.observar(len(response.content), view, metodo)
+
+        if consultas.total > settings.METRICAS_LIMITE_CONSULTAS:
+            CONSULTAS_EXCESSIVAS.incrementar(view)
+            sql, repeticoes = consultas.impressoes.most_common(1)[0]
+            logger.warning(
+                "%s %s: %d consultas (%.1f ms no banco); mais repetida (%dx): %s",
+                metodo, request.path, consultas.total, consultas.tempo * 1000, repeticoes, sql,
+            )
+
+    def process_template_response(self, request, response):
+        # As respostas do DRF são renderizadas (codificação do JSON) depois deste hook.
+        inicio = time.perf_counter()
+
+        def registrar(response):
+            request._metricas_renderizacao = time.perf_counter() - inicio
+
+        response.add_post_render_callback(registrar)
+        return response
+
+
+def metricas(request):
+    # Sem METRICAS_TOKEN, só a equipe logada (sessão do admin) lê as métricas.
+    token = settings.METRICAS_TOKEN
+    if token:
+        autorizado = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        autorizado = request.user.is_authenticated and request.user.is_staff
+    if not autorizado:
+        return HttpResponseForbidden()
+    return HttpResponse(exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:53
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def popular_saldos(apps, schema_editor):
+    Adiantamento = apps.get_model('core', 'Adiantamento')
+    Despesa = apps.get_model('core', 'Despesa')
+    SaldoUsuario = apps.get_model('core', 'SaldoUsuario')
+
+    totais = {}
+    for model, campo in ((Adiantamento, 'total_adiantamentos'), (Despesa, 'total_despesas')):
+        for linha in model.objects.values('usuario_id', 'viagem_id').annotate(soma=Sum('valor')).order_by():
+            for chave in ((linha['usuario_id'], linha['viagem_id']), (linha['usuario_id'], None)):
+                saldo = totais.setdefault(chave, {'total_adiantamentos': Decimal('0.00'), 'total_despesas': Decimal('0.00')})
+                saldo[campo] += linha['soma']
+
+    SaldoUsuario.objects.bulk_create(
+        [SaldoUsuario(usuario_id=usuario_id, viagem_id=viagem_id, **valores) for (usuario_id, viagem_id), valores in totais.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_adiantamentos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_despesas', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to=settings.AUTH_USER_MODEL)),
+                ('viagem', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='core.viagem')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='saldousuario',
+            constraint=models.UniqueConstraint(fields=('usuario', 'viagem'), name='saldo_usuario_viagem_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='saldousuario',
+            constraint=models.UniqueConstraint(condition=models.Q(('viagem__isnull', True)), fields=('usuario',), name='saldo_usuario_geral_unico'),
+        ),
+        migrations.RunPython(popular_saldos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_saldousuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adiantamento',
+            index=models.Index(fields=['data_adiantamento', 'id'], name='adiant_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adiantamento',
+            index=models.Index(fields=['usuario', 'data_adiantamento'], name='adiant_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adiantamento',
+            index=models.Index(fields=['viagem', 'data_adiantamento'], name='adiant_viagem_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['viagem', 'usuario'], name='despesa_viagem_usuario_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['viagem', 'data_despesa', 'id'], name='despesa_viagem_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['usuario', 'data_despesa', 'id'], name='despesa_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(condition=models.Q(('status', 'PENDENTE')), fields=['usuario', 'data_despesa', 'id'], name='despesa_pendente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viagem',
+            index=models.Index(fields=['data_inicio', 'data_fim'], name='viagem_periodo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viagem',
+            index=models.Index(fields=['data_fim'], name='viagem_data_fim_idx'),
+        ),
+    ]
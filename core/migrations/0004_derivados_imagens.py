@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despesa',
+            name='comprovante_miniatura',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='derivados/'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='comprovante_otimizado',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='derivados/'),
+        ),
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='foto_perfil_miniatura',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='derivados/'),
+        ),
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='foto_perfil_otimizada',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='derivados/'),
+        ),
+    ]
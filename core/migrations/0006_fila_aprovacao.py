@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def popular_fila(apps, schema_editor):
+    # Mesma regra de core.fila.aprovadores_por_usuario.
+    Despesa = apps.get_model('core', 'Despesa')
+    FilaAprovacao = apps.get_model('core', 'FilaAprovacao')
+    PerfilUsuario = apps.get_model('core', 'PerfilUsuario')
+
+    diretores = set(PerfilUsuario.objects.filter(tipo='DIRETOR').values_list('user_id', flat=True))
+    gestores = set(PerfilUsuario.objects.filter(tipo='GESTOR').values_list('user_id', flat=True))
+    gestores_de = {}
+    for usuario_id, gestor_id in PerfilUsuario.objects.filter(
+        tipo='COLABORADOR', departamentos__gestor__perfil__tipo='GESTOR'
+    ).values_list('user_id', 'departamentos__gestor_id'):
+        gestores_de.setdefault(usuario_id, set()).add(gestor_id)
+
+    linhas = []
+    for despesa_id, usuario_id in Despesa.objects.filter(status='PENDENTE').values_list('id', 'usuario_id'):
+        aprovadores = diretores - {usuario_id} if usuario_id in gestores else gestores_de.get(usuario_id, ())
+        linhas += [FilaAprovacao(aprovador_id=aprovador_id, despesa_id=despesa_id) for aprovador_id in aprovadores]
+    FilaAprovacao.objects.bulk_create(linhas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_atualizado_em'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilaAprovacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lida', models.BooleanField(default=False)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('aprovador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fila_aprovacao', to=settings.AUTH_USER_MODEL)),
+                ('despesa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fila_aprovacao', to='core.despesa')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['aprovador', 'lida'], name='fila_aprovador_lida_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filaaprovacao',
+            constraint=models.UniqueConstraint(fields=('aprovador', 'despesa'), name='fila_aprovador_despesa_unico'),
+        ),
+        migrations.RunPython(popular_fila, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_fila_aprovacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despesa',
+            name='comprovante_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['comprovante_hash'], name='despesa_comprovante_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 12:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_comprovante_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despesa',
+            name='id_cliente',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='despesa',
+            constraint=models.UniqueConstraint(fields=('usuario', 'id_cliente'), name='despesa_usuario_id_cliente_unico'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_despesa_id_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viagem',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q, Case, When, Value, CharField
 from django.contrib.auth.models import User
+from django.utils import timezone
+from decimal import Decimal
 
 class Departamento(models.Model):
     nome = models.CharField(max_length=100)
@@ -18,10 +21,58 @@ class PerfilUsuario(models.Model):
     tipo = models.CharField(max_length=20, choices=TIPOS_USUARIO, default='COLABORADOR')
     departamentos = models.ManyToManyField(Departamento, blank=True, related_name="perfis") 
     foto_perfil = models.ImageField(upload_to='fotos_perfil/', null=True, blank=True)
+    # Derivados gerados em segundo plano por core.imagens (sem EXIF, redimensionados).
+    foto_perfil_otimizada = models.ImageField(upload_to='derivados/', null=True, blank=True, editable=False)
+    foto_perfil_miniatura = models.ImageField(upload_to='derivados/', null=True, blank=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Nome gravado, para core.imagens saber se a foto foi trocada.
+        instance._foto_perfil_original = instance.__dict__.get('foto_perfil') or None
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._foto_perfil_original = self.foto_perfil.name or None
 
     def __str__(self):
         return f"{self.user.username} - {self.tipo}"
 
+class ViagemQuerySet(models.QuerySet):
+    """
+    status_dinamico (Preparando/Ativa/Finalizada/Cancelada) calculado no banco
+    a partir das datas da viagem, para que a listagem possa filtrar e ordenar por ele.
+    """
+    STATUS_DINAMICO = ('Preparando', 'Ativa', 'Finalizada', 'Cancelada')
+
+    @staticmethod
+    def condicoes_status_dinamico(hoje):
+        # Na mesma ordem de precedência do Case: cancelada vale mais que as datas.
+        cancelada = Q(status='CANCELADA')
+        return {
+            'Cancelada': cancelada,
+            'Preparando': ~cancelada & Q(data_inicio__gt=hoje),
+            'Ativa': ~cancelada & Q(data_inicio__lte=hoje, data_fim__gte=hoje),
+            'Finalizada': ~cancelada & Q(data_fim__lt=hoje),
+        }
+
+    def com_status_dinamico(self, hoje=None):
+        hoje = hoje or timezone.now().date()
+        condicoes = self.condicoes_status_dinamico(hoje)
+        return self.annotate(status_dinamico=Case(
+            *(When(condicoes[valor], then=Value(valor)) for valor in ('Cancelada', 'Preparando', 'Ativa')),
+            default=Value('Finalizada'),
+            output_field=CharField(),
+        ))
+
+    def filtrar_status_dinamico(self, valor, hoje=None):
+        # Filtra pelas faixas de data (não pela anotação) para usar viagem_periodo_idx/viagem_data_fim_idx.
+        if valor not in self.STATUS_DINAMICO:
+            raise ValueError(f"status_dinamico inválido: {valor}")
+        return self.filter(self.condicoes_status_dinamico(hoje or timezone.now().date())[valor])
+
+
 class Viagem(models.Model):
     STATUS_VIAGEM = (
         ('ATIVA', 'Ativa'),
@@ -33,11 +84,74 @@ class Viagem(models.Model):
     data_fim = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_VIAGEM, default='ATIVA')
     participantes = models.ManyToManyField(User, related_name='viagens')
+    # Também avançado quando os participantes mudam (core.signals).
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = ViagemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data_inicio', 'data_fim'], name='viagem_periodo_idx'),
+            models.Index(fields=['data_fim'], name='viagem_data_fim_idx'),
+        ]
 
     def __str__(self):
         return f"{self.titulo} ({self.status})"
 
-class Adiantamento(models.Model):
+    def calcular_status_dinamico(self, hoje=None):
+        # Equivalente em Python de ViagemQuerySet.com_status_dinamico, para instâncias sem a anotação.
+        hoje = hoje or timezone.now().date()
+        if self.status == 'CANCELADA':
+            return 'Cancelada'
+        if hoje < self.data_inicio:
+            return 'Preparando'
+        if hoje <= self.data_fim:
+            return 'Ativa'
+        return 'Finalizada'
+
+class MovimentoSaldo(models.Model):
+    """
+    Base dos lançamentos que movimentam o SaldoUsuario (adiantamentos e despesas).
+    O saldo materializado é ajustado na mesma transação do save(); a exclusão é
+    tratada pelo sinal post_delete (ver core/signals.py), que também cobre cascatas.
+    """
+    campo_saldo = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saldo_original = instance.chave_saldo()
+        return instance
+
+    def chave_saldo(self):
+        return (
+            self.__dict__.get('usuario_id'),
+            self.__dict__.get('viagem_id'),
+            self.__dict__.get('valor'),
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'usuario', 'viagem', 'valor'} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            anterior = getattr(self, '_saldo_original', None)
+            atual = self.chave_saldo()
+            if anterior != atual:
+                if anterior:
+                    SaldoUsuario.objects.movimentar(self.campo_saldo, anterior[0], anterior[1], -Decimal(str(anterior[2])))
+                SaldoUsuario.objects.movimentar(self.campo_saldo, atual[0], atual[1], Decimal(str(atual[2])))
+            self._saldo_original = atual
+
+
+class Adiantamento(MovimentoSaldo):
+    campo_saldo = 'total_adiantamentos'
+
     viagem = models.ForeignKey(Viagem, on_delete=models.CASCADE, related_name='adiantamentos')
     
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='adiantamentos_recebidos')
@@ -45,6 +159,16 @@ class Adiantamento(models.Model):
     data_adiantamento = models.DateField(auto_now_add=True)
     observacoes = models.TextField(blank=True, null=True)
     comprovante_deposito = models.FileField(upload_to='comprovantes_adiantamentos/%Y/%m/', blank=True, null=True)
+    # Usado pelo painel da viagem para enviar só o que mudou (inclusive em update()).
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data_adiantamento', 'id'], name='adiant_data_idx'),
+            models.Index(fields=['usuario', 'data_adiantamento'], name='adiant_usuario_data_idx'),
+            models.Index(fields=['viagem', 'data_adiantamento'], name='adiant_viagem_data_idx'),
+            models.Index(fields=['viagem', 'atualizado_em'], name='adiant_viagem_atualizado_idx'),
+        ]
 
     def __str__(self):
         if self.viagem:
@@ -52,7 +176,9 @@ class Adiantamento(models.Model):
         return f"R$ {self.valor} para {self.usuario.username}"
 
 
-class Despesa(models.Model):
+class Despesa(MovimentoSaldo):
+    campo_saldo = 'total_despesas'
+
     STATUS_DESPESA = (
         ('PENDENTE', 'Pendente'),
         ('APROVADO', 'Aprovado'),
@@ -75,11 +201,127 @@ class Despesa(models.Model):
     # Removido 'blank=True, null=True' para tornar o comprovante obrigatório
     comprovante = models.FileField(upload_to='comprovantes/%Y/%m/')
     # --- FIM DA MUDANÇA ---
+    # Derivados gerados em segundo plano por core.imagens quando o comprovante é uma foto.
+    comprovante_otimizado = models.FileField(upload_to='derivados/', null=True, blank=True, editable=False)
+    comprovante_miniatura = models.FileField(upload_to='derivados/', null=True, blank=True, editable=False)
+    # SHA-256 do conteúdo do comprovante, preenchido por core.comprovantes no envio.
+    comprovante_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # id_cliente do item em POST /despesas/lote/ (core.envio_lote): o reenvio não cria outra despesa.
+    id_cliente = models.CharField(max_length=100, null=True, blank=True, editable=False)
     
     status = models.CharField(max_length=20, choices=STATUS_DESPESA, default='PENDENTE')
     aprovador = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='despesas_aprovadas')
     data_aprovacao = models.DateTimeField(null=True, blank=True)
     observacao_rejeicao = models.TextField(blank=True, null=True)
+    # Usado pelo painel da viagem para enviar só o que mudou (inclusive em update()).
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'id_cliente'], name='despesa_usuario_id_cliente_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['viagem', 'usuario'], name='despesa_viagem_usuario_idx'),
+            models.Index(fields=['viagem', 'data_despesa', 'id'], name='despesa_viagem_data_idx'),
+            models.Index(fields=['viagem', 'atualizado_em'], name='despesa_viagem_atualizado_idx'),
+            models.Index(fields=['usuario', 'data_despesa', 'id'], name='despesa_usuario_data_idx'),
+            # Fila de aprovação: só as pendentes, na ordem da paginação.
+            models.Index(
+                fields=['usuario', 'data_despesa', 'id'],
+                condition=models.Q(status='PENDENTE'),
+                name='despesa_pendente_idx',
+            ),
+            # Comprovante já enviado (reaproveitamento e aviso de duplicata).
+            models.Index(fields=['comprovante_hash'], name='despesa_comprovante_hash_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Nome gravado, para core.comprovantes saber se o comprovante foi trocado.
+        instance._comprovante_original = instance.__dict__.get('comprovante')
+        return instance
+
+    def __str__(self):
+        return f"R$ {self.valor} - {self.descricao} ({self.status})"
+
+
+class FilaAprovacao(models.Model):
+    """
+    Caixa de entrada dos aprovadores: uma linha por (aprovador, despesa pendente).
+    Mantida por core.fila a partir dos sinais de Despesa e da hierarquia e
+    explicitamente nos update()/bulk_create() que não disparam sinais.
+    """
+    aprovador = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fila_aprovacao')
+    despesa = models.ForeignKey(Despesa, on_delete=models.CASCADE, related_name='fila_aprovacao')
+    lida = models.BooleanField(default=False)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['aprovador', 'despesa'], name='fila_aprovador_despesa_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['aprovador', 'lida'], name='fila_aprovador_lida_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.aprovador_id} -> despesa {self.despesa_id}"
+
+
+class SaldoUsuarioManager(models.Manager):
+    def movimentar(self, campo, usuario_id, viagem_id, valor, criar=True):
+        # Atualiza a linha da viagem e a linha geral do usuário (viagem nula).
+        for chave_viagem in (viagem_id, None):
+            filtro = self.filter(usuario_id=usuario_id, viagem_id=chave_viagem)
+            atualizados = filtro.update(**{campo: F(campo) + valor, 'atualizado_em': timezone.now()})
+            if atualizados or not criar:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(usuario_id=usuario_id, viagem_id=chave_viagem, **{campo: valor})
+            except IntegrityError:
+                # Outra transação criou a linha ao mesmo tempo.
+                filtro.update(**{campo: F(campo) + valor, 'atualizado_em': timezone.now()})
+
+    def saldo_de(self, usuario, viagem=None):
+        totais = self.filter(usuario=usuario, viagem=viagem).values_list(
+            'total_adiantamentos', 'total_despesas'
+        ).first()
+        if not totais:
+            return Decimal('0.00')
+        return totais[0] - totais[1]
+
+
+class SaldoUsuario(models.Model):
+    """
+    Saldo materializado (adiantamentos - despesas) por usuário e viagem.
+    A linha com viagem nula guarda o total geral do usuário.
+    Reconstrução: python manage.py reconstruir_saldos
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saldos')
+    viagem = models.ForeignKey(Viagem, on_delete=models.CASCADE, null=True, blank=True, related_name='saldos')
+    total_adiantamentos = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_despesas = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = SaldoUsuarioManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'viagem'], name='saldo_usuario_viagem_unico'),
+            models.UniqueConstraint(
+                fields=['usuario'],
+                condition=models.Q(viagem__isnull=True),
+                name='saldo_usuario_geral_unico',
+            ),
+        ]
+
+    @property
+    def saldo(self):
+        return self.total_adiantamentos - self.total_despesas
 
     def __str__(self):
-        return f"R$ {self.valor} - {self.descricao} ({self.status})"
\ No newline at end of file
+        if self.viagem_id:
+            return f"{self.usuario.username} em {self.viagem.titulo}: R$ {self.saldo}"
+        return f"{self.usuario.username}: R$ {self.saldo}"
@@ -0,0 +1,181 @@
+"""
+Importação em lote de usuários, perfis e departamentos (comando
+importar_organizacao e POST /api/users/importar/).
+"""
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import fila, hierarchy, respostas
+from .models import Departamento, PerfilUsuario
+
+LOTE = 1000
+TIPOS = {tipo for tipo, _ in PerfilUsuario.TIPOS_USUARIO}
+
+
+class ImportacaoInvalida(Exception):
+    pass
+
+
+def ler(conteudo, formato):
+    """Registros de um CSV (com cabeçalho) ou de uma lista JSON."""
+    if isinstance(conteudo, bytes):
+        conteudo = conteudo.decode('utf-8-sig')
+    if formato == 'json':
+        try:
+            registros = json.loads(conteudo)
+        except ValueError as exc:
+            raise ImportacaoInvalida(f'JSON inválido: {exc}')
+        if not isinstance(registros, list):
+            raise ImportacaoInvalida('O JSON deve ser uma lista de usuários.')
+        return registros
+    if formato == 'csv':
+        registros = []
+        for linha in csv.DictReader(io.StringIO(conteudo)):
+            departamentos = linha.get('departamentos') or ''
+            linha['departamentos'] = [nome.strip() for nome in departamentos.split(';') if nome.strip()]
+            registros.append(linha)
+        return registros
+    raise ImportacaoInvalida('Formato deve ser csv ou json.')
+
+
+def validar(registros):
+    """
+    Normaliza os registros e separa os problemas: devolve (válidos, erros),
+    com erros como [{'linha', 'username', 'error'}]. Usernames já
+    cadastrados ficam de fora (a importação pode ser repetida).
+    """
+    validos, erros, vistos = [], [], set()
+    existentes = set(User.objects.filter(
+        username__in=[str(r.get('username') or '').strip() for r in registros if isinstance(r, dict)]
+    ).values_list('username', flat=True))
+
+    for numero, registro in enumerate(registros, start=1):
+        if not isinstance(registro, dict):
+            erros.append({'linha': numero, 'username': None, 'error': 'Registro deve ser um objeto.'})
+            continue
+        username = str(registro.get('username') or '').strip()
+        tipo = str(registro.get('tipo') or 'COLABORADOR').strip().upper()
+        departamentos = registro.get('departamentos') or []
+
+        if not username:
+            erro = 'username é obrigatório.'
+        elif len(username) > 150:
+            erro = 'username com mais de 150 caracteres.'
+        elif username in vistos:
+            erro = 'username repetido no arquivo.'
+        elif username in existentes:
+            erro = 'Usuário já existe.'
+        elif tipo not in TIPOS:
+            erro = f"tipo deve ser um de: {', '.join(sorted(TIPOS))}."
+        elif not isinstance(departamentos, list):
+            erro = 'departamentos deve ser uma lista de nomes.'
+        else:
+            erro = None
+
+        if erro:
+            erros.append({'linha': numero, 'username': username or None, 'error': erro})
+            continue
+        vistos.add(username)
+        validos.append({
+            'username': username,
+            'first_name': str(registro.get('first_name') or '').strip()[:150],
+            'last_name': str(registro.get('last_name') or '').strip()[:150],
+            'senha': registro.get('senha') or registro.get('password') or None,
+            'tipo': tipo,
+            'departamentos': [str(nome).strip()[:100] for nome in departamentos if str(nome).strip()],
+        })
+    return validos, erros
+
+
+def _iniciar_processo():
+    # Com "spawn" (macOS/Windows) o processo filho começa sem o Django configurado.
+    django.setup()
+
+
+def hash_senhas(senhas, processos=None):
+    """make_password para cada senha (None gera senha inutilizável), em paralelo."""
+    processos = processos or settings.ORGANIZACAO_PROCESSOS or os.cpu_count() or 1
+    if processos == 1 or len(senhas) < 2:
+        return [make_password(senha) for senha in senhas]
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo) as executor:
+        return list(executor.map(make_password, senhas, chunksize=max(1, len(senhas) // (processos * 4))))
+
+
+def importar(registros, processos=None, lote=LOTE):
+    validos, erros = validar(registros)
+    inicio = time.perf_counter()
+    hashes = hash_senhas([registro['senha'] for registro in validos], processos)
+    hash_s = time.perf_counter() - inicio
+
+    inicio_escrita = time.perf_counter()
+    nomes = {nome for registro in validos for nome in registro['departamentos']}
+    Vinculo = PerfilUsuario.departamentos.through
+    gestores = {}
+    # Uma transação só: uma importação interrompida não deixa usuários sem perfil
+    # nem departamentos sem gestor. `lote` limita só o tamanho de cada INSERT.
+    with transaction.atomic():
+        departamentos = {d.nome: d for d in Departamento.objects.filter(nome__in=nomes)}
+        novos = Departamento.objects.bulk_create(
+            [Departamento(nome=nome) for nome in sorted(nomes - set(departamentos))]
+        )
+        departamentos.update({d.nome: d for d in novos})
+
+        for i in range(0, len(validos), lote):
+            parte = validos[i:i + lote]
+            usuarios = User.objects.bulk_create([
+                User(
+                    username=registro['username'],
+                    email=registro['username'],
+                    first_name=registro['first_name'],
+                    last_name=registro['last_name'],
+                    password=senha,
+                )
+                for registro, senha in zip(parte, hashes[i:i + lote])
+            ])
+            perfis = PerfilUsuario.objects.bulk_create([
+                PerfilUsuario(user_id=usuario.pk, tipo=registro['tipo'])
+                for usuario, registro in zip(usuarios, parte)
+            ])
+            Vinculo.objects.bulk_create([
+                Vinculo(perfilusuario_id=perfil.pk, departamento_id=departamentos[nome].pk)
+                for perfil, registro in zip(perfis, parte)
+                for nome in dict.fromkeys(registro['departamentos'])
+            ])
+            for usuario, registro in zip(usuarios, parte):
+                if registro['tipo'] == 'GESTOR':
+                    for nome in registro['departamentos']:
+                        gestores[nome] = usuario.pk
+
+        if gestores:
+            alterados = [departamentos[nome] for nome in gestores]
+            for departamento in alterados:
+                departamento.gestor_id = gestores[departamento.nome]
+            Departamento.objects.bulk_update(alterados, ['gestor'], batch_size=lote)
+            # Os membros já existentes desses departamentos ganham outro aprovador.
+            fila.sincronizar_donos(
+                PerfilUsuario.objects.filter(departamentos__in=alterados).values_list('user_id', flat=True)
+            )
+
+        transaction.on_commit(hierarchy.invalidar)
+        transaction.on_commit(lambda: respostas.invalidar(User, PerfilUsuario, Departamento))
+    escrita_s = time.perf_counter() - inicio_escrita
+
+    total_s = hash_s + escrita_s
+    return {
+        'criados': len(validos),
+        'departamentos_criados': len(novos),
+        'erros': erros,
+        'hash_s': round(hash_s, 3),
+        'escrita_s': round(escrita_s, 3),
+        'usuarios_por_segundo': round(len(validos) / total_s, 1) if validos and total_s else None,
+    }
@@ -0,0 +1,42 @@
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+
+
+class CursorPadrao(CursorPagination):
+    """
+    Paginação por cursor (keyset) usada por todas as listagens do core.
+    O tamanho padrão vem de REST_FRAMEWORK['PAGE_SIZE'] e pode ser ajustado
+    pelo cliente com ?page_size=, até max_page_size.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class DepartamentoPagination(CursorPadrao):
+    ordering = ('nome', 'id')
+
+
+class ViagemPagination(CursorPadrao):
+    ordering = ('-data_inicio', '-id')
+
+
+class AdiantamentoPagination(CursorPadrao):
+    ordering = ('-data_adiantamento', '-id')
+
+
+class DespesaPagination(CursorPadrao):
+    ordering = ('data_despesa', 'id')
+
+
+class OrdenacaoCursor(OrderingFilter):
+    """
+    ?ordering= compatível com a paginação por cursor: a ordenação pedida pelo
+    cliente é completada com a ordenação padrão da view, que termina em 'id',
+    para que páginas com valores repetidos (ex.: status_dinamico) sejam estáveis.
+    """
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        usados = {campo.lstrip('-') for campo in ordering}
+        ordering += [campo for campo in view.ordering if campo.lstrip('-') not in usados]
+        return ordering
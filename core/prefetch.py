@@ -0,0 +1,110 @@
+"""
+Planos de carregamento das listagens: consultas em número fixo, qualquer que seja
+o número de linhas.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Case, CharField, DecimalField, F, IntegerField, OuterRef, Prefetch, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
+
+from .models import Viagem, SaldoUsuario
+
+# Prioridade da "viagem atual" em /users/me/: ativa, depois a próxima a começar,
+# depois a última finalizada.
+PRIORIDADE_VIAGEM_ATUAL = {0: 'ATIVA', 1: 'AGUARDANDO', 2: 'FINALIZADA'}
+
+
+def usuarios_detalhados(queryset=None):
+    # UserSerializer: perfil, perfil.departamentos e saldo (anotado em saldo_anotado).
+    if queryset is None:
+        queryset = User.objects.all()
+
+    saldo_geral = SaldoUsuario.objects.filter(
+        usuario=OuterRef('pk'), viagem__isnull=True
+    ).annotate(
+        saldo=F('total_adiantamentos') - F('total_despesas')
+    ).values('saldo')[:1]
+
+    return queryset.select_related('perfil').prefetch_related(
+        'perfil__departamentos'
+    ).annotate(
+        saldo_anotado=Coalesce(
+            Subquery(saldo_geral),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
+
+
+def viagens_detalhadas(queryset):
+    return queryset.prefetch_related(
+        Prefetch('participantes', queryset=usuarios_detalhados())
+    )
+
+
+def adiantamentos_detalhados(queryset):
+    return queryset.select_related('viagem').prefetch_related(
+        Prefetch('usuario', queryset=usuarios_detalhados())
+    )
+
+
+def despesas_detalhadas(queryset):
+    return queryset.prefetch_related(
+        Prefetch('usuario', queryset=usuarios_detalhados())
+    )
+
+
+# Listagens enxutas (serializers *ListaSerializer): linhas de values() com o
+# autor resumido a id, nome e foto (miniatura, quando já gerada).
+RESUMO_USUARIO = {
+    'usuario_nome': Trim(Concat('usuario__first_name', Value(' '), 'usuario__last_name')),
+    'usuario_foto': Coalesce(
+        NullIf('usuario__perfil__foto_perfil_miniatura', Value(''), output_field=CharField()),
+        NullIf('usuario__perfil__foto_perfil', Value(''), output_field=CharField()),
+    ),
+}
+
+
+def adiantamentos_enxutos(queryset):
+    return queryset.values(
+        'id', 'viagem_id', 'viagem__titulo', 'usuario_id', 'valor',
+        'data_adiantamento', 'observacoes', 'comprovante_deposito',
+        **RESUMO_USUARIO,
+    )
+
+
+def despesas_enxutas(queryset):
+    return queryset.values(
+        'id', 'viagem_id', 'usuario_id', 'valor', 'data_despesa', 'descricao', 'categoria',
+        'comprovante', 'comprovante_otimizado', 'comprovante_miniatura', 'status', 'aprovador_id',
+        **RESUMO_USUARIO,
+    )
+
+
+def usuarios_com_viagem_atual(user, hoje):
+    # Uma consulta para usuário, perfil, saldo e viagem atual (subconsultas
+    # correlacionadas) e outra para os departamentos do perfil.
+    viagens = Viagem.objects.filter(participantes=OuterRef('pk')).annotate(
+        prioridade=Case(
+            When(data_inicio__lte=hoje, data_fim__gte=hoje, then=Value(0)),
+            When(data_inicio__gt=hoje, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    ).order_by(
+        'prioridade',
+        Case(When(prioridade=1, then=F('data_inicio'))).asc(),
+        Case(When(prioridade=2, then=F('data_fim'))).desc(),
+        'id',
+    )
+
+    return usuarios_detalhados(User.objects.filter(pk=user.pk)).annotate(
+        viagem_atual_id=Subquery(viagens.values('id')[:1]),
+        viagem_atual_titulo=Subquery(viagens.values('titulo')[:1]),
+        viagem_atual_prioridade=Subquery(viagens.values('prioridade')[:1]),
+    )
+
+
+def usuario_com_viagem_atual(user, hoje):
+    return usuarios_com_viagem_atual(user, hoje).get()
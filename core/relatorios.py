@@ -0,0 +1,183 @@
+"""Exportação de despesas em CSV/XLSX em streaming, com memória constante."""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Despesa
+
+CHUNK_SIZE = 2000
+
+CAMPOS = [
+    ('id', 'ID'),
+    ('data_despesa', 'Data'),
+    ('viagem__titulo', 'Viagem'),
+    ('usuario__username', 'Usuário'),
+    ('usuario__first_name', 'Nome'),
+    ('usuario__last_name', 'Sobrenome'),
+    ('categoria', 'Categoria'),
+    ('descricao', 'Descrição'),
+    ('valor', 'Valor'),
+    ('status', 'Status'),
+    ('aprovador__username', 'Aprovador'),
+    ('data_aprovacao', 'Data de aprovação'),
+]
+
+CATEGORIAS = dict(Despesa.CATEGORIAS)
+STATUS = dict(Despesa.STATUS_DESPESA)
+
+
+def cabecalho():
+    return [titulo for _, titulo in CAMPOS]
+
+
+def linhas_despesas(queryset):
+    colunas = [campo for campo, _ in CAMPOS]
+    valores = queryset.order_by('data_despesa', 'id').values_list(*colunas)
+    for linha in valores.iterator(chunk_size=CHUNK_SIZE):
+        linha = list(linha)
+        linha[6] = CATEGORIAS.get(linha[6], linha[6])
+        linha[9] = STATUS.get(linha[9], linha[9])
+        yield linha
+
+
+# --- CSV ---
+
+class _Eco:
+    def write(self, valor):
+        return valor
+
+
+def _protege_formula(valor):
+    # Evita que planilhas interpretem texto digitado pelo usuário como fórmula.
+    if isinstance(valor, str) and valor[:1] in ('=', '+', '-', '@'):
+        return "'" + valor
+    return valor
+
+
+def stream_csv(linhas):
+    writer = csv.writer(_Eco())
+    yield '\ufeff'  # BOM para o Excel abrir em UTF-8
+    yield writer.writerow(cabecalho())
+    for linha in linhas:
+        yield writer.writerow([_protege_formula(valor) for valor in linha])
+
+
+# --- XLSX ---
+
+_PARTES_FIXAS = [
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="Despesas" sheetId="1" r:id="rId1"/></sheets>'
+     '</workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+     '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+     '</Relationships>'),
+    # Estilos 1 (data) e 2 (data e hora) das células de data.
+    ('xl/styles.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+     '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/>'
+     '<numFmt numFmtId="165" formatCode="dd/mm/yyyy hh:mm"/></numFmts>'
+     '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+     '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+     '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+     '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+     '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+     '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+     '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+     '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+     '</styleSheet>'),
+]
+
+_INICIO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+).encode()
+_FIM_PLANILHA = b'</sheetData></worksheet>'
+
+_CONTROLE_INVALIDO = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _Buffer:
+    """Destino do ZipFile; o gerador drena o que foi escrito a cada bloco."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def drenar(self):
+        dados = b''.join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+# Dia 0 das datas seriais do Excel (com o 29/02/1900 inexistente já descontado).
+_EPOCA = datetime(1899, 12, 30)
+
+
+def _celula(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.make_naive(valor)
+        serial = (valor - _EPOCA).total_seconds() / 86400
+        return f'<c s="2"><v>{serial!r}</v></c>'
+    if isinstance(valor, date):
+        return f'<c s="1"><v>{(valor - _EPOCA.date()).days}</v></c>'
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c t="n"><v>{valor}</v></c>'
+    texto = escape(_CONTROLE_INVALIDO.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xml(valores):
+    return ('<row>' + ''.join(_celula(valor) for valor in valores) + '</row>').encode()
+
+
+def stream_xlsx(linhas, linhas_por_bloco=500):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as arquivo:
+        for nome, conteudo in _PARTES_FIXAS:
+            arquivo.writestr(nome, conteudo)
+        yield buffer.drenar()
+
+        with arquivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write(_INICIO_PLANILHA)
+            planilha.write(_linha_xml(cabecalho()))
+            for i, linha in enumerate(linhas, start=1):
+                planilha.write(_linha_xml(linha))
+                if i % linhas_por_bloco == 0:
+                    yield buffer.drenar()
+            planilha.write(_FIM_PLANILHA)
+    yield buffer.drenar()
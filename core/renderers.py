@@ -0,0 +1,26 @@
+"""
+Renderer JSON padrão da API: mesma saída do JSONRenderer do DRF, gerada pelo orjson.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+OPCOES = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data):
+    conteudo = orjson.dumps(data, default=_encoder.default, option=OPCOES)
+    # Como o JSONRenderer: U+2028/U+2029 escapados, válidos também dentro de <script>.
+    return conteudo.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Com indentação (API navegável, ?indent=) fica o renderer do DRF.
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,61 @@
+"""
+Cache das respostas das listagens, com chaves pelas versões dos models de que
+cada uma depende.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .versoes import atuais, incrementar
+
+
+def _chave_versao(modelo):
+    return f'dados:versao:{modelo._meta.label_lower}'
+
+
+def invalidar(*modelos):
+    incrementar(*(_chave_versao(modelo) for modelo in modelos))
+
+
+def versoes(modelos):
+    chaves = [_chave_versao(modelo) for modelo in modelos]
+    encontradas = atuais(chaves)
+    return '.'.join(str(encontradas[chave]) for chave in chaves)
+
+
+def papel(user):
+    if user.is_superuser:
+        return 'admin'
+    perfil = getattr(user, 'perfil', None)
+    return perfil.tipo if perfil else 'sem-perfil'
+
+
+class RespostaEmCacheMixin:
+    """
+    Guarda o resultado de list() no cache. Por padrão o escopo é o usuário
+    (com o papel dele, para que uma mudança de papel troque a chave); views cuja
+    resposta é igual para todos sobrescrevem escopo_cache().
+    """
+    cache_dependencias = ()
+
+    def escopo_cache(self):
+        user = self.request.user
+        return f'{papel(user)}:{user.pk}'
+
+    def chave_cache(self):
+        request = self.request
+        parametros = sorted(request.query_params.lists())
+        assinatura = hashlib.md5(
+            f'{request.get_host()}{request.path}?{parametros}'.encode()
+        ).hexdigest()
+        return f'resposta:{assinatura}:{self.escopo_cache()}:{versoes(self.cache_dependencias)}'
+
+    def list(self, request, *args, **kwargs):
+        chave = self.chave_cache()
+        data = cache.get(chave)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(chave, data, settings.RESPOSTAS_CACHE_TIMEOUT)
+        return Response(data)
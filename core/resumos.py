@@ -0,0 +1,132 @@
+"""
+Resumo financeiro por viagem, calculado numa consulta agrupada e em cache pela
+versão da viagem.
+"""
+import hashlib
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, F, Sum, Value
+
+from . import hierarchy, versoes
+from .models import Adiantamento, Despesa
+
+ZERO = Decimal('0.00')
+
+
+def _chave_versao(viagem_id):
+    return f'resumo:versao:{viagem_id}'
+
+
+def invalidar(*viagem_ids):
+    versoes.incrementar(*(_chave_versao(viagem_id) for viagem_id in set(viagem_ids) - {None}))
+
+
+def _versoes(viagem_ids):
+    chaves = {_chave_versao(viagem_id): viagem_id for viagem_id in viagem_ids}
+    atuais = versoes.atuais(list(chaves))
+    return {viagem_id: atuais[chave] for chave, viagem_id in chaves.items()}
+
+
+def _escopo(user):
+    # Mesma visibilidade de despesas_da_viagem/adiantamentos_visiveis (core/views.py).
+    # Devolve (identificador do escopo para a chave de cache, filtro das despesas,
+    # filtro dos adiantamentos).
+    if user.is_superuser:
+        return 'todos', None, None
+
+    perfil = getattr(user, 'perfil', None)
+    if perfil and perfil.tipo in ['DIRETOR', 'GESTOR']:
+        subordinados = sorted(hierarchy.subordinados_ids(user))
+        assinatura = hashlib.md5(','.join(map(str, subordinados)).encode()).hexdigest()
+        return f'aprovador:{assinatura}', {'usuario_id__in': subordinados}, None
+
+    proprios = {'usuario_id': user.pk}
+    if perfil and perfil.tipo == 'COLABORADOR':
+        return f'usuario:{user.pk}', proprios, proprios
+    return f'usuario:{user.pk}:sem-perfil', proprios, None
+
+
+def _agrupado(queryset, **colunas):
+    return queryset.annotate(
+        v=F('viagem_id'), u=F('usuario_id'), **colunas
+    ).values('v', 'u', 'c', 's', 't').annotate(total=Sum('valor')).order_by()
+
+
+def _calcular(viagem_ids, filtro_despesas, filtro_adiantamentos):
+    despesas = Despesa.objects.filter(viagem_id__in=viagem_ids)
+    if filtro_despesas:
+        despesas = despesas.filter(**filtro_despesas)
+    adiantamentos = Adiantamento.objects.filter(viagem_id__in=viagem_ids)
+    if filtro_adiantamentos:
+        adiantamentos = adiantamentos.filter(**filtro_adiantamentos)
+
+    texto = CharField()
+    consulta = _agrupado(
+        despesas, c=F('categoria'), s=F('status'), t=Value('D', output_field=texto)
+    ).union(
+        _agrupado(
+            adiantamentos,
+            c=Value('', output_field=texto), s=Value('', output_field=texto), t=Value('A', output_field=texto),
+        ),
+        all=True,
+    )
+
+    resumos = {viagem_id: _vazio(viagem_id) for viagem_id in viagem_ids}
+    participantes = defaultdict(lambda: defaultdict(lambda: {'total_adiantamentos': ZERO, 'total_despesas': ZERO}))
+    for linha in consulta:
+        resumo = resumos[linha['v']]
+        participante = participantes[linha['v']][linha['u']]
+        if linha['t'] == 'A':
+            resumo['total_adiantamentos'] += linha['total']
+            participante['total_adiantamentos'] += linha['total']
+        else:
+            resumo['total_despesas'] += linha['total']
+            resumo['por_categoria'][linha['c']] = resumo['por_categoria'].get(linha['c'], ZERO) + linha['total']
+            resumo['por_status'][linha['s']] = resumo['por_status'].get(linha['s'], ZERO) + linha['total']
+            participante['total_despesas'] += linha['total']
+
+    for viagem_id, resumo in resumos.items():
+        resumo['saldo'] = resumo['total_adiantamentos'] - resumo['total_despesas']
+        resumo['participantes'] = [
+            {'usuario': usuario_id, **totais, 'saldo': totais['total_adiantamentos'] - totais['total_despesas']}
+            for usuario_id, totais in sorted(participantes[viagem_id].items())
+        ]
+    return resumos
+
+
+def _vazio(viagem_id):
+    return {
+        'viagem': viagem_id,
+        'total_adiantamentos': ZERO,
+        'total_despesas': ZERO,
+        'por_categoria': {categoria: ZERO for categoria, _ in Despesa.CATEGORIAS},
+        'por_status': {status: ZERO for status, _ in Despesa.STATUS_DESPESA},
+    }
+
+
+def resumo_viagens(viagem_ids, user):
+    """Devolve {viagem_id: resumo} calculando de uma vez só as que não estão em cache."""
+    viagem_ids = list(dict.fromkeys(viagem_ids))
+    if not viagem_ids:
+        return {}
+
+    escopo, filtro_despesas, filtro_adiantamentos = _escopo(user)
+    versao = _versoes(viagem_ids)
+    chaves = {f'resumo:{viagem_id}:{versao[viagem_id]}:{escopo}': viagem_id for viagem_id in viagem_ids}
+
+    em_cache = cache.get_many(chaves.keys())
+    resumos = {chaves[chave]: resumo for chave, resumo in em_cache.items()}
+
+    faltando = [viagem_id for viagem_id in viagem_ids if viagem_id not in resumos]
+    if faltando:
+        calculados = _calcular(faltando, filtro_despesas, filtro_adiantamentos)
+        cache.set_many(
+            {chave: calculados[viagem_id] for chave, viagem_id in chaves.items() if viagem_id in calculados},
+            settings.RESUMO_CACHE_TIMEOUT,
+        )
+        resumos.update(calculados)
+
+    return {viagem_id: resumos[viagem_id] for viagem_id in viagem_ids}
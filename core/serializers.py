@@ -1,18 +1,18 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa
-from django.utils import timezone
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
-from decimal import Decimal
+from django.core.files.storage import default_storage
+from django.db import transaction
+from . import hierarchy, uploads
+from .metricas import SerializacaoMedida
+from .models import Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa, SaldoUsuario
 
 
-class DepartamentoSerializer(serializers.ModelSerializer):
+class DepartamentoSerializer(SerializacaoMedida, serializers.ModelSerializer):
     class Meta:
         model = Departamento
         fields = '__all__'
 
-class PerfilUsuarioSerializer(serializers.ModelSerializer):
+class PerfilUsuarioSerializer(SerializacaoMedida, serializers.ModelSerializer):
     departamentos = serializers.PrimaryKeyRelatedField(
         many=True, 
         queryset=Departamento.objects.all(),
@@ -21,7 +21,8 @@ class PerfilUsuarioSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = PerfilUsuario
-        fields = ['tipo', 'departamentos', 'foto_perfil']
+        fields = ['tipo', 'departamentos', 'foto_perfil', 'foto_perfil_otimizada', 'foto_perfil_miniatura']
+        read_only_fields = ['foto_perfil_otimizada', 'foto_perfil_miniatura']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -29,7 +30,7 @@ class PerfilUsuarioSerializer(serializers.ModelSerializer):
         return representation
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SerializacaoMedida, serializers.ModelSerializer):
     perfil = PerfilUsuarioSerializer()
     saldo = serializers.SerializerMethodField()
 
@@ -38,13 +39,10 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'is_superuser', 'perfil', 'saldo']
 
     def get_saldo(self, obj):
-        total_adiantamentos = Adiantamento.objects.filter(usuario=obj).aggregate(
-            soma=Coalesce(Sum('valor'), Decimal('0.00'))
-        )['soma']
-        total_despesas = Despesa.objects.filter(usuario=obj).aggregate(
-            soma=Coalesce(Sum('valor'), Decimal('0.00'))
-        )['soma']
-        return total_adiantamentos - total_despesas
+        # Anotado por core.prefetch.usuarios_detalhados nas listagens.
+        if hasattr(obj, 'saldo_anotado'):
+            return obj.saldo_anotado
+        return SaldoUsuario.objects.saldo_de(obj)
 
     def update(self, instance, validated_data):
         perfil_data = validated_data.pop('perfil', None)
@@ -69,10 +67,12 @@ class UserSerializer(serializers.ModelSerializer):
                     Departamento.objects.filter(id__in=depto_ids).update(gestor=instance)
             
             perfil.save()
+            # update() em Departamento não dispara sinais.
+            transaction.on_commit(hierarchy.invalidar)
         return instance
 
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(SerializacaoMedida, serializers.ModelSerializer):
     tipo = serializers.ChoiceField(
         choices=PerfilUsuario.TIPOS_USUARIO, 
         write_only=True,
@@ -121,7 +121,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
                     depto.save()
         return user
 
-class ViagemSerializer(serializers.ModelSerializer):
+class ViagemSerializer(SerializacaoMedida, serializers.ModelSerializer):
     participantes_detalhes = UserSerializer(source='participantes', many=True, read_only=True)
     participantes = serializers.PrimaryKeyRelatedField(
         many=True, queryset=User.objects.all(), write_only=True
@@ -142,21 +142,47 @@ class ViagemSerializer(serializers.ModelSerializer):
             ]
             
     def get_status_dinamico(self, obj):
-        hoje = timezone.now().date()
-        
-        if obj.status == 'CANCELADA':
-            return 'Cancelada'
-        
-        if hoje < obj.data_inicio:
-            return 'Preparando'
-        elif obj.data_inicio <= hoje <= obj.data_fim:
-            return 'Ativa'
-        else: # hoje > obj.data_fim
-            return 'Finalizada'
-
-class AdiantamentoSerializer(serializers.ModelSerializer):
+        # Anotado por Viagem.objects.com_status_dinamico() nas listagens.
+        if hasattr(obj, 'status_dinamico'):
+            return obj.status_dinamico
+        return obj.calcular_status_dinamico()
+
+class ViagemPainelSerializer(ViagemSerializer):
+    # Sem participantes_detalhes: o painel envia os participantes com os totais da viagem.
+    class Meta(ViagemSerializer.Meta):
+        fields = ['id', 'titulo', 'data_inicio', 'data_fim', 'status', 'status_dinamico']
+
+
+class ComprovanteDiretoMixin:
+    """
+    Permite informar `comprovante_token` (ver core.uploads) no lugar do arquivo:
+    o comprovante já está no bucket e só a chave é gravada no model.
+    """
+    destino_upload = None
+    campo_comprovante = None
+    comprovante_obrigatorio = False
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        token = attrs.pop('comprovante_token', None)
+        if token:
+            try:
+                attrs[self.campo_comprovante] = uploads.validar_token(token, self.context['request'].user, self.destino_upload)
+            except uploads.UploadInvalido as exc:
+                raise serializers.ValidationError({'comprovante_token': str(exc)})
+
+        if self.comprovante_obrigatorio and self.instance is None and not attrs.get(self.campo_comprovante):
+            raise serializers.ValidationError({self.campo_comprovante: 'Envie o arquivo ou o comprovante_token.'})
+        return attrs
+
+
+class AdiantamentoSerializer(SerializacaoMedida, ComprovanteDiretoMixin, serializers.ModelSerializer):
+    destino_upload = 'adiantamento'
+    campo_comprovante = 'comprovante_deposito'
+
     usuario_detalhes = UserSerializer(source='usuario', read_only=True)
     viagem_titulo = serializers.CharField(source='viagem.titulo', read_only=True)
+    comprovante_token = serializers.CharField(write_only=True, required=False)
 
     class Meta:
         model = Adiantamento
@@ -169,14 +195,95 @@ class AdiantamentoSerializer(serializers.ModelSerializer):
             'valor', 
             'data_adiantamento', 
             'observacoes', 
-            'comprovante_deposito'
+            'comprovante_deposito',
+            'comprovante_token'
         ]
         read_only_fields = ['data_adiantamento', 'usuario_detalhes', 'viagem_titulo']
 
-class DespesaSerializer(serializers.ModelSerializer):
+class DespesaSerializer(SerializacaoMedida, ComprovanteDiretoMixin, serializers.ModelSerializer):
+    destino_upload = 'despesa'
+    campo_comprovante = 'comprovante'
+    comprovante_obrigatorio = True
+
     usuario_detalhes = UserSerializer(source='usuario', read_only=True)
+    comprovante_token = serializers.CharField(write_only=True, required=False)
+
+    class Meta:
+        model = Despesa
+        fields = ['id', 'viagem', 'usuario', 'usuario_detalhes', 'valor', 'data_despesa', 'descricao', 'categoria', 'comprovante', 'comprovante_token', 'comprovante_otimizado', 'comprovante_miniatura', 'status', 'aprovador']
+        read_only_fields = ['usuario', 'status', 'aprovador', 'data_aprovacao', 'comprovante_otimizado', 'comprovante_miniatura']
+        # O comprovante pode chegar como arquivo ou via comprovante_token.
+        extra_kwargs = {'comprovante': {'required': False}}
+
+class DespesaLoteSerializer(SerializacaoMedida, ComprovanteDiretoMixin, serializers.ModelSerializer):
+    """
+    Item de POST /despesas/lote/ (core.envio_lote). Só valida: a viagem é
+    conferida para o lote inteiro numa consulta, na view.
+    """
+    destino_upload = 'despesa'
+    campo_comprovante = 'comprovante'
+    comprovante_obrigatorio = True
+
+    id_cliente = serializers.CharField(max_length=100)
+    viagem = serializers.IntegerField()
+    comprovante_token = serializers.CharField(write_only=True, required=False)
 
     class Meta:
         model = Despesa
-        fields = ['id', 'viagem', 'usuario', 'usuario_detalhes', 'valor', 'data_despesa', 'descricao', 'categoria', 'comprovante', 'status', 'aprovador']
-        read_only_fields = ['usuario', 'status', 'aprovador', 'data_aprovacao']
\ No newline at end of file
+        fields = ['id_cliente', 'viagem', 'valor', 'data_despesa', 'descricao', 'categoria', 'comprovante', 'comprovante_token']
+        extra_kwargs = {'comprovante': {'required': False}}
+
+# --- Listagens enxutas ---
+# Serializers só de leitura sobre as linhas de values() montadas por
+# core.prefetch.despesas_enxutas/adiantamentos_enxutos: sem instanciar models
+# e sem o UserSerializer completo (perfil, departamentos e saldo) por linha.
+
+class ArquivoUrlField(serializers.Field):
+    """Nome do arquivo (string de values(), não FieldFile) como URL, igual ao FileField do DRF."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, nome):
+        if not nome:
+            return None
+        url = default_storage.url(nome)
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class ResumoUsuarioSerializer(SerializacaoMedida, serializers.Serializer):
+    id = serializers.IntegerField(source='usuario_id')
+    nome = serializers.CharField(source='usuario_nome')
+    foto = ArquivoUrlField(source='usuario_foto')
+
+
+class AdiantamentoListaSerializer(SerializacaoMedida, serializers.Serializer):
+    id = serializers.IntegerField()
+    viagem = serializers.IntegerField(source='viagem_id')
+    viagem_titulo = serializers.CharField(source='viagem__titulo')
+    usuario = serializers.IntegerField(source='usuario_id')
+    usuario_detalhes = ResumoUsuarioSerializer(source='*')
+    valor = serializers.DecimalField(max_digits=10, decimal_places=2)
+    data_adiantamento = serializers.DateField()
+    observacoes = serializers.CharField()
+    comprovante_deposito = ArquivoUrlField()
+
+
+class DespesaListaSerializer(SerializacaoMedida, serializers.Serializer):
+    id = serializers.IntegerField()
+    viagem = serializers.IntegerField(source='viagem_id')
+    usuario = serializers.IntegerField(source='usuario_id')
+    usuario_detalhes = ResumoUsuarioSerializer(source='*')
+    valor = serializers.DecimalField(max_digits=10, decimal_places=2)
+    data_despesa = serializers.DateField()
+    descricao = serializers.CharField()
+    categoria = serializers.CharField()
+    comprovante = ArquivoUrlField()
+    comprovante_otimizado = ArquivoUrlField()
+    comprovante_miniatura = ArquivoUrlField()
+    status = serializers.CharField()
+    aprovador = serializers.IntegerField(source='aprovador_id')
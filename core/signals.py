@@ -0,0 +1,184 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from decimal import Decimal
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from . import autenticacao, comprovantes, fila, hierarchy, imagens, respostas, resumos
+from .models import Departamento, PerfilUsuario, Viagem, Adiantamento, Despesa, SaldoUsuario
+
+
+@receiver(post_delete, sender=Adiantamento)
+@receiver(post_delete, sender=Despesa)
+def estornar_saldo(sender, instance, **kwargs):
+    # Roda dentro da transação do Collector, inclusive em exclusões em cascata.
+    # Nunca cria linhas: se o usuário/viagem também está sendo excluído,
+    # a linha de saldo dele é removida pela própria cascata.
+    usuario_id, viagem_id, valor = getattr(instance, '_saldo_original', None) or instance.chave_saldo()
+    SaldoUsuario.objects.movimentar(sender.campo_saldo, usuario_id, viagem_id, -Decimal(str(valor)), criar=False)
+
+
+# --- Hierarquia de aprovação (core.hierarchy) ---
+
+@receiver(post_save, sender=Departamento)
+@receiver(post_delete, sender=Departamento)
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def invalidar_hierarquia(sender, **kwargs):
+    # Depois do commit: quem ler a versão nova já enxerga o dado novo.
+    transaction.on_commit(hierarchy.invalidar)
+
+
+@receiver(m2m_changed, sender=PerfilUsuario.departamentos.through)
+def invalidar_hierarquia_departamentos(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(hierarchy.invalidar)
+
+
+# --- Usuário autenticado em cache (core.autenticacao) ---
+# Perfis e departamentos já trocam a chave pela versão da hierarquia.
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_autenticacao_usuario(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: autenticacao.invalidar_usuario(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidar_autenticacao_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: autenticacao.invalidar_tokens(key))
+
+
+# --- Comprovantes pelo conteúdo (core.comprovantes) ---
+
+@receiver(pre_save, sender=Despesa)
+def indexar_comprovante(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Antes do FileField.pre_save: um conteúdo já gravado não é enviado de novo.
+    if not raw and comprovantes.precisa_indexar(instance, update_fields):
+        comprovantes.indexar(instance)
+
+
+@receiver(post_save, sender=Despesa)
+def agendar_hash_comprovante(sender, instance, raw=False, **kwargs):
+    if not raw and instance.__dict__.pop('_hash_pendente', False):
+        comprovantes.agendar_indexacao(instance)
+
+
+# --- Derivados de imagem (core.imagens) ---
+# Os de Despesa são limpos em comprovantes.indexar, que pode reaproveitar os
+# derivados de um conteúdo já conhecido.
+
+@receiver(pre_save, sender=PerfilUsuario)
+def limpar_derivados_imagem(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and imagens.original_trocado(instance, update_fields):
+        imagens.limpar_derivados(instance)
+
+
+@receiver(post_save, sender=Despesa)
+@receiver(post_save, sender=PerfilUsuario)
+def agendar_derivados_imagem(sender, instance, **kwargs):
+    if imagens.precisa_processar(instance):
+        imagens.agendar(instance)
+
+
+# --- Resumo financeiro da viagem (core.resumos) ---
+
+@receiver(post_save, sender=Adiantamento)
+@receiver(post_delete, sender=Adiantamento)
+@receiver(post_save, sender=Despesa)
+@receiver(post_delete, sender=Despesa)
+def invalidar_resumo(sender, instance, **kwargs):
+    # Durante o save() _saldo_original ainda guarda a viagem anterior, então
+    # uma despesa movida de viagem invalida as duas. A invalidação espera o
+    # commit para que nenhuma leitura concorrente grave no cache o estado antigo.
+    viagens = {instance.viagem_id}
+    anterior = getattr(instance, '_saldo_original', None)
+    if anterior:
+        viagens.add(anterior[1])
+    transaction.on_commit(lambda: resumos.invalidar(*viagens))
+
+
+# --- Cache das respostas das listagens (core.respostas) ---
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Departamento)
+@receiver(post_delete, sender=Departamento)
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+@receiver(post_save, sender=Viagem)
+@receiver(post_delete, sender=Viagem)
+@receiver(post_save, sender=Adiantamento)
+@receiver(post_delete, sender=Adiantamento)
+@receiver(post_save, sender=Despesa)
+@receiver(post_delete, sender=Despesa)
+def invalidar_respostas(sender, **kwargs):
+    transaction.on_commit(lambda: respostas.invalidar(sender))
+
+
+@receiver(m2m_changed, sender=Viagem.participantes.through)
+@receiver(m2m_changed, sender=PerfilUsuario.departamentos.through)
+def invalidar_respostas_m2m(sender, instance, action, model, **kwargs):
+    # instance pode ser qualquer um dos lados, conforme o lado usado na alteração.
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        modelos = (type(instance), model)
+        transaction.on_commit(lambda: respostas.invalidar(*modelos))
+
+
+# --- Versão da viagem no ?since= do painel ---
+
+@receiver(m2m_changed, sender=Viagem.participantes.through)
+def atualizar_viagem_participantes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+    if not reverse:
+        viagens = [instance.pk]
+    elif pk_set is not None:
+        viagens = pk_set
+    else:
+        viagens = list(instance.viagens.values_list('id', flat=True))
+    Viagem.objects.filter(pk__in=viagens).update(atualizado_em=timezone.now())
+
+
+# --- Fila de aprovação (core.fila) ---
+
+@receiver(post_save, sender=Despesa)
+def sincronizar_fila_despesa(sender, instance, created, **kwargs):
+    if instance.status != 'PENDENTE':
+        if not created:
+            fila.remover([instance.pk])
+        return
+    fila.sincronizar([instance.pk])
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def sincronizar_fila_perfil(sender, instance, **kwargs):
+    fila.sincronizar_perfil(instance.user_id)
+
+
+@receiver(post_save, sender=Departamento)
+def sincronizar_fila_departamento(sender, instance, **kwargs):
+    # O gestor pode ter mudado: refaz a fila dos membros do departamento.
+    fila.sincronizar_donos(instance.perfis.values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Departamento)
+def reconciliar_fila_departamento(sender, **kwargs):
+    # Os vínculos com os perfis já foram removidos: não há como saber quem era membro.
+    fila.reconciliar()
+
+
+@receiver(m2m_changed, sender=PerfilUsuario.departamentos.through)
+def sincronizar_fila_departamentos(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        fila.sincronizar_donos([instance.user_id])
+    elif pk_set is not None:
+        fila.sincronizar_donos(PerfilUsuario.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    else:
+        fila.reconciliar()
@@ -1,3 +1,1511 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import json
+import os
+import pickle
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+import boto3
+from asgiref.sync import iscoroutinefunction
+from asgiref.testing import ApplicationCommunicator
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core import signing
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moto import mock_aws
+import openpyxl
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import autenticacao, comprovantes, envio_lote, fila, hierarchy, imagens, metricas, organizacao, uploads, versoes
+from .estaticos import ArquivosEstaticos
+from .models import (
+    Adiantamento, Departamento, Despesa, FilaAprovacao, PerfilUsuario, SaldoUsuario, Viagem, ViagemQuerySet,
+)
+from .pagination import CursorPadrao
+from .renderers import ORJSONRenderer
+
+# Arquivos em memória: os testes não falam com o bucket.
+STORAGES_TESTE = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+HASHERS_TESTE = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def criar_usuario(username, tipo=None, departamentos=(), **extra):
+    user = User.objects.create_user(username, password='x', **extra)
+    if tipo:
+        perfil = PerfilUsuario.objects.create(user=user, tipo=tipo)
+        perfil.departamentos.set(departamentos)
+    return user
+
+
+def criar_despesa(usuario, viagem, valor='10.00', **extra):
+    extra.setdefault('comprovante', SimpleUploadedFile('nota.pdf', f'{usuario.pk}-{Despesa.objects.count()}'.encode()))
+    extra.setdefault('descricao', 'Despesa')
+    return Despesa.objects.create(
+        usuario=usuario, viagem=viagem, valor=Decimal(valor), data_despesa=date(2024, 1, 1), **extra
+    )
+
+
+def percorrer_paginas(cliente, url, params=None):
+    # Segue "next" como listarTodos (frontend/src/services/api.js) e devolve as páginas.
+    paginas = []
+    resposta = cliente.get(url, params)
+    while True:
+        assert resposta.status_code == 200, resposta.content
+        paginas.append(resposta.data['results'])
+        if not resposta.data['next']:
+            return paginas
+        resposta = cliente.get(resposta.data['next'])
+
+
+class OrganizacaoMixin:
+    """Diretor, gestor do departamento TI, colaborador de TI, admin e uma viagem com os três."""
+
+    def setUp(self):
+        cache.clear()
+        self.ti = Departamento.objects.create(nome='TI')
+        self.diretor = criar_usuario('diretor', 'DIRETOR')
+        self.gestor = criar_usuario('gestor', 'GESTOR', [self.ti])
+        self.ti.gestor = self.gestor
+        self.ti.save()
+        self.colaborador = criar_usuario('colaborador', 'COLABORADOR', [self.ti])
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.viagem = Viagem.objects.create(titulo='Viagem', data_inicio=date(2020, 1, 1), data_fim=date(2030, 1, 1))
+        self.viagem.participantes.set([self.diretor, self.gestor, self.colaborador])
+
+    def cliente(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class SaldoUsuarioTests(OrganizacaoMixin, TestCase):
+    """O ledger SaldoUsuario acompanha cada lançamento (core.models.MovimentoSaldo e core.signals)."""
+
+    def setUp(self):
+        super().setUp()
+        self.outra_viagem = Viagem.objects.create(
+            titulo='Outra', data_inicio=date(2020, 1, 1), data_fim=date(2030, 1, 1)
+        )
+
+    def assertSaldos(self, user, esperado):
+        # esperado: {viagem (None = geral): (adiantamentos, despesas)}; linhas zeradas não contam.
+        saldos = {
+            saldo.viagem_id: (saldo.total_adiantamentos, saldo.total_despesas)
+            for saldo in SaldoUsuario.objects.filter(usuario=user)
+            if saldo.total_adiantamentos or saldo.total_despesas
+        }
+        self.assertEqual(saldos, {
+            getattr(viagem, 'pk', None): (Decimal(adiantamentos), Decimal(despesas))
+            for viagem, (adiantamentos, despesas) in esperado.items()
+        })
+
+    def verificar(self):
+        saida = StringIO()
+        call_command('reconstruir_saldos', '--verificar', stdout=saida)
+        return saida.getvalue()
+
+    def test_criar_lancamentos(self):
+        Adiantamento.objects.create(usuario=self.colaborador, viagem=self.viagem, valor=Decimal('100.00'))
+        criar_despesa(self.colaborador, self.viagem, '30.00')
+        criar_despesa(self.colaborador, self.outra_viagem, '5.00')
+        self.assertSaldos(self.colaborador, {
+            self.viagem: ('100.00', '30.00'), self.outra_viagem: ('0.00', '5.00'), None: ('100.00', '35.00'),
+        })
+
+    def test_alterar_valor_usuario_e_viagem(self):
+        despesa = criar_despesa(self.colaborador, self.viagem, '30.00')
+        adiantamento = Adiantamento.objects.create(usuario=self.colaborador, viagem=self.viagem, valor=Decimal('100.00'))
+
+        despesa.valor = Decimal('45.00')
+        despesa.save()
+        adiantamento.valor = Decimal('80.00')
+        adiantamento.save()
+        self.assertSaldos(self.colaborador, {self.viagem: ('80.00', '45.00'), None: ('80.00', '45.00')})
+
+        despesa.usuario = self.gestor
+        despesa.save()
+        adiantamento.usuario = self.gestor
+        adiantamento.save()
+        self.assertSaldos(self.colaborador, {})
+        self.assertSaldos(self.gestor, {self.viagem: ('80.00', '45.00'), None: ('80.00', '45.00')})
+
+        despesa.viagem = self.outra_viagem
+        despesa.save()
+        adiantamento.viagem = self.outra_viagem
+        adiantamento.save()
+        self.assertSaldos(self.gestor, {self.outra_viagem: ('80.00', '45.00'), None: ('80.00', '45.00')})
+
+    def test_excluir_lancamentos(self):
+        despesa = criar_despesa(self.colaborador, self.viagem, '30.00')
+        adiantamento = Adiantamento.objects.create(usuario=self.colaborador, viagem=self.viagem, valor=Decimal('100.00'))
+        criar_despesa(self.colaborador, self.viagem, '7.00')
+
+        despesa.delete()
+        self.assertSaldos(self.colaborador, {self.viagem: ('100.00', '7.00'), None: ('100.00', '7.00')})
+        adiantamento.delete()
+        self.assertSaldos(self.colaborador, {self.viagem: ('0.00', '7.00'), None: ('0.00', '7.00')})
+
+    def test_exclusao_em_cascata_da_viagem(self):
+        criar_despesa(self.colaborador, self.viagem, '30.00')
+        Adiantamento.objects.create(usuario=self.colaborador, viagem=self.outra_viagem, valor=Decimal('50.00'))
+        criar_despesa(self.colaborador, self.outra_viagem, '20.00')
+        outra_viagem_id = self.outra_viagem.pk
+
+        self.outra_viagem.delete()
+        self.assertSaldos(self.colaborador, {self.viagem: ('0.00', '30.00'), None: ('0.00', '30.00')})
+        self.assertFalse(SaldoUsuario.objects.filter(viagem_id=outra_viagem_id).exists())
+        self.assertIn('0 saldo(s) divergente(s)', self.verificar())
+
+    def test_exclusao_em_cascata_do_usuario(self):
+        criar_despesa(self.colaborador, self.viagem, '30.00')
+        Adiantamento.objects.create(usuario=self.colaborador, viagem=self.viagem, valor=Decimal('100.00'))
+        criar_despesa(self.gestor, self.viagem, '12.00')
+        colaborador_id = self.colaborador.pk
+
+        self.colaborador.delete()
+        self.assertFalse(SaldoUsuario.objects.filter(usuario_id=colaborador_id).exists())
+        self.assertSaldos(self.gestor, {self.viagem: ('0.00', '12.00'), None: ('0.00', '12.00')})
+        self.assertIn('0 saldo(s) divergente(s)', self.verificar())
+
+    def test_reconstruir_saldos_corrige_divergencia(self):
+        criar_despesa(self.colaborador, self.viagem, '30.00')
+        SaldoUsuario.objects.filter(usuario=self.colaborador, viagem=self.viagem).update(total_despesas=Decimal('999.00'))
+
+        self.assertIn('1 saldo(s) divergente(s)', self.verificar())
+        # --verificar só relata.
+        self.assertEqual(
+            SaldoUsuario.objects.get(usuario=self.colaborador, viagem=self.viagem).total_despesas, Decimal('999.00')
+        )
+
+        saida = StringIO()
+        call_command('reconstruir_saldos', stdout=saida)
+        self.assertIn('1 corrigido(s)', saida.getvalue())
+        self.assertSaldos(self.colaborador, {self.viagem: ('0.00', '30.00'), None: ('0.00', '30.00')})
+        self.assertIn('0 saldo(s) divergente(s)', self.verificar())
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class ConsultasPorEndpointTests(OrganizacaoMixin, TestCase):
+    """
+    As listagens fazem um número fixo de consultas, qualquer que seja o número
+    de linhas: uma consulta a mais por linha (N+1) quebra estes testes.
+    """
+
+    def popular(self, quantidade):
+        for i in range(quantidade):
+            colaborador = criar_usuario(f'extra{User.objects.count()}', 'COLABORADOR', [self.ti])
+            viagem = Viagem.objects.create(titulo=f'Extra {i}', data_inicio=date(2020, 1, 1), data_fim=date(2030, 1, 1))
+            viagem.participantes.set([colaborador, self.colaborador])
+            criar_despesa(colaborador, viagem)
+            criar_despesa(self.colaborador, self.viagem)
+            Adiantamento.objects.create(usuario=colaborador, viagem=viagem, valor=Decimal('50.00'))
+
+    def consultas(self, user, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.cliente(user).get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(contexto)
+
+    def assertConstante(self, user, url, esperado):
+        self.popular(2)
+        with self.subTest(linhas='poucas'):
+            self.assertEqual(self.consultas(user, url), esperado)
+        self.popular(6)
+        with self.subTest(linhas='muitas'):
+            self.assertEqual(self.consultas(user, url), esperado)
+
+    def test_usuarios(self):
+        self.assertConstante(self.admin, '/api/users/', 2)
+
+    def test_viagens_admin(self):
+        self.assertConstante(self.admin, '/api/viagens/', 3)
+
+    def test_viagens_gestor(self):
+        self.assertConstante(self.gestor, '/api/viagens/?filtro=todas', 4)
+
+    def test_despesas(self):
+        self.assertConstante(self.colaborador, '/api/despesas/', 1)
+
+    def test_despesas_da_viagem(self):
+        self.assertConstante(self.gestor, f'/api/despesas/?viagem={self.viagem.pk}', 2)
+
+    def test_painel(self):
+        self.assertConstante(self.gestor, f'/api/viagens/{self.viagem.pk}/painel/', 8)
+
+    def test_resposta_em_cache_nao_consulta(self):
+        self.popular(2)
+        client = self.cliente(self.admin)
+        client.get('/api/users/')
+        with self.assertNumQueries(0):
+            client.get('/api/users/')
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class InvalidacaoHierarquiaTests(OrganizacaoMixin, TestCase):
+    """A versão da hierarquia (e das chaves de autenticação) só muda no commit."""
+
+    def test_perfil_invalida_depois_do_commit(self):
+        antes = hierarchy.versao()
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil = self.colaborador.perfil
+            perfil.tipo = 'GESTOR'
+            perfil.save()
+            perfil.departamentos.set([])
+            self.assertEqual(hierarchy.versao(), antes)
+        self.assertNotEqual(hierarchy.versao(), antes)
+
+    def test_atualizacao_pela_api_invalida_depois_do_commit(self):
+        antes = hierarchy.versao()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.cliente(self.admin).patch(
+                f'/api/users/{self.colaborador.pk}/', {'perfil': {'tipo': 'GESTOR', 'departamentos': [self.ti.pk]}},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(hierarchy.versao(), antes)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(hierarchy.versao(), antes)
+        self.assertIn(self.colaborador.pk, hierarchy.subordinados_ids(self.diretor))
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class CorpoDaRequisicaoTests(OrganizacaoMixin, TestCase):
+    """Endpoints que leem campos do corpo respondem 400 a um array JSON."""
+
+    def assertRecusaArray(self, user, url):
+        response = self.cliente(user).post(url, [1, 2], format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_aprovacao_em_lote(self):
+        self.assertRecusaArray(self.gestor, '/api/despesas/aprovar-lote/')
+        self.assertRecusaArray(self.gestor, '/api/despesas/rejeitar-lote/')
+
+    def test_marcar_fila_lida(self):
+        self.assertRecusaArray(self.gestor, '/api/despesas-para-aprovacao/lidas/')
+
+    def test_envio_em_lote(self):
+        self.assertRecusaArray(self.colaborador, '/api/despesas/lote/')
+
+    def test_aprovacao_em_lote_objeto(self):
+        despesa = criar_despesa(self.colaborador, self.viagem)
+        response = self.cliente(self.gestor).post('/api/despesas/aprovar-lote/', {'ids': [despesa.pk]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['processadas'], 1)
+
+
+def consultas_frequentes():
+    """{nome: (queryset, índice usado no SQLite)} das consultas mais frequentes da API."""
+    hoje = timezone.now().date()
+    ids = [1, 2, 3]
+    return {
+        'fila de aprovação': (
+            Despesa.objects.filter(status='PENDENTE', usuario_id__in=ids).order_by('data_despesa', 'id'),
+            'despesa_pendente_idx',
+        ),
+        'caixa de entrada do aprovador': (
+            FilaAprovacao.objects.filter(aprovador_id=1, lida=False), 'fila_aprovador_lida_idx',
+        ),
+        'despesas da viagem (gestor)': (
+            Despesa.objects.filter(viagem_id=1, usuario_id__in=ids), 'despesa_viagem_usuario_idx',
+        ),
+        'despesas da viagem (admin)': (
+            Despesa.objects.filter(viagem_id=1).order_by('data_despesa', 'id'), 'despesa_viagem_data_idx',
+        ),
+        'minhas despesas': (
+            Despesa.objects.filter(usuario_id=1).order_by('data_despesa', 'id'), 'despesa_usuario_data_idx',
+        ),
+        'adiantamentos do usuário': (
+            Adiantamento.objects.filter(usuario_id=1).order_by('-data_adiantamento'), 'adiant_usuario_data_idx',
+        ),
+        'adiantamentos da viagem': (
+            Adiantamento.objects.filter(viagem_id=1).order_by('-data_adiantamento'), 'adiant_viagem_data_idx',
+        ),
+        'viagem ativa do usuário': (
+            Viagem.objects.filter(participantes=1, data_inicio__lte=hoje, data_fim__gte=hoje),
+            'core_viagem_participantes_user_id_',
+        ),
+        'próximas viagens': (
+            Viagem.objects.filter(data_inicio__gt=hoje).order_by('data_inicio'), 'viagem_periodo_idx',
+        ),
+        'viagens finalizadas': (
+            Viagem.objects.filter(data_fim__lt=hoje).order_by('-data_fim'), 'viagem_data_fim_idx',
+        ),
+        'viagens por status dinâmico': (
+            Viagem.objects.filtrar_status_dinamico('Preparando', hoje).com_status_dinamico(), 'viagem_periodo_idx',
+        ),
+        'saldo do usuário': (
+            # A UniqueConstraint (usuario, viagem) vira o índice automático da tabela no SQLite.
+            SaldoUsuario.objects.filter(usuario_id=1, viagem__isnull=True), 'sqlite_autoindex_core_saldousuario_',
+        ),
+    }
+
+
+class PlanosDeConsultaTests(TestCase):
+    """As consultas mais frequentes não varrem tabelas inteiras."""
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'Planos do SQLite.')
+    def test_sqlite(self):
+        for nome, (queryset, indice) in consultas_frequentes().items():
+            with self.subTest(nome):
+                plano = queryset.explain()
+                self.assertIsNone(re.search(r'\bSCAN core_\w+(?! USING)', plano), plano)
+                self.assertIn(f'USING INDEX {indice}', plano)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Planos do PostgreSQL.')
+    def test_postgresql(self):
+        with transaction.atomic():
+            # Com tabelas pequenas o planner prefere Seq Scan mesmo havendo índice;
+            # desligando-o, só sobra Seq Scan quando não existe índice utilizável.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for nome, (queryset, _) in consultas_frequentes().items():
+                with self.subTest(nome):
+                    plano = queryset.explain()
+                    self.assertNotIn('Seq Scan on core_', plano)
+
+
+BUCKET_TESTE = 'comprovantes-teste'
+
+
+# No Django 5.0 o override de STORAGES descarta os OPTIONS do backend
+# (DEFAULT_FILE_STORAGE fica marcado como alterado): o S3Storage de teste é
+# configurado pelas settings AWS_*.
+@override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'storages.backends.s3.S3Storage'},
+        'staticfiles': STORAGES_TESTE['staticfiles'],
+    },
+    AWS_STORAGE_BUCKET_NAME=BUCKET_TESTE, AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_ENDPOINT_URL=None, AWS_S3_CUSTOM_DOMAIN=None, AWS_S3_FILE_OVERWRITE=False,
+    PASSWORD_HASHERS=HASHERS_TESTE, IMAGENS_EM_SEGUNDO_PLANO=False,
+)
+class UploadDiretoTests(OrganizacaoMixin, TestCase):
+    """POST pré-assinado e token de upload (core.uploads) contra um S3 simulado (moto)."""
+
+    def setUp(self):
+        simulacao = mock_aws()
+        simulacao.start()
+        self.addCleanup(simulacao.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET_TESTE)
+        super().setUp()
+
+    def solicitar(self, user, destino='despesa', nome='nota.pdf', **extra):
+        response = self.cliente(user).post(
+            '/api/uploads/', {'destino': destino, 'nome_arquivo': nome, 'content_type': 'application/pdf', **extra},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def enviar(self, upload, conteudo=b'%PDF-1.4 teste'):
+        return requests.post(upload['url'], data=upload['campos'], files={'file': ('nota.pdf', conteudo)})
+
+    def test_post_pre_assinado(self):
+        upload = self.solicitar(self.colaborador)
+        self.assertTrue(upload['chave'].startswith('comprovantes/'))
+        self.assertEqual(upload['campos']['Content-Type'], 'application/pdf')
+        self.assertIn('policy', upload['campos'])
+
+        self.assertEqual(self.enviar(upload).status_code, 204)
+        self.assertEqual(uploads.validar_token(upload['token'], self.colaborador, 'despesa'), upload['chave'])
+
+    def test_politica_do_post(self):
+        # O moto não aplica a política do POST; confere o que foi assinado.
+        upload = self.solicitar(self.colaborador)
+        politica = json.loads(base64.b64decode(upload['campos']['policy']))
+        self.assertIn({'Content-Type': 'application/pdf'}, politica['conditions'])
+        self.assertIn({'key': upload['chave']}, politica['conditions'])
+        self.assertIn(['content-length-range', 1, settings.UPLOAD_DIRETO_TAMANHO_MAXIMO], politica['conditions'])
+
+    def test_destino_invalido(self):
+        response = self.cliente(self.colaborador).post('/api/uploads/', {'destino': 'foto'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_adiantamento_apenas_admin(self):
+        response = self.cliente(self.colaborador).post('/api/uploads/', {'destino': 'adiantamento'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_token_antes_do_envio(self):
+        upload = self.solicitar(self.colaborador)
+        with self.assertRaisesMessage(uploads.UploadInvalido, 'ainda não foi enviado'):
+            uploads.validar_token(upload['token'], self.colaborador, 'despesa')
+
+    def test_token_de_outro_usuario_ou_destino(self):
+        upload = self.solicitar(self.colaborador)
+        self.enviar(upload)
+        with self.assertRaisesMessage(uploads.UploadInvalido, 'não pertence'):
+            uploads.validar_token(upload['token'], self.gestor, 'despesa')
+        with self.assertRaisesMessage(uploads.UploadInvalido, 'não pertence'):
+            uploads.validar_token(upload['token'], self.colaborador, 'adiantamento')
+
+    def test_token_adulterado(self):
+        upload = self.solicitar(self.colaborador)
+        self.enviar(upload)
+        dados = signing.loads(upload['token'], salt=uploads.SALT)
+        # Chave trocada sem a assinatura do servidor.
+        forjado = signing.dumps(dict(dados, chave='comprovantes/de-outra-pessoa.pdf'), salt='outro-salt')
+        for token in (forjado, upload['token'][:-2], ''):
+            with self.assertRaisesMessage(uploads.UploadInvalido, 'inválido'):
+                uploads.validar_token(token, self.colaborador, 'despesa')
+
+    def test_confirmar_comprovante_com_token_de_outro_usuario(self):
+        despesa = criar_despesa(self.gestor, self.viagem)
+        upload = self.solicitar(self.colaborador)
+        self.enviar(upload)
+        response = self.cliente(self.gestor).post(
+            f'/api/despesas/{despesa.pk}/comprovante/', {'token': upload['token']}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_criar_despesa_com_upload_direto(self):
+        upload = self.solicitar(self.colaborador)
+        self.enviar(upload)
+        response = self.cliente(self.colaborador).post('/api/despesas/', {
+            'viagem': self.viagem.pk, 'valor': '25.00', 'data_despesa': '2024-01-02',
+            'descricao': 'Táxi', 'comprovante_token': upload['token'],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        despesa = Despesa.objects.get(pk=response.data['id'])
+        self.assertTrue(despesa.comprovante.storage.exists(despesa.comprovante.name))
+
+
+    def enviar_com_checksum(self, upload, conteudo=b'%PDF-1.4 teste'):
+        # O moto não guarda o checksum de um POST: o PUT com checksum deixa o
+        # objeto como o S3 deixaria após o POST com x-amz-checksum-sha256.
+        boto3.client('s3', region_name='us-east-1').put_object(
+            Bucket=BUCKET_TESTE, Key=upload['chave'], Body=conteudo, ChecksumAlgorithm='SHA256'
+        )
+
+    def criar_despesa_com_token(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.cliente(self.colaborador).post('/api/despesas/', {
+                'viagem': self.viagem.pk, 'valor': '25.00', 'data_despesa': '2024-01-02',
+                'descricao': 'Táxi', 'comprovante_token': upload['token'],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Despesa.objects.get(pk=response.data['id'])
+
+    def test_politica_com_sha256(self):
+        sha256 = hashlib.sha256(b'%PDF-1.4 teste').hexdigest()
+        upload = self.solicitar(self.colaborador, sha256=sha256)
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        self.assertEqual(upload['campos']['x-amz-checksum-sha256'], checksum)
+        politica = json.loads(base64.b64decode(upload['campos']['policy']))
+        self.assertIn({'x-amz-checksum-sha256': checksum}, politica['conditions'])
+
+        response = self.cliente(self.colaborador).post(
+            '/api/uploads/', {'destino': 'despesa', 'sha256': 'abc'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_hash_pelo_checksum_sem_baixar_o_objeto(self):
+        conteudo = b'%PDF-1.4 teste'
+        upload = self.solicitar(self.colaborador, sha256=hashlib.sha256(conteudo).hexdigest())
+        self.enviar_com_checksum(upload, conteudo)
+        with mock.patch('storages.backends.s3.S3Storage._open', side_effect=AssertionError('download')):
+            despesa = self.criar_despesa_com_token(upload)
+        self.assertEqual(despesa.comprovante_hash, hashlib.sha256(conteudo).hexdigest())
+
+    def test_checksum_diferente_do_informado(self):
+        upload = self.solicitar(self.colaborador, sha256=hashlib.sha256(b'outro').hexdigest())
+        self.enviar_com_checksum(upload)
+        with self.assertRaisesMessage(uploads.UploadInvalido, 'não confere'):
+            uploads.validar_token(upload['token'], self.colaborador, 'despesa')
+
+    def test_sem_checksum_hash_fica_para_depois_do_commit(self):
+        conteudo = b'%PDF-1.4 sem checksum'
+        upload = self.solicitar(self.colaborador)
+        self.enviar(upload, conteudo)
+        with mock.patch('core.comprovantes.indexar_upload') as indexar_upload:
+            despesa = self.criar_despesa_com_token(upload)
+        self.assertEqual(despesa.comprovante_hash, '')
+        indexar_upload.assert_called_once_with(upload['chave'])
+
+        comprovantes.indexar_upload(upload['chave'])
+        despesa.refresh_from_db()
+        self.assertEqual(despesa.comprovante_hash, hashlib.sha256(conteudo).hexdigest())
+
+def imagem(nome='foto.png', cor='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), cor).save(buffer, format='PNG')
+    return SimpleUploadedFile(nome, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE, IMAGENS_EM_SEGUNDO_PLANO=False)
+class DerivadosDeImagemTests(OrganizacaoMixin, TestCase):
+    """Derivados acompanham o original: trocar o arquivo limpa os do anterior."""
+
+    def despesa_com_imagem(self, cor='red'):
+        with self.captureOnCommitCallbacks(execute=True):
+            despesa = criar_despesa(self.colaborador, self.viagem, comprovante=imagem('nota.png', cor))
+        despesa.refresh_from_db()
+        self.assertTrue(despesa.comprovante_miniatura.name.startswith(
+            imagens.prefixo_derivado(despesa.comprovante.name, 'miniatura')
+        ))
+        return despesa
+
+    def test_imagem_trocada_por_pdf_pela_api(self):
+        despesa = self.despesa_com_imagem()
+        pdf = SimpleUploadedFile('nota.pdf', b'%PDF-1.4 nota', content_type='application/pdf')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.cliente(self.colaborador).patch(
+                f'/api/despesas/{despesa.pk}/', {'comprovante': pdf}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        despesa.refresh_from_db()
+        self.assertTrue(despesa.comprovante.name.endswith('.pdf'))
+        self.assertFalse(despesa.comprovante_otimizado)
+        self.assertFalse(despesa.comprovante_miniatura)
+
+    def test_comprovante_trocado_com_update_fields(self):
+        # Mesmo caminho de confirmar_comprovante (upload direto já no storage).
+        despesa = self.despesa_com_imagem()
+        chave = despesa.comprovante.storage.save('comprovantes/direto.pdf', SimpleUploadedFile('x', b'%PDF direto'))
+        despesa.comprovante.name = chave
+        despesa.save(update_fields=[
+            'comprovante', 'comprovante_hash', 'comprovante_otimizado', 'comprovante_miniatura',
+            'status', 'atualizado_em',
+        ])
+        despesa.refresh_from_db()
+        self.assertFalse(despesa.comprovante_otimizado)
+        self.assertFalse(despesa.comprovante_miniatura)
+
+    def test_imagem_trocada_por_outra_imagem(self):
+        despesa = self.despesa_com_imagem()
+        antiga = despesa.comprovante_miniatura.name
+        despesa.comprovante = imagem('nova.png', 'blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            despesa.save()
+            self.assertFalse(Despesa.objects.get(pk=despesa.pk).comprovante_miniatura)
+        despesa.refresh_from_db()
+        self.assertNotEqual(despesa.comprovante_miniatura.name, antiga)
+        self.assertTrue(despesa.comprovante_miniatura.name.startswith(
+            imagens.prefixo_derivado(despesa.comprovante.name, 'miniatura')
+        ))
+
+    def test_mesmo_conteudo_reaproveita_derivados(self):
+        despesa = self.despesa_com_imagem()
+        outra = criar_despesa(self.gestor, self.viagem, comprovante=imagem('copia.png'))
+        self.assertEqual(outra.comprovante.name, despesa.comprovante.name)
+        self.assertEqual(outra.comprovante_miniatura.name, despesa.comprovante_miniatura.name)
+
+    def test_foto_de_perfil(self):
+        perfil = self.colaborador.perfil
+        perfil.foto_perfil = imagem('eu.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil.save()
+        perfil.refresh_from_db()
+        self.assertTrue(perfil.foto_perfil_miniatura)
+
+        perfil = PerfilUsuario.objects.get(pk=perfil.pk)
+        perfil.tipo = 'GESTOR'
+        perfil.save()
+        self.assertTrue(PerfilUsuario.objects.get(pk=perfil.pk).foto_perfil_miniatura)
+
+        perfil.foto_perfil = None
+        perfil.save()
+        perfil.refresh_from_db()
+        self.assertFalse(perfil.foto_perfil_otimizada)
+        self.assertFalse(perfil.foto_perfil_miniatura)
+
+
+class VersoesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_incrementar_troca_a_versao(self):
+        antes = versoes.atuais(['a', 'b'])
+        versoes.incrementar('a')
+        depois = versoes.atuais(['a', 'b'])
+        self.assertEqual(depois['a'], antes['a'] + 1)
+        self.assertEqual(depois['b'], antes['b'])
+
+    def test_versao_despejada_recomeca_de_valor_novo(self):
+        cache.set('a', 1, None)
+        versoes.incrementar('a')
+        cache.delete('a')
+        self.assertGreater(versoes.atuais(['a'])['a'], 2)
+        cache.delete('a')
+        versoes.incrementar('a')
+        self.assertGreater(cache.get('a'), 2)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class RelatorioDespesasTests(OrganizacaoMixin, TestCase):
+    """Exportação em streaming de /api/relatorios/despesas.csv|xlsx (core.relatorios)."""
+
+    def setUp(self):
+        super().setUp()
+        rh = Departamento.objects.create(nome='RH')
+        self.de_fora = criar_usuario('de_fora', 'COLABORADOR', [rh])
+        self.viagem.participantes.add(self.de_fora)
+        criar_despesa(self.colaborador, self.viagem, '10.00', descricao='=HYPERLINK("http://x")')
+        criar_despesa(self.gestor, self.viagem, '20.00')
+        criar_despesa(self.de_fora, self.viagem, '30.00')
+
+    def exportar(self, user, formato='csv', **params):
+        response = self.cliente(user).get(f'/api/relatorios/despesas.{formato}', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response.getvalue()
+
+    def usuarios(self, user):
+        linhas = list(csv.reader(StringIO(self.exportar(user).decode('utf-8-sig'))))[1:]
+        return sorted(linha[3] for linha in linhas)
+
+    def test_visibilidade(self):
+        self.assertEqual(self.usuarios(self.colaborador), ['colaborador'])
+        # O gestor vê o departamento dele; as próprias despesas vão para o diretor.
+        self.assertEqual(self.usuarios(self.gestor), ['colaborador'])
+        self.assertEqual(self.usuarios(self.admin), ['colaborador', 'de_fora', 'gestor'])
+
+    def test_csv_com_bom_e_formula_neutralizada(self):
+        conteudo = self.exportar(self.colaborador)
+        self.assertTrue(conteudo.startswith('\ufeff'.encode()))
+        descricao = list(csv.reader(StringIO(conteudo.decode('utf-8-sig'))))[1][7]
+        self.assertEqual(descricao, '\'=HYPERLINK("http://x")')
+
+    def test_filtro_invalido(self):
+        response = self.cliente(self.admin).get('/api/relatorios/despesas.csv', {'viagem': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_xlsx_com_datas_numericas(self):
+        aprovada = Despesa.objects.get(usuario=self.colaborador)
+        aprovada.status = 'APROVADO'
+        aprovada.data_aprovacao = timezone.make_aware(datetime(2024, 1, 5, 14, 30))
+        aprovada.save()
+
+        planilha = openpyxl.load_workbook(BytesIO(self.exportar(self.colaborador, 'xlsx'))).active
+        linhas = list(planilha.iter_rows(values_only=True))
+        self.assertEqual(linhas[0][:2], ('ID', 'Data'))
+        data, aprovacao = planilha.cell(row=2, column=2), planilha.cell(row=2, column=12)
+        self.assertTrue(data.is_date)
+        self.assertEqual(data.value, datetime(2024, 1, 1))
+        self.assertTrue(aprovacao.is_date)
+        self.assertEqual(aprovacao.value, datetime(2024, 1, 5, 14, 30))
+        self.assertEqual(linhas[1][8], 10)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class ResumoGeralTests(OrganizacaoMixin, TestCase):
+    """GET /api/viagens/resumo/ resume as mesmas viagens da listagem."""
+
+    def setUp(self):
+        super().setUp()
+        self.outra = Viagem.objects.create(titulo='Outra', data_inicio=date(2020, 1, 1), data_fim=date(2030, 1, 1))
+        de_fora = criar_usuario('de-fora', 'COLABORADOR')
+        self.outra.participantes.set([de_fora])
+        criar_despesa(de_fora, self.outra)
+        self.aprovada = Viagem.objects.create(titulo='Aprovada', data_inicio=date(2020, 1, 1), data_fim=date(2030, 1, 1))
+        self.aprovada.participantes.set([self.colaborador])
+        criar_despesa(self.colaborador, self.aprovada, status='APROVADO')
+        criar_despesa(self.colaborador, self.viagem)
+
+    def ids(self, user, url):
+        response = self.cliente(user).get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        resultados = response.data['results'] if isinstance(response.data, dict) else response.data
+        return {item['viagem'] if 'viagem' in item else item['id'] for item in resultados}
+
+    def test_mesmas_viagens_da_listagem(self):
+        for filtro in ('pendentes', 'todas'):
+            with self.subTest(filtro=filtro):
+                listagem = self.ids(self.gestor, f'/api/viagens/?filtro={filtro}')
+                self.assertEqual(self.ids(self.gestor, f'/api/viagens/resumo/?filtro={filtro}'), listagem)
+        self.assertEqual(self.ids(self.gestor, '/api/viagens/resumo/'), {self.viagem.pk})
+        self.assertEqual(self.ids(self.gestor, '/api/viagens/resumo/?filtro=todas'), {self.viagem.pk, self.aprovada.pk})
+
+
+def observacoes(histograma, *rotulos):
+    """(quantidade, soma) já registradas no histograma para os rótulos."""
+    _, soma, total = histograma._valores.get(rotulos, (None, 0, 0))
+    return total, soma
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class PainelViagemTests(OrganizacaoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alterada = criar_despesa(self.colaborador, self.viagem)
+        self.mantida = criar_despesa(self.colaborador, self.viagem)
+        criar_despesa(self.diretor, self.viagem)
+        # Tudo gravado bem antes da versão, fora da margem de MARGEM_PAINEL.
+        antes = timezone.now() - timedelta(hours=1)
+        for modelo in (Viagem, Despesa, SaldoUsuario):
+            modelo.objects.update(atualizado_em=antes)
+        self.versao = str(int((timezone.now() - timedelta(minutes=10)).timestamp() * 1_000_000))
+        self.url = f'/api/viagens/{self.viagem.pk}/painel/'
+
+    def painel(self, **params):
+        return self.cliente(self.admin).get(self.url, params)
+
+    def test_sem_since_envia_tudo(self):
+        resposta = self.painel()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.data['completo'])
+        self.assertEqual(resposta.data['viagem']['id'], self.viagem.pk)
+        self.assertEqual(len(resposta.data['participantes']), 3)
+        self.assertEqual(len(resposta.data['despesas']), 3)
+        self.assertNotIn('despesas_ids', resposta.data)
+
+    def test_since_envia_so_o_alterado(self):
+        self.alterada.valor = Decimal('25.00')
+        self.alterada.save()
+
+        resposta = self.painel(since=self.versao)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(resposta.data['completo'])
+        self.assertIsNone(resposta.data['viagem'])
+        self.assertEqual([d['id'] for d in resposta.data['despesas']], [self.alterada.pk])
+        self.assertEqual([p['id'] for p in resposta.data['participantes']], [self.colaborador.pk])
+        self.assertEqual(resposta.data['participantes'][0]['total_despesas'], Decimal('35.00'))
+        self.assertCountEqual(
+            resposta.data['participantes_ids'], [self.diretor.pk, self.gestor.pk, self.colaborador.pk]
+        )
+
+    def test_since_sem_alteracoes(self):
+        resposta = self.painel(since=self.versao)
+        self.assertIsNone(resposta.data['viagem'])
+        self.assertEqual(resposta.data['participantes'], [])
+        self.assertEqual(resposta.data['despesas'], [])
+        self.assertEqual(len(resposta.data['despesas_ids']), 3)
+
+    def test_viagem_alterada_volta_com_todos_os_participantes(self):
+        novo = criar_usuario('novo', 'COLABORADOR', [self.ti])
+        self.viagem.participantes.add(novo)
+
+        resposta = self.painel(since=self.versao)
+        self.assertEqual(resposta.data['viagem']['id'], self.viagem.pk)
+        self.assertEqual(len(resposta.data['participantes']), 4)
+        self.assertIn(novo.pk, resposta.data['participantes_ids'])
+
+    def test_participante_removido_pelo_lado_do_usuario(self):
+        self.colaborador.viagens.clear()
+
+        resposta = self.painel(since=self.versao)
+        self.assertIsNotNone(resposta.data['viagem'])
+        self.assertNotIn(self.colaborador.pk, resposta.data['participantes_ids'])
+
+    def test_despesa_excluida_sai_de_despesas_ids(self):
+        excluida = self.mantida.pk
+        self.mantida.delete()
+
+        resposta = self.painel(since=self.versao)
+        self.assertNotIn(excluida, resposta.data['despesas_ids'])
+        self.assertIn(self.alterada.pk, resposta.data['despesas_ids'])
+        self.assertEqual(resposta.data['despesas'], [])
+
+    def test_since_invalido_ou_futuro(self):
+        futuro = str(int((timezone.now() + timedelta(hours=1)).timestamp() * 1_000_000))
+        for since in ('abc', '1.5', '9' * 30, futuro):
+            with self.subTest(since=since):
+                self.assertEqual(self.painel(since=since).status_code, 400)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class PaginacaoCursorTests(OrganizacaoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Datas repetidas: o desempate por id é o que mantém as páginas estáveis.
+        for dia in (3, 1, 2, 1, 3, 1, 2):
+            despesa = criar_despesa(self.colaborador, self.viagem)
+            Despesa.objects.filter(pk=despesa.pk).update(data_despesa=date(2024, 1, dia))
+        self.esperado = list(Despesa.objects.order_by('data_despesa', 'id').values_list('id', flat=True))
+
+    def test_next_percorre_sem_repetir_nem_pular(self):
+        cliente = self.cliente(self.colaborador)
+        for tamanho in (1, 2, 3, 7):
+            with self.subTest(page_size=tamanho):
+                paginas = percorrer_paginas(cliente, '/api/despesas/', {'page_size': tamanho})
+                self.assertTrue(all(len(pagina) <= tamanho for pagina in paginas))
+                self.assertEqual([d['id'] for pagina in paginas for d in pagina], self.esperado)
+
+    def test_previous_volta_para_a_pagina_anterior(self):
+        cliente = self.cliente(self.colaborador)
+        primeira = cliente.get('/api/despesas/', {'page_size': 3}).data
+        segunda = cliente.get(primeira['next']).data
+        anterior = cliente.get(segunda['previous']).data
+        self.assertEqual([d['id'] for d in anterior['results']], [d['id'] for d in primeira['results']])
+
+    def test_page_size_limitado(self):
+        with mock.patch.object(CursorPadrao, 'max_page_size', 3):
+            resposta = self.cliente(self.colaborador).get('/api/despesas/', {'page_size': 1000})
+        self.assertEqual([d['id'] for d in resposta.data['results']], self.esperado[:3])
+
+    def test_formato_usado_por_listar_todos(self):
+        # listarTodos lê "results" e segue "next" sem repetir os parâmetros da primeira chamada.
+        resposta = self.cliente(self.gestor).get(
+            '/api/despesas/', {'viagem': self.viagem.pk, 'page_size': 2}
+        )
+        self.assertEqual(set(resposta.data), {'next', 'previous', 'results'})
+        self.assertIsNone(resposta.data['previous'])
+        self.assertTrue(resposta.data['next'].startswith('http://testserver/api/despesas/?'))
+        self.assertIn(f'viagem={self.viagem.pk}', resposta.data['next'])
+        paginas = percorrer_paginas(self.cliente(self.gestor), resposta.data['next'])
+        ids = [d['id'] for d in resposta.data['results']] + [d['id'] for pagina in paginas for d in pagina]
+        self.assertEqual(ids, self.esperado)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class StatusDinamicoTests(OrganizacaoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        hoje = date.today()
+        self.status = {self.viagem.pk: 'Ativa'}
+        periodos = [
+            ('Preparando', hoje + timedelta(days=10), hoje + timedelta(days=20), 'ATIVA'),
+            ('Preparando', hoje + timedelta(days=10), hoje + timedelta(days=15), 'ATIVA'),
+            ('Ativa', hoje, hoje, 'ATIVA'),
+            ('Ativa', hoje - timedelta(days=3), hoje + timedelta(days=3), 'ATIVA'),
+            ('Finalizada', hoje - timedelta(days=20), hoje - timedelta(days=10), 'ATIVA'),
+            ('Finalizada', hoje - timedelta(days=20), hoje - timedelta(days=1), 'CONCLUIDA'),
+            ('Cancelada', hoje + timedelta(days=10), hoje + timedelta(days=20), 'CANCELADA'),
+            ('Cancelada', hoje - timedelta(days=3), hoje + timedelta(days=3), 'CANCELADA'),
+        ]
+        for esperado, inicio, fim, status in periodos:
+            viagem = Viagem.objects.create(titulo=esperado, data_inicio=inicio, data_fim=fim, status=status)
+            self.status[viagem.pk] = esperado
+
+    def test_filtro_por_status_dinamico(self):
+        cliente = self.cliente(self.admin)
+        for valor in ViagemQuerySet.STATUS_DINAMICO:
+            with self.subTest(status_dinamico=valor):
+                viagens = sum(percorrer_paginas(cliente, '/api/viagens/', {'status_dinamico': valor}), [])
+                self.assertCountEqual(
+                    [v['id'] for v in viagens], [pk for pk, status in self.status.items() if status == valor]
+                )
+                self.assertTrue(all(v['status_dinamico'] == valor for v in viagens))
+
+    def test_ordenacao_estavel_entre_paginas(self):
+        cliente = self.cliente(self.admin)
+        for ordering in ('status_dinamico', '-status_dinamico'):
+            with self.subTest(ordering=ordering):
+                paginas = percorrer_paginas(cliente, '/api/viagens/', {'ordering': ordering, 'page_size': 2})
+                ids = [v['id'] for pagina in paginas for v in pagina]
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertCountEqual(ids, self.status)
+                # Empates em status_dinamico seguem a ordenação padrão (-data_inicio, -id).
+                inicio = dict(Viagem.objects.values_list('id', 'data_inicio'))
+                esperado = sorted(ids, key=lambda pk: (inicio[pk], pk), reverse=True)
+                esperado.sort(key=self.status.get, reverse=ordering.startswith('-'))
+                self.assertEqual(ids, esperado)
+
+    def test_status_dinamico_desconhecido(self):
+        resposta = self.cliente(self.admin).get('/api/viagens/', {'status_dinamico': 'Atrasada'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('Preparando', str(resposta.data['detail']))
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class ListagensEnxutasTests(OrganizacaoMixin, TestCase):
+    """*ListaSerializer e ORJSONRenderer com a mesma saída dos serializers e do renderer anteriores."""
+
+    def assertMesmoFormato(self, url):
+        cliente = self.cliente(self.gestor)
+        filtro = {'viagem': self.viagem.pk}
+        [item] = cliente.get(url, filtro).json()['results']
+        detalhe = cliente.get(f"{url}{item['id']}/", filtro).json()
+        # Só o autor muda de formato: resumo {id, nome, foto} no lugar do UserSerializer.
+        self.assertEqual(set(item['usuario_detalhes']), {'id', 'nome', 'foto'})
+        del item['usuario_detalhes'], detalhe['usuario_detalhes']
+        self.assertEqual(item, detalhe)
+        self.assertEqual({campo: type(valor) for campo, valor in item.items()},
+                         {campo: type(valor) for campo, valor in detalhe.items()})
+        return item
+
+    def test_despesa(self):
+        criar_despesa(self.colaborador, self.viagem, valor='12.50')
+        item = self.assertMesmoFormato('/api/despesas/')
+        self.assertEqual(item['valor'], '12.50')
+        self.assertTrue(item['comprovante'].startswith('https://'))
+        self.assertIsNone(item['comprovante_miniatura'])
+        self.assertIsNone(item['aprovador'])
+
+    def test_adiantamento(self):
+        Adiantamento.objects.create(
+            usuario=self.colaborador, viagem=self.viagem, valor=Decimal('100.00'),
+            comprovante_deposito=SimpleUploadedFile('deposito.pdf', b'pdf'),
+        )
+        item = self.assertMesmoFormato('/api/adiantamentos/')
+        self.assertEqual(item['valor'], '100.00')
+        self.assertEqual(item['viagem_titulo'], 'Viagem')
+        self.assertTrue(item['comprovante_deposito'].startswith('https://'))
+
+    def test_orjson_igual_ao_json_renderer(self):
+        criar_despesa(self.colaborador, self.viagem)
+        payload = {
+            'texto': 'ação "aspas" \\ / \u2028 \u2029 \x00 emoji 🎉',
+            'numeros': [0, -1, 2**53, 1.5, Decimal('10.00'), True, None],
+            'datas': [date(2024, 1, 2), timezone.now(), datetime(2024, 1, 2, 3, 4, 5, 123456)],
+            'chaves': {1: 'int', 'b': {'c': []}},
+            'despesas': self.cliente(self.gestor).get('/api/despesas/', {'viagem': self.viagem.pk}).data,
+        }
+        self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class MetricasTests(OrganizacaoMixin, TestCase):
+
+    def test_requisicao_sincrona(self):
+        antes = observacoes(metricas.CONSULTAS, 'user-list', 'GET')
+        renderizadas = observacoes(metricas.RENDERIZACAO, 'user-list', 'GET')[0]
+        self.cliente(self.admin).get('/api/users/')
+        total, soma = observacoes(metricas.CONSULTAS, 'user-list', 'GET')
+        self.assertEqual(total, antes[0] + 1)
+        self.assertGreater(soma, antes[1])
+        self.assertEqual(observacoes(metricas.RENDERIZACAO, 'user-list', 'GET')[0], renderizadas + 1)
+
+    async def test_middleware_assincrono(self):
+        async def vista(request):
+            await User.objects.acount()
+            await User.objects.filter(is_staff=True).aexists()
+            return HttpResponse('ok')
+
+        middleware = metricas.MetricasMiddleware(vista)
+        self.assertTrue(iscoroutinefunction(middleware))
+        antes = observacoes(metricas.CONSULTAS, 'sem_rota', 'PATCH')
+        response = await middleware(AsyncRequestFactory().patch('/qualquer'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(observacoes(metricas.CONSULTAS, 'sem_rota', 'PATCH'), (antes[0] + 1, antes[1] + 2))
+
+    def test_middleware_sincrono(self):
+        middleware = metricas.MetricasMiddleware(lambda request: HttpResponse('ok'))
+        self.assertFalse(iscoroutinefunction(middleware))
+
+    @override_settings(METRICAS_TOKEN=None)
+    def test_metrics_sem_token_so_equipe(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.colaborador)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.admin)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'prestacao_requisicao_renderizacao_segundos', response.content)
+
+    @override_settings(METRICAS_TOKEN='segredo')
+    def test_serializacao_exportada_separada_da_renderizacao(self):
+        def serie(texto, sufixo):
+            rotulos = re.escape('{view="despesa-list",metodo="GET"}')
+            achado = re.search(rf'^prestacao_requisicao_serializacao_segundos_{sufixo}{rotulos} (\S+)$', texto, re.M)
+            return float(achado.group(1)) if achado else 0.0
+
+        def raspar():
+            return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').content.decode()
+
+        antes = raspar()
+        for valor in ('10.00', '20.00', '30.00'):
+            criar_despesa(self.colaborador, self.viagem, valor)
+        response = self.cliente(self.colaborador).get('/api/despesas/')
+        self.assertEqual(len(response.json()['results']), 3)
+
+        depois = raspar()
+        self.assertEqual(serie(depois, 'count'), serie(antes, 'count') + 1)
+        self.assertGreater(serie(depois, 'sum'), serie(antes, 'sum'))
+        self.assertIn('prestacao_requisicao_renderizacao_segundos_count{view="despesa-list",metodo="GET"}', depois)
+
+    @override_settings(METRICAS_TOKEN='segredo')
+    def test_metrics_com_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer errado').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class FilaAprovacaoTests(OrganizacaoMixin, TestCase):
+    """Caixa de entrada dos aprovadores (core.fila) mantida pelos sinais e pelas transições."""
+
+    def linhas(self, despesa=None):
+        linhas = FilaAprovacao.objects.all()
+        if despesa is not None:
+            linhas = linhas.filter(despesa=despesa)
+        return sorted(linhas.values_list('aprovador_id', 'despesa_id'))
+
+    def test_despesa_pendente_entra_na_fila_do_aprovador(self):
+        do_colaborador = criar_despesa(self.colaborador, self.viagem)
+        do_gestor = criar_despesa(self.gestor, self.viagem)
+        self.assertEqual(self.linhas(do_colaborador), [(self.gestor.pk, do_colaborador.pk)])
+        self.assertEqual(self.linhas(do_gestor), [(self.diretor.pk, do_gestor.pk)])
+
+    def test_aprovar_e_rejeitar_removem_da_fila(self):
+        aprovada, rejeitada, em_lote = (criar_despesa(self.colaborador, self.viagem) for _ in range(3))
+        cliente = self.cliente(self.gestor)
+        self.assertEqual(cliente.post(f'/api/despesas/{aprovada.pk}/aprovar/').status_code, 200)
+        response = cliente.post(
+            f'/api/despesas/{rejeitada.pk}/rejeitar/', {'observacao_rejeicao': 'Sem nota'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cliente.post('/api/despesas/aprovar-lote/', {'ids': [em_lote.pk]}, format='json').status_code, 200)
+        self.assertEqual(self.linhas(), [])
+
+    def test_rejeitar_lote_e_edicao_devolvem_a_fila(self):
+        despesa = criar_despesa(self.colaborador, self.viagem)
+        response = self.cliente(self.gestor).post(
+            '/api/despesas/rejeitar-lote/', {'ids': [despesa.pk], 'observacao_rejeicao': 'Valor errado'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.linhas(), [])
+
+        # REJEITADO -> PENDENTE pela edição do dono.
+        response = self.cliente(self.colaborador).patch(f'/api/despesas/{despesa.pk}/', {'valor': '12.00'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Despesa.objects.get(pk=despesa.pk).status, 'PENDENTE')
+        self.assertEqual(self.linhas(), [(self.gestor.pk, despesa.pk)])
+
+    def test_novo_gestor_pelo_user_serializer_recebe_a_fila(self):
+        despesa = criar_despesa(self.colaborador, self.viagem)
+        novo_gestor = criar_usuario('novo_gestor', 'COLABORADOR')
+        # UserSerializer.update troca o gestor com update() em Departamento, que não dispara sinais.
+        response = self.cliente(self.admin).patch(
+            f'/api/users/{novo_gestor.pk}/', {'perfil': {'tipo': 'GESTOR', 'departamentos': [self.ti.pk]}}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Departamento.objects.get(pk=self.ti.pk).gestor_id, novo_gestor.pk)
+        self.assertEqual(self.linhas(despesa), [(novo_gestor.pk, despesa.pk)])
+
+    def test_gestor_rebaixado_perde_a_fila(self):
+        do_colaborador = criar_despesa(self.colaborador, self.viagem)
+        do_gestor = criar_despesa(self.gestor, self.viagem)
+        perfil = self.gestor.perfil
+        perfil.tipo = 'COLABORADOR'
+        perfil.save()
+        # O departamento fica sem gestor válido: nenhuma das duas tem aprovador.
+        self.assertEqual(self.linhas(do_colaborador), [])
+        self.assertEqual(self.linhas(do_gestor), [])
+
+    def test_excluir_departamento(self):
+        despesa = criar_despesa(self.colaborador, self.viagem)
+        self.assertEqual(self.linhas(despesa), [(self.gestor.pk, despesa.pk)])
+        self.ti.delete()
+        self.assertEqual(self.linhas(despesa), [])
+
+    def test_reconciliar_refaz_a_fila(self):
+        pendente = criar_despesa(self.colaborador, self.viagem)
+        aprovada = criar_despesa(self.colaborador, self.viagem)
+        Despesa.objects.filter(pk=aprovada.pk).update(status='APROVADO')
+        FilaAprovacao.objects.filter(despesa=pendente).delete()
+        FilaAprovacao.objects.create(aprovador=self.diretor, despesa=pendente)
+
+        fila.reconciliar()
+        self.assertEqual(self.linhas(), [(self.gestor.pk, pendente.pk)])
+
+
+WHITENOISE = 'whitenoise.middleware.WhiteNoiseMiddleware'
+# settings.MIDDLEWARE com SERVIDOR_ASGI (backend_prestacao/asgi.py).
+MIDDLEWARE_ASGI = [middleware for middleware in settings.MIDDLEWARE if middleware != WHITENOISE]
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class DeployAsgiTests(OrganizacaoMixin, TestCase):
+
+    def test_cadeia_sem_adaptacao_para_sincrono(self):
+        # O Django registra em django.request (com DEBUG) cada middleware que obriga a trocar de modo.
+        with override_settings(MIDDLEWARE=MIDDLEWARE_ASGI, DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+        with override_settings(MIDDLEWARE=[*MIDDLEWARE_ASGI, WHITENOISE], DEBUG=True):
+            with self.assertLogs('django.request', 'DEBUG') as logs:
+                ASGIHandler().load_middleware(is_async=True)
+        self.assertIn('WhiteNoiseMiddleware', '\n'.join(logs.output))
+
+    def test_sem_conexoes_persistentes(self):
+        # settings lido de novo, num processo à parte, com as variáveis do deploy.
+        ambiente = {**os.environ, 'RENDER': '1', 'DATABASE_URL': 'postgres://u:s@banco/prestacao', 'DB_CONN_MAX_AGE': '600'}
+        codigo = "from backend_prestacao import settings; print(settings.DATABASES['default']['CONN_MAX_AGE'])"
+        for asgi, esperado in (('', '600'), ('1', '0')):
+            with self.subTest(SERVIDOR_ASGI=asgi):
+                saida = subprocess.run(
+                    [sys.executable, '-c', codigo], env={**ambiente, 'SERVIDOR_ASGI': asgi},
+                    cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+                )
+                self.assertEqual(saida.stdout.strip(), esperado)
+
+    @override_settings(MIDDLEWARE=MIDDLEWARE_ASGI)
+    async def test_view_assincrona_com_metricas(self):
+        await self.async_client.aforce_login(self.gestor)
+        antes = observacoes(metricas.CONSULTAS, 'despesa-para-aprovacao-contagem', 'GET')
+        response = await self.async_client.get('/api/despesas-para-aprovacao/contagem/')
+        self.assertEqual(response.status_code, 200)
+        total, soma = observacoes(metricas.CONSULTAS, 'despesa-para-aprovacao-contagem', 'GET')
+        self.assertEqual(total, antes[0] + 1)
+        self.assertGreater(soma, antes[1])
+
+
+class ArquivosEstaticosTests(TestCase):
+
+    async def requisitar(self, app, caminho):
+        comunicador = ApplicationCommunicator(app, {
+            'type': 'http', 'method': 'GET', 'path': caminho, 'query_string': b'', 'headers': [],
+            'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+        })
+        await comunicador.send_input({'type': 'http.request', 'body': b''})
+        inicio = await comunicador.receive_output(5)
+        corpo = b''
+        while True:
+            mensagem = await comunicador.receive_output(5)
+            corpo += mensagem.get('body', b'')
+            if not mensagem.get('more_body'):
+                await comunicador.send_input({'type': 'http.disconnect'})
+                await comunicador.wait(5)
+                return inicio['status'], corpo
+
+    async def test_estaticos_fora_do_django(self):
+        async def django(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'django'})
+
+        with tempfile.TemporaryDirectory() as raiz:
+            conteudo = b'console.log(1);' * 10_000
+            with open(f'{raiz}/app.js', 'wb') as arquivo:
+                arquivo.write(conteudo)
+            with override_settings(STATIC_ROOT=raiz, STATIC_URL='/static/', DEBUG=False):
+                app = ArquivosEstaticos(django)
+                self.assertEqual(await self.requisitar(app, '/static/app.js'), (200, conteudo))
+                self.assertEqual((await self.requisitar(app, '/static/nao-existe.js'))[0], 404)
+                self.assertEqual(await self.requisitar(app, '/api/viagens/'), (200, b'django'))
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class EtagMeTests(OrganizacaoMixin, TestCase):
+    """ETag de GET /api/users/me/ (core.assincronas.me)."""
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.colaborador)
+
+    def get(self, etag=None):
+        cabecalhos = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        if etag:
+            cabecalhos['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get('/api/users/me/', **cabecalhos)
+
+    def test_if_none_match_devolve_304(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+
+        revalidada = self.get(etag)
+        self.assertEqual(revalidada.status_code, 304)
+        self.assertEqual(revalidada.content, b'')
+        self.assertEqual(revalidada['ETag'], etag)
+        self.assertEqual(revalidada['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.get('"outro"').status_code, 200)
+
+    def test_perfil_alterado_muda_o_etag(self):
+        etag = self.get()['ETag']
+        self.colaborador.first_name = 'Maria'
+        self.colaborador.save()
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['first_name'], 'Maria')
+
+    def test_saldo_alterado_muda_o_etag(self):
+        etag = self.get()['ETag']
+        Adiantamento.objects.create(usuario=self.colaborador, viagem=self.viagem, valor=Decimal('100.00'))
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(Decimal(response.json()['saldo']), Decimal('100.00'))
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class AutenticacaoTests(OrganizacaoMixin, TestCase):
+    """Usuário autenticado por token em cache (core.autenticacao)."""
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.gestor)
+
+    def get(self, url='/api/users/me/'):
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cache_nao_guarda_o_hash_da_senha(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(autenticacao.usuario_do_token(self.token.key).pk, self.gestor.pk)
+        senha = User.objects.get(pk=self.gestor.pk).password
+        self.assertNotIn(senha.encode(), pickle.dumps(cache.get(autenticacao._chave(self.token.key))))
+
+    def test_usuario_reconstruido_do_cache(self):
+        autenticacao.usuario_do_token(self.token.key)
+        with self.assertNumQueries(0):
+            user = autenticacao.usuario_do_token(self.token.key)
+            self.assertEqual((user.username, user.perfil.tipo), ('gestor', 'GESTOR'))
+            self.assertEqual(user.auth_token.key, self.token.key)
+        # A senha só é lida se for pedida, e do banco.
+        self.assertTrue(user.check_password('x'))
+
+    def test_usuario_sem_perfil(self):
+        token = Token.objects.create(user=self.admin)
+        autenticacao.usuario_do_token(token.key)
+        with self.assertNumQueries(0):
+            user = autenticacao.usuario_do_token(token.key)
+            self.assertIsNone(getattr(user, 'perfil', None))
+            self.assertTrue(user.is_superuser)
+
+    @override_settings(TOKEN_VALIDADE=3600)
+    def test_renovar_estende_o_mesmo_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.get().status_code, 200)
+        Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - timedelta(minutes=59))
+        autenticacao.invalidar_tokens(self.token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/login/renovar/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], self.token.key)
+        self.assertGreater(Token.objects.get(pk=self.token.pk).created, timezone.now() - timedelta(minutes=1))
+        # Outro dispositivo com o mesmo token continua autenticado após o prazo antigo.
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(minutes=30)):
+            self.assertEqual(self.get().status_code, 200)
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE, ORGANIZACAO_MAXIMO_REQUISICAO=3)
+class ImportacaoOrganizacaoTests(OrganizacaoMixin, TestCase):
+    """POST /api/users/importar/ (core.organizacao)."""
+
+    registros = [
+        {'username': 'ana', 'senha': 's3nha', 'tipo': 'GESTOR', 'departamentos': ['Vendas']},
+        {'username': 'bia', 'departamentos': ['Vendas']},
+    ]
+
+    def importar(self, registros):
+        return self.cliente(self.admin).post('/api/users/importar/', registros, format='json')
+
+    def test_importa_sem_pool_de_processos_e_invalida_apos_o_commit(self):
+        antes = hierarchy.versao()
+        with mock.patch('core.organizacao.ProcessPoolExecutor', side_effect=AssertionError):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.importar(self.registros)
+                self.assertEqual(hierarchy.versao(), antes)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['criados'], 2)
+        self.assertEqual(Departamento.objects.get(nome='Vendas').gestor.username, 'ana')
+        self.assertTrue(User.objects.get(username='ana').check_password('s3nha'))
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(hierarchy.versao(), antes)
+
+    def test_importacao_acima_do_limite_vai_pelo_comando(self):
+        registros = [{'username': f'u{i}'} for i in range(4)]
+        response = self.importar(registros)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(User.objects.filter(username__startswith='u').exists())
+
+    def test_falha_no_meio_nao_deixa_importacao_parcial(self):
+        with mock.patch('core.organizacao.fila.sincronizar_donos', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                organizacao.importar(self.registros, processos=1, lote=1)
+        self.assertFalse(User.objects.filter(username__in=['ana', 'bia']).exists())
+        self.assertFalse(Departamento.objects.filter(nome='Vendas').exists())
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class EnvioEmLoteTests(OrganizacaoMixin, TestCase):
+    """POST /api/despesas/lote/: um item reenviado não cria outra despesa."""
+
+    def enviar(self, *ids_cliente):
+        itens = [
+            {'id_cliente': id_cliente, 'viagem': self.viagem.pk, 'valor': '12.50',
+             'data_despesa': '2024-01-01', 'descricao': 'Táxi'}
+            for id_cliente in ids_cliente
+        ]
+        arquivos = {f'comprovante_{id_cliente}': SimpleUploadedFile(f'{id_cliente}.pdf', id_cliente.encode())
+                    for id_cliente in ids_cliente}
+        return self.cliente(self.colaborador).post(
+            '/api/despesas/lote/', {'despesas': json.dumps(itens), **arquivos}, format='multipart'
+        )
+
+    def test_reenvio_devolve_a_despesa_criada(self):
+        primeira = self.enviar('a').json()['resultados'][0]
+        response = self.enviar('a', 'b')
+        self.assertEqual(response.status_code, 201)
+        reenvio, nova = response.json()['resultados']
+        self.assertEqual((reenvio['id'], reenvio['duplicada']), (primeira['id'], True))
+        self.assertNotIn('duplicada', nova)
+        self.assertEqual(Despesa.objects.filter(usuario=self.colaborador).count(), 2)
+
+    def test_envio_simultaneo_do_mesmo_item_cria_uma_despesa(self):
+        item = {
+            'id_cliente': 'a', 'viagem_id': self.viagem.pk, 'valor': Decimal('12.50'),
+            'data_despesa': date(2024, 1, 1), 'descricao': 'Táxi', 'comprovante': 'comprovantes/a.pdf',
+        }
+        (anterior,), _ = envio_lote.criar(self.colaborador, [item])
+        # A leitura do outro envio aconteceu antes deste commit: o INSERT esbarra na constraint.
+        ler = envio_lote.enviadas
+        with mock.patch('core.envio_lote.enviadas', side_effect=[{}, ler(self.colaborador, ['a'])]):
+            despesas, anteriores = envio_lote.criar(self.colaborador, [item])
+        self.assertEqual((despesas, anteriores), ([], {'a': anterior.pk}))
+        self.assertEqual(Despesa.objects.filter(usuario=self.colaborador).count(), 1)
+        self.assertEqual(SaldoUsuario.objects.get(usuario=self.colaborador, viagem=self.viagem).total_despesas,
+                         Decimal('12.50'))
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE, IMAGENS_EM_SEGUNDO_PLANO=False)
+class DuplicatasTests(OrganizacaoMixin, TestCase):
+    """O aviso de duplicatas só mostra despesas que quem envia pode ver."""
+
+    def enviar(self, user, conteudo):
+        response = self.cliente(user).post('/api/despesas/', {
+            'viagem': self.viagem.pk, 'valor': '30.00', 'data_despesa': '2024-02-01', 'descricao': 'Hotel',
+            'comprovante': SimpleUploadedFile('nota.pdf', conteudo),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def test_duplicatas_limitadas_as_despesas_visiveis(self):
+        do_diretor = self.enviar(self.diretor, b'mesmo conteudo')['id']
+        do_colaborador = self.enviar(self.colaborador, b'mesmo conteudo')
+        # O colaborador não vê a despesa do diretor.
+        self.assertEqual(do_colaborador['duplicatas'], [])
+
+        do_gestor = self.enviar(self.gestor, b'mesmo conteudo')
+        self.assertEqual(do_gestor['duplicatas'], [{'id': do_colaborador['id'], 'motivo': 'comprovante'}])
+
+        do_admin = self.enviar(self.admin, b'mesmo conteudo')
+        self.assertEqual(
+            [duplicata['id'] for duplicata in do_admin['duplicatas']],
+            [do_diretor, do_colaborador['id'], do_gestor['id']],
+        )
+
+
+def em_paralelo(*funcoes):
+    """Roda as funções em threads liberadas ao mesmo tempo e devolve os resultados."""
+    barreira = threading.Barrier(len(funcoes))
+    resultados = [None] * len(funcoes)
+
+    def rodar(i, funcao):
+        try:
+            barreira.wait()
+            resultados[i] = funcao()
+        except Exception as exc:
+            resultados[i] = exc
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=rodar, args=(i, funcao)) for i, funcao in enumerate(funcoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for resultado in resultados:
+        if isinstance(resultado, Exception):
+            raise resultado
+    return resultados
+
+
+@override_settings(STORAGES=STORAGES_TESTE, PASSWORD_HASHERS=HASHERS_TESTE)
+class ConcorrenciaTests(OrganizacaoMixin, TransactionTestCase):
+    """Requisições simultâneas de verdade, cada uma na sua thread e conexão."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('As threads precisam de um banco de teste em arquivo.')
+        super().setUp()
+
+    def assertSaldosConferem(self):
+        saida = StringIO()
+        call_command('reconstruir_saldos', '--verificar', stdout=saida)
+        self.assertIn('0 saldo(s) divergente(s)', saida.getvalue())
+
+    def post(self, user, url, dados):
+        return lambda: self.cliente(user).post(url, dados, format='json')
+
+    def test_aprovacao_concorrente_tem_um_vencedor_por_despesa(self):
+        ids = [criar_despesa(self.colaborador, self.viagem).pk for _ in range(6)]
+        respostas = em_paralelo(
+            self.post(self.gestor, '/api/despesas/aprovar-lote/', {'ids': ids}),
+            self.post(self.admin, '/api/despesas/rejeitar-lote/', {'ids': ids, 'observacao_rejeicao': 'Não'}),
+            self.post(self.admin, '/api/despesas/aprovar-lote/', {'ids': ids}),
+        )
+        vencedores = {}
+        for indice, response in enumerate(respostas):
+            self.assertEqual(response.status_code, 200, response.content)
+            for resultado in response.data['resultados']:
+                if resultado['sucesso']:
+                    self.assertNotIn(resultado['id'], vencedores)
+                    vencedores[resultado['id']] = indice
+        self.assertEqual(set(vencedores), set(ids))
+
+        esperado = {0: ('APROVADO', self.gestor.pk), 1: ('REJEITADO', self.admin.pk), 2: ('APROVADO', self.admin.pk)}
+        for pk, status_, aprovador in Despesa.objects.filter(pk__in=ids).values_list('pk', 'status', 'aprovador'):
+            self.assertEqual((status_, aprovador), esperado[vencedores[pk]])
+        self.assertFalse(FilaAprovacao.objects.filter(despesa_id__in=ids).exists())
+        self.assertSaldosConferem()
+
+    def test_lancamentos_concorrentes_no_mesmo_saldo(self):
+        # A linha de saldo ainda não existe: todas as threads tentam criá-la.
+        def lote(valor):
+            item = {
+                'viagem_id': self.viagem.pk, 'valor': Decimal(valor), 'data_despesa': date(2024, 1, 1),
+                'descricao': 'Táxi', 'comprovante': f'comprovantes/{valor}.pdf', 'comprovante_hash': valor,
+            }
+            return lambda: envio_lote.criar(self.gestor, [item, dict(item, valor=Decimal('1.00'))])
+
+        def adiantamento():
+            return Adiantamento.objects.create(usuario=self.gestor, viagem=self.viagem, valor=Decimal('100.00'))
+
+        em_paralelo(*[lote(f'{i}.25') for i in range(1, 6)], *[adiantamento for _ in range(3)])
+
+        esperado = (Decimal('21.25'), Decimal('300.00'))
+        for viagem in (self.viagem, None):
+            saldo = SaldoUsuario.objects.get(usuario=self.gestor, viagem=viagem)
+            self.assertEqual((saldo.total_despesas, saldo.total_adiantamentos), esperado)
+        self.assertSaldosConferem()
+
+    def test_edicao_concorrente_com_aprovacao(self):
+        if not connection.features.has_select_for_update:
+            # No SQLite a trava é do banco inteiro: a edição (leitura e depois
+            # escrita) concorrente falha com "database is locked".
+            self.skipTest('Banco sem SELECT ... FOR UPDATE.')
+        for _ in range(5):
+            despesa = criar_despesa(self.colaborador, self.viagem, valor='10.00')
+            edicao, aprovacao = em_paralelo(
+                lambda: self.cliente(self.colaborador).patch(
+                    f'/api/despesas/{despesa.pk}/', {'valor': '99.00'}, format='json'
+                ),
+                self.post(self.gestor, '/api/despesas/aprovar-lote/', {'ids': [despesa.pk]}),
+            )
+            despesa.refresh_from_db()
+            aprovada = aprovacao.data['processadas'] == 1
+            # A aprovação nunca é desfeita pela edição; a edição só passa antes dela.
+            self.assertEqual(despesa.status, 'APROVADO' if aprovada else 'PENDENTE')
+            if edicao.status_code == 200:
+                self.assertEqual(despesa.valor, Decimal('99.00'))
+            else:
+                self.assertEqual(edicao.status_code, 403, edicao.content)
+                self.assertTrue(aprovada)
+                self.assertEqual(despesa.valor, Decimal('10.00'))
+        self.assertSaldosConferem()
@@ -0,0 +1,125 @@
+"""
+Upload direto para o bucket (S3/Supabase) com POST pré-assinado e token que
+amarra a chave ao usuário e ao destino.
+"""
+import base64
+import os
+import re
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from storages.utils import clean_name
+
+from .models import Adiantamento, Despesa
+
+SALT = 'core.uploads'
+
+# destino -> (model, campo de arquivo)
+DESTINOS = {
+    'despesa': (Despesa, 'comprovante'),
+    'adiantamento': (Adiantamento, 'comprovante_deposito'),
+}
+
+
+class UploadInvalido(Exception):
+    pass
+
+
+def _campo(destino):
+    if destino not in DESTINOS:
+        raise UploadInvalido(f"Destino inválido. Use um de: {', '.join(DESTINOS)}.")
+    model, nome_campo = DESTINOS[destino]
+    return model._meta.get_field(nome_campo)
+
+
+def _cabecalho(storage, chave):
+    # HEAD do objeto, com o checksum guardado no upload; None se não existir.
+    client = storage.connection.meta.client
+    try:
+        return client.head_object(
+            Bucket=storage.bucket_name, Key=storage._normalize_name(clean_name(chave)), ChecksumMode='ENABLED'
+        )
+    except ClientError as exc:
+        if exc.response['ResponseMetadata']['HTTPStatusCode'] == 404:
+            return None
+        raise
+
+
+def _sha256_do_cabecalho(cabecalho):
+    checksum = cabecalho.get('ChecksumSHA256')
+    # Objetos multipart têm checksum composto ("...-N"), que não é o do conteúdo.
+    if not checksum or '-' in checksum:
+        return None
+    return base64.b64decode(checksum).hex()
+
+
+def sha256_armazenado(storage, chave):
+    """
+    SHA-256 (hexadecimal) que o bucket conferiu no upload com checksum, sem
+    baixar o objeto; None se o upload foi feito sem checksum.
+    """
+    cabecalho = _cabecalho(storage, chave)
+    return _sha256_do_cabecalho(cabecalho) if cabecalho else None
+
+
+def gerar_upload(user, destino, nome_arquivo, content_type, sha256=None):
+    """
+    POST pré-assinado para o bucket. Com `sha256` (hexadecimal) o POST exige o
+    checksum: o S3 recusa um conteúdo diferente e guarda o hash, que
+    core.comprovantes lê sem baixar o arquivo.
+    """
+    campo = _campo(destino)
+    storage = campo.storage
+    if not hasattr(storage, 'bucket_name'):
+        raise UploadInvalido('O armazenamento configurado não suporta upload direto.')
+
+    nome_base = os.path.basename(nome_arquivo or '') or 'arquivo'
+    chave = campo.generate_filename(None, f"{uuid.uuid4().hex}_{nome_base}")
+    content_type = content_type or 'application/octet-stream'
+    campos = {'Content-Type': content_type}
+    if sha256:
+        sha256 = str(sha256).lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            raise UploadInvalido('sha256 deve ser o SHA-256 do arquivo em hexadecimal.')
+        campos['x-amz-checksum-sha256'] = base64.b64encode(bytes.fromhex(sha256)).decode()
+
+    client = storage.connection.meta.client
+    post = client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=storage._normalize_name(clean_name(chave)),
+        Fields=campos,
+        Conditions=[
+            *({nome: valor} for nome, valor in campos.items()),
+            ['content-length-range', 1, settings.UPLOAD_DIRETO_TAMANHO_MAXIMO],
+        ],
+        ExpiresIn=settings.UPLOAD_DIRETO_EXPIRACAO,
+    )
+    dados = {'chave': chave, 'usuario': user.pk, 'destino': destino}
+    if sha256:
+        dados['sha256'] = sha256
+    token = signing.dumps(dados, salt=SALT)
+    return {'url': post['url'], 'campos': post['fields'], 'chave': chave, 'token': token}
+
+
+def validar_token(token, user, destino):
+    """Confere o token e se o objeto já está no bucket; devolve a chave."""
+    try:
+        dados = signing.loads(token, salt=SALT, max_age=settings.UPLOAD_DIRETO_EXPIRACAO * 2)
+    except signing.BadSignature:
+        raise UploadInvalido('Token de upload inválido ou expirado.')
+
+    if dados.get('usuario') != user.pk or dados.get('destino') != destino:
+        raise UploadInvalido('Token de upload não pertence a este usuário ou destino.')
+
+    chave = dados['chave']
+    cabecalho = _cabecalho(_campo(destino).storage, chave)
+    if cabecalho is None:
+        raise UploadInvalido('Arquivo ainda não foi enviado ao armazenamento.')
+    # Bucket que ignora o checksum do POST (sem ChecksumSHA256): o hash é
+    # calculado depois, em segundo plano (core.comprovantes).
+    armazenado = _sha256_do_cabecalho(cabecalho)
+    if dados.get('sha256') and armazenado and armazenado != dados['sha256']:
+        raise UploadInvalido('O arquivo enviado não confere com o sha256 informado.')
+    return chave
@@ -1,12 +1,16 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 # Importe as novas funções
 from .views import (
     ViagemViewSet, AdiantamentoViewSet, DespesaViewSet, UserViewSet,
     aprovar_despesa, rejeitar_despesa,
+    aprovar_despesas_lote, rejeitar_despesas_lote, enviar_despesas_lote,
+    solicitar_upload, confirmar_comprovante,
+    relatorio_despesas, marcar_fila_lida,
+    login, renovar_token,
     DepartamentoViewSet,
-    DespesasParaAprovacaoView # <<< 1. IMPORTAR A NOVA VIEW
 )
+from . import assincronas
 
 # 1. Roteador Automático
 router = DefaultRouter()
@@ -30,6 +34,16 @@ despesa_detail = DespesaViewSet.as_view({
 
 # 3. Lista Final de URLs
 urlpatterns = [
+    # Views assíncronas (core.assincronas); users/me/ precisa vir antes do roteador
+    path('users/me/', assincronas.me, name='user-me'),
+    path('despesas-para-aprovacao/', assincronas.despesas_para_aprovacao, name='despesa-para-aprovacao'),
+    path('despesas-para-aprovacao/contagem/', assincronas.contagem_fila, name='despesa-para-aprovacao-contagem'),
+    path('despesas-para-aprovacao/lidas/', marcar_fila_lida, name='despesa-para-aprovacao-lidas'),
+
+    # Login com o payload de users/me/ e renovação do token
+    path('login/', login, name='login'),
+    path('login/renovar/', renovar_token, name='login-renovar'),
+
     # Rotas do roteador
     path('', include(router.urls)), 
     
@@ -40,9 +54,14 @@ urlpatterns = [
     # Rotas de Ação (apontando para as novas funções)
     path('despesas/<int:pk>/aprovar/', aprovar_despesa, name='despesa-aprovar'),
     path('despesas/<int:pk>/rejeitar/', rejeitar_despesa, name='despesa-rejeitar'),
-    
-    # --- INÍCIO DA MUDANÇA ---
-    # 2. ADICIONAR A NOVA ROTA
-    path('despesas-para-aprovacao/', DespesasParaAprovacaoView.as_view(), name='despesa-para-aprovacao'),
-    # --- FIM DA MUDANÇA ---
+    path('despesas/aprovar-lote/', aprovar_despesas_lote, name='despesa-aprovar-lote'),
+    path('despesas/rejeitar-lote/', rejeitar_despesas_lote, name='despesa-rejeitar-lote'),
+    path('despesas/lote/', enviar_despesas_lote, name='despesa-lote'),
+    path('despesas/<int:pk>/comprovante/', confirmar_comprovante, name='despesa-comprovante'),
+
+    # Upload direto para o bucket (URL pré-assinada)
+    path('uploads/', solicitar_upload, name='upload-solicitar'),
+
+    # Relatórios (exportação em streaming)
+    re_path(r'^relatorios/despesas\.(?P<formato>csv|xlsx)$', relatorio_despesas, name='relatorio-despesas'),
 ]
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""
+Contadores de versão no cache. As chaves de um cache derivado levam a versão
+atual; incrementar a versão invalida todas elas de uma vez.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def incrementar(*chaves):
+    for chave in set(chaves):
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, int(time.time()), None)
+
+
+def atuais(chaves):
+    """{chave: versão}, numa leitura só do cache."""
+    encontradas = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in encontradas:
+            # Começa de um valor novo para não reaproveitar entradas antigas
+            # caso a chave de versão tenha sido despejada do cache.
+            cache.add(chave, int(time.time()), None)
+            encontradas[chave] = cache.get(chave)
+    return encontradas
@@ -1,27 +1,72 @@
 from django.contrib.auth.models import User
-from rest_framework import viewsets, permissions, status, generics
-from django.db.models import Q
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, action
 from rest_framework.response import Response
+from rest_framework.exceptions import ParseError, PermissionDenied
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from rest_framework.authtoken.views import ObtainAuthToken
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
-from decimal import Decimal
-from .models import Departamento, Viagem, Adiantamento, Despesa
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from .models import Departamento, PerfilUsuario, Viagem, ViagemQuerySet, Adiantamento, Despesa, SaldoUsuario, FilaAprovacao
+from . import autenticacao, comprovantes, envio_lote, fila, organizacao, relatorios, respostas, resumos, uploads
+from .idempotencia import idempotente
+from .respostas import RespostaEmCacheMixin
+from .hierarchy import subordinados_ids
+from .prefetch import (
+    usuarios_detalhados, viagens_detalhadas, adiantamentos_detalhados, despesas_detalhadas,
+    adiantamentos_enxutos, despesas_enxutas, usuario_com_viagem_atual, PRIORIDADE_VIAGEM_ATUAL
+)
+from .pagination import (
+    DepartamentoPagination, ViagemPagination, AdiantamentoPagination, DespesaPagination, OrdenacaoCursor
+)
 from .serializers import (
     ViagemSerializer, AdiantamentoSerializer, DespesaSerializer, UserSerializer, 
-    UserCreateSerializer, DepartamentoSerializer
+    UserCreateSerializer, DepartamentoSerializer, ViagemPainelSerializer,
+    AdiantamentoListaSerializer, DespesaListaSerializer, DespesaLoteSerializer
 )
-from datetime import date
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import json
+
+# Ações em que os planos de core.prefetch são aplicados. Nas escritas o
+# serializer devolve a instância recém-alterada e o cache de prefetch ficaria velho.
+LEITURA = ('list', 'retrieve')
 
-class DepartamentoViewSet(viewsets.ReadOnlyModelViewSet):
+# Status em que o autor ainda pode editar a despesa (a edição a devolve para a
+# fila). Aprovadas ficam como estão.
+EDITAVEIS = ('PENDENTE', 'REJEITADO')
+
+# Folga aplicada ao ?since= do painel: cobre transações que gravaram
+# atualizado_em antes do instante da versão mas só confirmaram depois.
+MARGEM_PAINEL = timedelta(seconds=5)
+
+class DepartamentoViewSet(RespostaEmCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Departamento.objects.all()
     serializer_class = DepartamentoSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = DepartamentoPagination
+    cache_dependencias = (Departamento,)
 
-class ViagemViewSet(viewsets.ModelViewSet):
+    def escopo_cache(self):
+        return 'todos'
+
+class ViagemViewSet(RespostaEmCacheMixin, viewsets.ModelViewSet):
     queryset = Viagem.objects.all()
     serializer_class = ViagemSerializer
+    pagination_class = ViagemPagination
+    filter_backends = [OrdenacaoCursor]
+    ordering_fields = ['status_dinamico', 'data_inicio', 'data_fim', 'titulo']
+    ordering = ViagemPagination.ordering
+    # Participantes vêm com perfil e saldo; o filtro "pendentes" depende das despesas.
+    cache_dependencias = (Viagem, User, PerfilUsuario, Departamento, Adiantamento, Despesa, SaldoUsuario)
+
+    def escopo_cache(self):
+        # status_dinamico muda com a data mesmo sem alteração nos dados.
+        return f'{super().escopo_cache()}:{date.today()}'
 
     def get_permissions(self):
         if self.action in ['create', 'destroy', 'update', 'partial_update']:
@@ -29,6 +74,20 @@ class ViagemViewSet(viewsets.ModelViewSet):
         return [permissions.IsAuthenticated()]
 
     def get_queryset(self):
+        queryset = self.filtrar_viagens().com_status_dinamico()
+
+        status_dinamico = self.request.query_params.get('status_dinamico', None)
+        if status_dinamico:
+            try:
+                queryset = queryset.filtrar_status_dinamico(status_dinamico)
+            except ValueError:
+                raise ParseError(f"status_dinamico deve ser um de: {', '.join(ViagemQuerySet.STATUS_DINAMICO)}.")
+
+        if self.action in LEITURA:
+            queryset = viagens_detalhadas(queryset)
+        return queryset
+
+    def filtrar_viagens(self):
         user = self.request.user
         
         # --- INÍCIO DA MUDANÇA ---
@@ -44,20 +103,12 @@ class ViagemViewSet(viewsets.ModelViewSet):
         
         user_tipo = perfil.tipo
 
-        if self.action == 'list':
+        # O resumo geral resume exatamente as viagens da listagem.
+        if self.action in ('list', 'resumo_geral'):
             filtro = self.request.query_params.get('filtro', 'pendentes')
 
-            if user_tipo == 'DIRETOR':
-                subordinados = User.objects.filter(perfil__tipo='GESTOR')
-                despesas_qs = Despesa.objects.filter(usuario__in=subordinados)
-
-            elif user_tipo == 'GESTOR':
-                deptos_gerenciados = user.departamentos_gerenciados.all()
-                subordinados = User.objects.filter(
-                    perfil__tipo='COLABORADOR',
-                    perfil__departamentos__in=deptos_gerenciados
-                ).distinct()
-                despesas_qs = Despesa.objects.filter(usuario__in=subordinados)
+            if user_tipo in ['DIRETOR', 'GESTOR']:
+                despesas_qs = Despesa.objects.filter(usuario_id__in=subordinados_ids(user))
             
             else:
                 return Viagem.objects.filter(participantes=user).order_by('-data_inicio')
@@ -73,10 +124,83 @@ class ViagemViewSet(viewsets.ModelViewSet):
             
             return Viagem.objects.filter(participantes=user)
 
+    @action(detail=True, methods=['get'])
+    def painel(self, request, pk=None):
+        """
+        Viagem, despesas, adiantamentos e totais por participante numa chamada.
+        Com ?since=<versao> (valor de "versao" de uma resposta anterior) só a
+        viagem (ou null), os participantes e as despesas/adiantamentos alterados
+        desde então são enviados, junto com as listas de ids atuais para o
+        cliente descartar os excluídos.
+        """
+        viagem = self.get_object()
+        user = request.user
+        agora = timezone.now()
+
+        desde = None
+        since = request.query_params.get('since', None)
+        if since:
+            try:
+                desde = datetime.fromtimestamp(int(since) / 1_000_000, tz=dt_timezone.utc)
+            except (ValueError, OverflowError, OSError):
+                desde = None
+            if desde is None or desde > agora:
+                return Response({'error': 'Parâmetro since inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+            desde -= MARGEM_PAINEL
+
+        despesas = despesas_da_viagem(user, viagem.pk)
+        adiantamentos = adiantamentos_visiveis(user).filter(viagem=viagem)
+        context = self.get_serializer_context()
+
+        viagem_alterada = desde is None or viagem.atualizado_em >= desde
+        data = {
+            'versao': str(int(agora.timestamp() * 1_000_000)),
+            'completo': desde is None,
+            'viagem': ViagemPainelSerializer(viagem, context=context).data if viagem_alterada else None,
+            # Participantes entrando ou saindo avançam viagem.atualizado_em: aí a lista vai inteira.
+            'participantes': totais_participantes(viagem, None if viagem_alterada else desde),
+        }
+        if desde is not None:
+            data['participantes_ids'] = list(viagem.participantes.values_list('id', flat=True))
+            data['despesas_ids'] = list(despesas.values_list('id', flat=True))
+            data['adiantamentos_ids'] = list(adiantamentos.values_list('id', flat=True))
+            despesas = despesas.filter(atualizado_em__gte=desde)
+            adiantamentos = adiantamentos.filter(atualizado_em__gte=desde)
+
+        data['despesas'] = DespesaSerializer(
+            despesas_detalhadas(despesas.order_by('data_despesa', 'id')), many=True, context=context
+        ).data
+        data['adiantamentos'] = AdiantamentoSerializer(
+            adiantamentos_detalhados(adiantamentos.order_by('-data_adiantamento', '-id')), many=True, context=context
+        ).data
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def resumo(self, request, pk=None):
+        """Totais da viagem por categoria, por status e por participante."""
+        viagem = self.get_object()
+        return Response(resumos.resumo_viagens([viagem.pk], request.user)[viagem.pk])
+
+    @action(detail=False, methods=['get'], url_path='resumo')
+    def resumo_geral(self, request):
+        """
+        Resumo de todas as viagens visíveis (mesmos filtros e paginação da
+        listagem), calculado numa única consulta para a página inteira.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        pagina = self.paginate_queryset(queryset.only('id'))
+        viagens = pagina if pagina is not None else list(queryset.only('id'))
+        calculados = resumos.resumo_viagens([viagem.pk for viagem in viagens], request.user)
+        data = [calculados[viagem.pk] for viagem in viagens]
+        if pagina is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
 
 class AdiantamentoViewSet(viewsets.ModelViewSet):
     queryset = Adiantamento.objects.all().order_by('-data_adiantamento')
     serializer_class = AdiantamentoSerializer
+    pagination_class = AdiantamentoPagination
 
     def get_permissions(self):
         if self.action in ['create', 'destroy', 'update', 'partial_update']:
@@ -84,70 +208,135 @@ class AdiantamentoViewSet(viewsets.ModelViewSet):
         return [permissions.IsAuthenticated()]
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        user = self.request.user
-
-        if not user.is_superuser:
-            if getattr(user, 'perfil', None) and user.perfil.tipo == 'COLABORADOR':
-                queryset = queryset.filter(usuario=user)
+        queryset = adiantamentos_visiveis(self.request.user, super().get_queryset())
 
         viagem_id = self.request.query_params.get('viagem', None)
         if viagem_id is not None:
             queryset = queryset.filter(viagem_id=viagem_id)
+        if self.action == 'list':
+            queryset = adiantamentos_enxutos(queryset)
+        elif self.action == 'retrieve':
+            queryset = adiantamentos_detalhados(queryset)
         return queryset
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return AdiantamentoListaSerializer
+        return AdiantamentoSerializer
+
+def despesas_da_viagem(user, viagem_id, queryset=None):
+    # Despesas de uma viagem que o usuário pode ver, conforme o papel dele.
+    if queryset is None:
+        queryset = Despesa.objects.all()
+
+    if user.is_superuser:
+        return queryset.filter(viagem_id=viagem_id)
+
+    perfil = getattr(user, 'perfil', None)
+    if perfil and perfil.tipo in ['DIRETOR', 'GESTOR']:
+        return queryset.filter(
+            viagem_id=viagem_id,
+            usuario_id__in=subordinados_ids(user)
+        )
+
+    return queryset.filter(viagem_id=viagem_id, usuario=user)
+
+
+def adiantamentos_visiveis(user, queryset=None):
+    if queryset is None:
+        queryset = Adiantamento.objects.all()
+
+    if not user.is_superuser:
+        if getattr(user, 'perfil', None) and user.perfil.tipo == 'COLABORADOR':
+            queryset = queryset.filter(usuario=user)
+    return queryset
+
+
+def totais_participantes(viagem, desde=None):
+    # Totais por participante lidos do saldo materializado da viagem; com
+    # desde, só os participantes cujo saldo mudou a partir dele.
+    saldos = {
+        saldo.usuario_id: saldo
+        for saldo in SaldoUsuario.objects.filter(viagem=viagem)
+    }
+    participantes = []
+    for participante in viagem.participantes.values('id', 'username', 'first_name', 'last_name').order_by('first_name', 'id'):
+        saldo = saldos.get(participante['id'])
+        if desde is not None and (saldo is None or saldo.atualizado_em < desde):
+            continue
+        total_adiantamentos = saldo.total_adiantamentos if saldo else Decimal('0.00')
+        total_despesas = saldo.total_despesas if saldo else Decimal('0.00')
+        participantes.append({
+            **participante,
+            'total_adiantamentos': total_adiantamentos,
+            'total_despesas': total_despesas,
+            'saldo': total_adiantamentos - total_despesas,
+        })
+    return participantes
+
+
 class DespesaViewSet(viewsets.ModelViewSet):
     queryset = Despesa.objects.all()
     serializer_class = DespesaSerializer
-
-    def get_pagination_class(self):
-        return None
+    pagination_class = DespesaPagination
 
     def get_queryset(self):
+        queryset = self.filtrar_despesas()
+        if self.action == 'list':
+            queryset = despesas_enxutas(queryset)
+        elif self.action == 'retrieve':
+            queryset = despesas_detalhadas(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return DespesaListaSerializer
+        return DespesaSerializer
+
+    def filtrar_despesas(self):
         queryset = super().get_queryset()
         user = self.request.user
         viagem_id = self.request.query_params.get('viagem', None)
 
-        user_tipo = getattr(user, 'perfil', None)
-        if user_tipo:
-            user_tipo = user_tipo.tipo
-
         if viagem_id is None:
             return queryset.filter(usuario=user)
-        
-        if user.is_superuser:
-            return queryset.filter(viagem_id=viagem_id)
 
-        if user_tipo == 'DIRETOR':
-            return queryset.filter(
-                viagem_id=viagem_id,
-                usuario__perfil__tipo='GESTOR'
-            ).distinct()
+        return despesas_da_viagem(user, viagem_id, queryset)
 
-        if user_tipo == 'GESTOR':
-            meus_deptos_gerenciados = user.departamentos_gerenciados.all()
-            
-            subordinados = User.objects.filter(
-                perfil__tipo='COLABORADOR',
-                perfil__departamentos__in=meus_deptos_gerenciados
-            ).distinct()
-            
-            return queryset.filter(
-                viagem_id=viagem_id
-            ).filter(
-                Q(usuario__in=subordinados)
-            ).distinct()
-
-        return queryset.filter(viagem_id=viagem_id, usuario=user)
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        # Só no envio: o app avisa antes de o aprovador encontrar a duplicata.
+        response.data['duplicatas'] = self.duplicatas
+        return response
 
     def perform_create(self, serializer):
-        serializer.save(usuario=self.request.user)
+        despesa = serializer.save(usuario=self.request.user)
+        self.duplicatas = comprovantes.duplicatas([despesa], self.request.user)[despesa.pk]
 
     def perform_update(self, serializer):
-        serializer.save(status='PENDENTE')
-
-class UserViewSet(viewsets.ModelViewSet): 
+        # A linha fica travada até o save(): uma aprovação concorrente espera
+        # e não é desfeita por esta edição.
+        with transaction.atomic():
+            editavel = Despesa.objects.select_for_update().filter(
+                pk=serializer.instance.pk, status__in=EDITAVEIS
+            ).exists()
+            if not editavel:
+                raise PermissionDenied('Despesas aprovadas não podem ser editadas.')
+            serializer.save(status='PENDENTE')
+
+class UserViewSet(RespostaEmCacheMixin, viewsets.ModelViewSet): 
     queryset = User.objects.all()
+    cache_dependencias = (User, PerfilUsuario, Departamento, Adiantamento, Despesa, SaldoUsuario)
+
+    def escopo_cache(self):
+        # A listagem é a mesma para todos os usuários de um mesmo papel.
+        return respostas.papel(self.request.user)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in LEITURA:
+            queryset = usuarios_detalhados(queryset)
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -155,81 +344,138 @@ class UserViewSet(viewsets.ModelViewSet):
         return UserSerializer 
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'importar']:
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
-    @action(detail=False, methods=['get'])
-    def me(self, request):
-        serializer = self.get_serializer(request.user)
-        data = serializer.data
-        user = request.user
-        today = date.today()
-
-        total_adiantamentos = Adiantamento.objects.filter(usuario=user).aggregate(
-            soma=Coalesce(Sum('valor'), Decimal('0.00'))
-        )['soma']
-        total_despesas = Despesa.objects.filter(usuario=user).aggregate(
-            soma=Coalesce(Sum('valor'), Decimal('0.00'))
-        )['soma']
-        data['saldo'] = total_adiantamentos - total_despesas
-        
-        viagem_info = None
-        viagem_ativa = Viagem.objects.filter(participantes=user, data_inicio__lte=today, data_fim__gte=today).first()
-        if viagem_ativa:
-            viagem_info = {"id": viagem_ativa.id, "titulo": viagem_ativa.titulo, "status": "ATIVA"}
-        
-        if not viagem_info:
-            viagem_pendente = Viagem.objects.filter(participantes=user, data_inicio__gt=today).order_by('data_inicio').first()
-            if viagem_pendente:
-                viagem_info = {"id": viagem_pendente.id, "titulo": viagem_pendente.titulo, "status": "AGUARDANDO"}
-        
-        if not viagem_info:
-            viagem_finalizada = Viagem.objects.filter(participantes=user, data_fim__lt=today).order_by('-data_fim').first()
-            if viagem_finalizada:
-                viagem_info = {"id": viagem_finalizada.id, "titulo": viagem_finalizada.titulo, "status": "FINALIZADA"}
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """
+        Cadastro em lote (core.organizacao): um arquivo CSV/JSON em "arquivo"
+        (multipart) ou a lista de usuários no corpo JSON. Até
+        settings.ORGANIZACAO_MAXIMO_REQUISICAO usuários; mais que isso, pelo
+        comando importar_organizacao.
+        """
+        arquivo = request.FILES.get('arquivo')
+        try:
+            if arquivo is not None:
+                formato = arquivo.name.rsplit('.', 1)[-1].lower()
+                registros = organizacao.ler(arquivo.read(), formato)
+            elif isinstance(request.data, list):
+                registros = request.data
+            else:
+                return Response(
+                    {'error': 'Envie um arquivo CSV/JSON em "arquivo" ou uma lista de usuários.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        except organizacao.ImportacaoInvalida as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        maximo = settings.ORGANIZACAO_MAXIMO_REQUISICAO
+        if len(registros) > maximo:
+            return Response(
+                {'error': f'Até {maximo} usuários por requisição; use o comando importar_organizacao.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        # Sem o pool de processos: o worker da requisição calcula os hashes.
+        resultado = organizacao.importar(registros, processos=1)
+        codigo = status.HTTP_201_CREATED if resultado['criados'] else status.HTTP_200_OK
+        return Response(resultado, status=codigo)
 
-        data['viagem_atual'] = viagem_info
-        return Response(data)
+    # GET /users/me/ é atendido pela view assíncrona core.assincronas.me.
 
-class DespesasParaAprovacaoView(generics.ListAPIView):
-    serializer_class = DespesaSerializer
-    permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        user = self.request.user
-        perfil = getattr(user, 'perfil', None)
+def painel_do_usuario(user, context=None):
+    return dados_do_painel(usuario_com_viagem_atual(user, date.today()), context)
 
-        if not perfil:
-            return Despesa.objects.none() 
 
-        if perfil.tipo == 'DIRETOR':
-            return Despesa.objects.filter(
-                status='PENDENTE',
-                usuario__perfil__tipo='GESTOR'
-            )
-        
-        elif perfil.tipo == 'GESTOR':
-            deptos_gerenciados = user.departamentos_gerenciados.all()
-            
-            subordinados = User.objects.filter(
-                perfil__tipo='COLABORADOR',
-                perfil__departamentos__in=deptos_gerenciados
-            ).distinct()
-            
-            return Despesa.objects.filter(
-                status='PENDENTE',
-                usuario__in=subordinados
-            )
+def dados_do_painel(usuario, context=None):
+    # usuario vem de core.prefetch.usuarios_com_viagem_atual: a serialização não consulta o banco.
+    data = UserSerializer(usuario, context=context).data
+
+    viagem_info = None
+    if usuario.viagem_atual_id is not None:
+        viagem_info = {
+            "id": usuario.viagem_atual_id,
+            "titulo": usuario.viagem_atual_titulo,
+            "status": PRIORIDADE_VIAGEM_ATUAL[usuario.viagem_atual_prioridade],
+        }
+    data['viagem_atual'] = viagem_info
+    return data
+
+def dados_do_token(token):
+    expira_em = autenticacao.expiracao(token)
+    return {'token': token.key, 'expira_em': expira_em.isoformat() if expira_em else None}
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def login(request):
+    """
+    Mesma validação de /api-token-auth/, mas a resposta já traz os dados de
+    /users/me/ em "usuario": o frontend entra sem uma segunda requisição.
+    """
+    serializer = AuthTokenSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    user = serializer.validated_data['user']
+    token = autenticacao.token_do_usuario(user)
+
+    usuario = usuario_com_viagem_atual(user, date.today())
+    data = dados_do_token(token)
+    data['usuario'] = dados_do_painel(usuario, {'request': request})
+    return Response(data, status=status.HTTP_200_OK)
+
+
+class ObterToken(ObtainAuthToken):
+    # /api-token-auth/ para clientes antigos: com TOKEN_VALIDADE, renova o token expirado como o login.
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = autenticacao.token_do_usuario(serializer.validated_data['user'])
+        return Response({'token': token.key})
+
 
-        return Despesa.objects.none()
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def renovar_token(request):
+    """Estende a validade do token ainda válido da requisição, sem a senha."""
+    if not isinstance(request.auth, Token):
+        return Response({'error': 'Envie o token no cabeçalho Authorization.'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(dados_do_token(autenticacao.renovar(request.auth)), status=status.HTTP_200_OK)
+
+
+def despesas_pendentes(user):
+    # Fila de aprovação (GET /despesas-para-aprovacao/, em core.assincronas):
+    # leitura direta da FilaAprovacao pelo índice do aprovador.
+    return Despesa.objects.filter(fila_aprovacao__aprovador=user, status='PENDENTE')
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def marcar_fila_lida(request):
+    """Marca como lidas as despesas informadas em `ids` (ou toda a fila do usuário)."""
+    erro = _corpo_invalido(request)
+    if erro:
+        return erro
+    itens = FilaAprovacao.objects.filter(aprovador=request.user, lida=False)
+    ids = request.data.get('ids', None)
+    if ids is not None:
+        if not isinstance(ids, list):
+            return Response({'error': 'Informe a lista de ids das despesas.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            itens = itens.filter(despesa_id__in=[int(pk) for pk in ids])
+        except (TypeError, ValueError):
+            return Response({'error': 'Os ids devem ser números inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'marcadas': itens.update(lida=True)}, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotente
 def aprovar_despesa(request, pk):
     try:
-        despesa = Despesa.objects.get(pk=pk, status='PENDENTE')
+        despesa = Despesa.objects.select_related('usuario__perfil').get(pk=pk, status='PENDENTE')
     except Despesa.DoesNotExist:
         return Response({'error': 'Despesa não encontrada ou já processada.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -253,13 +499,7 @@ def aprovar_despesa(request, pk):
     
     elif perfil.tipo == 'GESTOR':
         if getattr(despesa.usuario, 'perfil', None) and despesa.usuario.perfil.tipo == 'COLABORADOR':
-            deptos_gerenciados = user.departamentos_gerenciados.all()
-            subordinados_ids = User.objects.filter(
-                perfil__tipo='COLABORADOR', 
-                perfil__departamentos__in=deptos_gerenciados
-            ).values_list('id', flat=True)
-
-            if despesa.usuario.id in subordinados_ids:
+            if despesa.usuario_id in subordinados_ids(user):
                 pass 
             else:
                 return Response({'error': 'Gestor só pode aprovar despesas de colaboradores do seu departamento.'}, status=status.HTTP_403_FORBIDDEN)
@@ -269,18 +509,17 @@ def aprovar_despesa(request, pk):
     else:
         return Response({'error': 'Você não tem permissão para aprovar despesas.'}, status=status.HTTP_403_FORBIDDEN)
 
-    despesa.status = 'APROVADO'
-    despesa.aprovador = user
-    despesa.data_aprovacao = timezone.now()
-    despesa.save()
+    if not transicionar(Despesa.objects.filter(pk=despesa.pk), 'APROVADO', user):
+        return Response({'error': 'Despesa já processada.'}, status=status.HTTP_409_CONFLICT)
     return Response({'status': 'despesa aprovada'}, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotente
 def rejeitar_despesa(request, pk):
     try:
-        despesa = Despesa.objects.get(pk=pk, status='PENDENTE')
+        despesa = Despesa.objects.select_related('usuario__perfil').get(pk=pk, status='PENDENTE')
     except Despesa.DoesNotExist:
         return Response({'error': 'Despesa não encontrada ou já processada.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -304,13 +543,7 @@ def rejeitar_despesa(request, pk):
     
     elif perfil.tipo == 'GESTOR':
         if getattr(despesa.usuario, 'perfil', None) and despesa.usuario.perfil.tipo == 'COLABORADOR':
-            deptos_gerenciados = user.departamentos_gerenciados.all()
-            subordinados_ids = User.objects.filter(
-                perfil__tipo='COLABORADOR', 
-                perfil__departamentos__in=deptos_gerenciados
-            ).values_list('id', flat=True)
-
-            if despesa.usuario.id in subordinados_ids:
+            if despesa.usuario_id in subordinados_ids(user):
                 pass 
             else:
                 return Response({'error': 'Gestor só pode aprovar despesas de colaboradores do seu departamento.'}, status=status.HTTP_403_FORBIDDEN)
@@ -324,9 +557,321 @@ def rejeitar_despesa(request, pk):
     if not observacao:
         return Response({'error': 'A observação é obrigatória para rejeitar.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    despesa.status = 'REJEITADO'
-    despesa.aprovador = user
-    despesa.data_aprovacao = timezone.now()
-    despesa.observacao_rejeicao = observacao
-    despesa.save()
-    return Response({'status': 'despesa rejeitada'}, status=status.HTTP_200_OK)
\ No newline at end of file
+    if not transicionar(Despesa.objects.filter(pk=despesa.pk), 'REJEITADO', user, {'observacao_rejeicao': observacao}):
+        return Response({'error': 'Despesa já processada.'}, status=status.HTTP_409_CONFLICT)
+    return Response({'status': 'despesa rejeitada'}, status=status.HTTP_200_OK)
+
+
+def transicionar(despesas, novo_status, user, campos_extras=None):
+    """
+    Aprova/rejeita as despesas do queryset que ainda estão pendentes com um
+    único UPDATE condicional (status='PENDENTE' no WHERE): com dois aprovadores
+    ao mesmo tempo só o primeiro altera cada despesa e o outro não sobrescreve
+    a decisão. Devolve os ids alterados por esta chamada.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        alteradas = despesas.filter(status='PENDENTE').update(
+            status=novo_status,
+            aprovador=user,
+            data_aprovacao=agora,
+            atualizado_em=agora,
+            **(campos_extras or {})
+        )
+        if not alteradas:
+            return []
+        # As linhas alteradas ficam travadas pelo UPDATE até o commit; o
+        # instante gravado separa as desta chamada das processadas por outra.
+        linhas = list(despesas.filter(
+            status=novo_status, aprovador=user, data_aprovacao=agora
+        ).values_list('id', 'viagem_id'))
+        ids = [pk for pk, _ in linhas]
+        viagens = {viagem_id for _, viagem_id in linhas}
+
+        fila.remover(ids)
+        # update() não dispara sinais; o resumo das viagens afetadas é invalidado aqui.
+        transaction.on_commit(lambda: resumos.invalidar(*viagens))
+        transaction.on_commit(lambda: respostas.invalidar(Despesa))
+    return ids
+
+# Limite de ids por chamada dos endpoints de aprovação em lote.
+LOTE_MAXIMO = 500
+
+def _corpo_invalido(request):
+    # Um array JSON no corpo chega como list em request.data.
+    if not isinstance(request.data, dict):
+        return Response({'error': 'O corpo da requisição deve ser um objeto.'}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+def _processar_lote(request, novo_status, verbo, campos_extras=None):
+    user = request.user
+    erro = _corpo_invalido(request)
+    if erro:
+        return erro
+    ids = request.data.get('ids', None)
+
+    if not isinstance(ids, list) or not ids:
+        return Response({'error': 'Informe a lista de ids das despesas.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > LOTE_MAXIMO:
+        return Response({'error': f'No máximo {LOTE_MAXIMO} despesas por lote.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in ids))
+    except (TypeError, ValueError):
+        return Response({'error': 'Os ids devem ser números inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # A permissão é resolvida uma vez para o lote inteiro.
+    if user.is_superuser:
+        permitidos = None
+    else:
+        perfil = getattr(user, 'perfil', None)
+        if not perfil or perfil.tipo not in ['DIRETOR', 'GESTOR']:
+            return Response({'error': f'Você não tem permissão para {verbo} despesas.'}, status=status.HTTP_403_FORBIDDEN)
+        permitidos = subordinados_ids(user)
+
+    candidatas = Despesa.objects.filter(pk__in=ids).exclude(usuario=user)
+    if permitidos is not None:
+        candidatas = candidatas.filter(usuario_id__in=permitidos)
+
+    with transaction.atomic():
+        processadas = set(transicionar(candidatas, novo_status, user, campos_extras))
+        # O motivo das que ficaram de fora é lido depois do UPDATE, na mesma transação.
+        encontradas = {
+            pk: (usuario_id, status_atual)
+            for pk, usuario_id, status_atual in Despesa.objects.filter(
+                pk__in=set(ids) - processadas
+            ).values_list('id', 'usuario_id', 'status')
+        }
+
+    resultados = []
+    for pk in ids:
+        if pk in processadas:
+            erro = None
+        elif pk not in encontradas:
+            erro = 'Despesa não encontrada.'
+        else:
+            usuario_id, status_atual = encontradas[pk]
+            if status_atual != 'PENDENTE':
+                erro = 'Despesa já processada.'
+            elif usuario_id == user.id:
+                erro = f'Você não pode {verbo} suas próprias despesas.'
+            else:
+                erro = f'Você não tem permissão para {verbo} esta despesa.'
+
+        if erro:
+            resultados.append({'id': pk, 'sucesso': False, 'error': erro})
+        else:
+            resultados.append({'id': pk, 'sucesso': True})
+
+    return Response({'processadas': len(processadas), 'resultados': resultados}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@idempotente
+def aprovar_despesas_lote(request):
+    return _processar_lote(request, 'APROVADO', 'aprovar')
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@idempotente
+def rejeitar_despesas_lote(request):
+    erro = _corpo_invalido(request)
+    if erro:
+        return erro
+    observacao = request.data.get('observacao_rejeicao', None)
+    if not observacao:
+        return Response({'error': 'A observação é obrigatória para rejeitar.'}, status=status.HTTP_400_BAD_REQUEST)
+    return _processar_lote(request, 'REJEITADO', 'rejeitar', {'observacao_rejeicao': observacao})
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def enviar_despesas_lote(request):
+    """
+    Cria várias despesas do usuário de uma vez (core.envio_lote). Multipart
+    com a lista em "despesas" (JSON) e o arquivo de cada item em
+    "comprovante_<id_cliente>", ou corpo JSON com comprovante_token nos itens.
+    Os itens válidos são criados mesmo que outros tenham erro.
+    """
+    user = request.user
+    erro = _corpo_invalido(request)
+    if erro:
+        return erro
+    itens = request.data.get('despesas', None)
+    if isinstance(itens, str):
+        try:
+            itens = json.loads(itens)
+        except ValueError:
+            itens = None
+    if not isinstance(itens, list) or not itens:
+        return Response({'error': 'Informe a lista de despesas.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(itens) > envio_lote.ENVIO_MAXIMO:
+        return Response(
+            {'error': f'No máximo {envio_lote.ENVIO_MAXIMO} despesas por lote.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Resultado de cada item, na ordem do envio; posicoes: id_cliente -> índice.
+    resultados = [None] * len(itens)
+    posicoes = {}
+    for posicao, item in enumerate(itens):
+        id_cliente = item.get('id_cliente', None) if isinstance(item, dict) else None
+        if id_cliente in (None, ''):
+            resultados[posicao] = {'id_cliente': None, 'sucesso': False, 'error': 'Informe o id_cliente do item.'}
+        elif str(id_cliente) in posicoes:
+            resultados[posicao] = {'id_cliente': id_cliente, 'sucesso': False, 'error': 'id_cliente repetido no lote.'}
+        else:
+            posicoes[str(id_cliente)] = posicao
+
+    # Reenvios de itens já criados não passam pela validação nem pelo storage.
+    for id_cliente, anterior in envio_lote.enviadas(user, posicoes).items():
+        posicao = posicoes.pop(id_cliente)
+        resultados[posicao] = {
+            'id_cliente': itens[posicao]['id_cliente'], 'sucesso': True, 'id': anterior, 'duplicada': True,
+        }
+
+    validos = {}
+    for id_cliente, posicao in posicoes.items():
+        dados = dict(itens[posicao])
+        arquivo = request.FILES.get(f'comprovante_{id_cliente}', None)
+        if arquivo is not None:
+            dados['comprovante'] = arquivo
+        serializer = DespesaLoteSerializer(data=dados, context={'request': request})
+        if serializer.is_valid():
+            validos[id_cliente] = serializer.validated_data
+        else:
+            resultados[posicao] = {'id_cliente': itens[posicao]['id_cliente'], 'sucesso': False, 'erros': serializer.errors}
+
+    # As viagens do lote inteiro numa consulta.
+    existentes = set(Viagem.objects.filter(
+        pk__in={dados['viagem'] for dados in validos.values()}
+    ).values_list('pk', flat=True))
+    for id_cliente in [id_cliente for id_cliente, dados in validos.items() if dados['viagem'] not in existentes]:
+        del validos[id_cliente]
+        posicao = posicoes[id_cliente]
+        resultados[posicao] = {
+            'id_cliente': itens[posicao]['id_cliente'], 'sucesso': False,
+            'erros': {'viagem': ['Viagem não encontrada.']},
+        }
+
+    campos, sobras = envio_lote.armazenar_comprovantes([dados['comprovante'] for dados in validos.values()])
+    despesas, anteriores = envio_lote.criar(user, [
+        {
+            'id_cliente': id_cliente,
+            'viagem_id': dados['viagem'],
+            'valor': dados['valor'],
+            'data_despesa': dados['data_despesa'],
+            'descricao': dados['descricao'],
+            'categoria': dados.get('categoria', 'OUTROS'),
+            **comprovante,
+        }
+        for (id_cliente, dados), comprovante in zip(validos.items(), campos)
+    ])
+
+    comprovantes.apagar(sobras)
+    # Itens que um envio simultâneo criou primeiro.
+    for id_cliente, anterior in anteriores.items():
+        posicao = posicoes[id_cliente]
+        resultados[posicao] = {
+            'id_cliente': itens[posicao]['id_cliente'], 'sucesso': True, 'id': anterior, 'duplicada': True,
+        }
+    criadas = {despesa.id_cliente: despesa.pk for despesa in despesas}
+    duplicatas = comprovantes.duplicatas(despesas, user)
+    for id_cliente, pk in criadas.items():
+        posicao = posicoes[id_cliente]
+        resultados[posicao] = {'id_cliente': itens[posicao]['id_cliente'], 'sucesso': True, 'id': pk}
+        if duplicatas[pk]:
+            resultados[posicao]['duplicatas'] = duplicatas[pk]
+
+    codigo = status.HTTP_201_CREATED if criadas else status.HTTP_200_OK
+    return Response({'criadas': len(criadas), 'resultados': resultados}, status=codigo)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def solicitar_upload(request):
+    destino = request.data.get('destino', None)
+    if destino == 'adiantamento' and not request.user.is_staff:
+        return Response({'error': 'Apenas administradores enviam comprovantes de depósito.'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        dados = uploads.gerar_upload(
+            request.user,
+            destino,
+            request.data.get('nome_arquivo', None),
+            request.data.get('content_type', None),
+            request.data.get('sha256', None),
+        )
+    except uploads.UploadInvalido as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(dados, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def confirmar_comprovante(request, pk):
+    try:
+        chave = uploads.validar_token(request.data.get('token', ''), request.user, 'despesa')
+    except uploads.UploadInvalido as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        try:
+            despesa = Despesa.objects.select_for_update().get(pk=pk, usuario=request.user)
+        except Despesa.DoesNotExist:
+            return Response({'error': 'Despesa não encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+        if despesa.status not in EDITAVEIS:
+            return Response({'error': 'Despesas aprovadas não podem ser editadas.'}, status=status.HTTP_403_FORBIDDEN)
+
+        # Trocar o comprovante é uma edição: volta para a fila, como em perform_update.
+        despesa.comprovante.name = chave
+        despesa.status = 'PENDENTE'
+        despesa.save(update_fields=[
+            'comprovante', 'comprovante_hash', 'comprovante_otimizado', 'comprovante_miniatura',
+            'status', 'atualizado_em',
+        ])
+    return Response(DespesaSerializer(despesa, context={'request': request}).data, status=status.HTTP_200_OK)
+
+
+FORMATOS_RELATORIO = {
+    'csv': ('text/csv; charset=utf-8', relatorios.stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', relatorios.stream_xlsx),
+}
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def relatorio_despesas(request, formato):
+    user = request.user
+    params = request.query_params
+    queryset = Despesa.objects.all()
+
+    if not user.is_superuser:
+        perfil = getattr(user, 'perfil', None)
+        if perfil and perfil.tipo in ['DIRETOR', 'GESTOR']:
+            queryset = queryset.filter(usuario_id__in=subordinados_ids(user))
+        else:
+            queryset = queryset.filter(usuario=user)
+
+    filtros = {
+        'viagem': 'viagem_id',
+        'usuario': 'usuario_id',
+        'departamento': 'usuario__perfil__departamentos',
+        'status': 'status',
+        'categoria': 'categoria',
+        'data_inicio': 'data_despesa__gte',
+        'data_fim': 'data_despesa__lte',
+    }
+    try:
+        for param, lookup in filtros.items():
+            valor = params.get(param, None)
+            if valor:
+                queryset = queryset.filter(**{lookup: valor})
+        # Força a validação dos parâmetros antes de começar a enviar a resposta.
+        queryset.exists()
+    except (ValueError, ValidationError):
+        return Response({'error': 'Filtro inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    content_type, gerar = FORMATOS_RELATORIO[formato]
+    response = StreamingHttpResponse(gerar(relatorios.linhas_despesas(queryset)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="despesas.{formato}"'
+    return response
@@ -9,6 +9,7 @@ function Navbar() {
 
     const handleLogout = () => {
         localStorage.removeItem('token');
+        localStorage.removeItem('tokenRenovarEm');
         localStorage.removeItem('isAdmin'); 
         localStorage.removeItem('userTipo'); 
         navigate('/login');
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { listarTodos } from '../services/api';
 import { 
     Typography, Container, Paper, Grid, TextField, 
     Button, Stack, FormControl, InputLabel, Select, MenuItem, Alert,
@@ -30,9 +30,9 @@ function AdminArea() {
     const [userToEdit, setUserToEdit] = useState(null);
 
     const loadUsers = () => {
-        api.get('users/')
-            .then(res => {
-                setUsers(res.data.filter(u => !u.is_superuser));
+        listarTodos('users/')
+            .then(itens => {
+                setUsers(itens.filter(u => !u.is_superuser));
             })
             .catch(err => {
                 console.error("Erro ao buscar usuários", err);
@@ -41,9 +41,9 @@ function AdminArea() {
     };
 
     useEffect(() => {
-        api.get('departamentos/')
-            .then(res => {
-                setDepartamentos(res.data);
+        listarTodos('departamentos/')
+            .then(itens => {
+                setDepartamentos(itens);
             })
             .catch(err => {
                 console.error("Erro ao buscar departamentos", err);
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { listarTodos } from '../services/api';
 import { 
     Typography, Container, Paper, Table, TableBody, TableCell, 
     TableContainer, TableHead, TableRow, Box, Button, Drawer, 
@@ -74,9 +74,9 @@ function Depositos() {
     // --- INÍCIO DA MUDANÇA ---
     const loadTodasViagens = () => {
         // Remove o filtro "?status=preparando" para buscar todas as viagens
-        api.get('viagens/') 
-            .then(res => {
-                setTodasViagens(res.data); // Renomeado
+        listarTodos('viagens/') 
+            .then(itens => {
+                setTodasViagens(itens); // Renomeado
             })
             .catch(err => {
                 console.error("Erro ao buscar viagens:", err);
@@ -87,9 +87,9 @@ function Depositos() {
     // --- FIM DA MUDANÇA ---
 
     const loadHistoricoDepositos = () => {
-        api.get('adiantamentos/')
-            .then(res => {
-                setHistoricoDepositos(res.data);
+        listarTodos('adiantamentos/')
+            .then(itens => {
+                setHistoricoDepositos(itens);
             })
             .catch(err => {
                 console.error("Erro ao buscar histórico de depósitos:", err);
@@ -306,7 +306,7 @@ function Depositos() {
                                             {formatarData(deposito.data_adiantamento)}
                                         </TableCell>
                                         <TableCell sx={{ color: 'white', fontWeight: 500 }}>
-                                            {deposito.usuario_detalhes?.first_name} {deposito.usuario_detalhes?.last_name}
+                                            {deposito.usuario_detalhes?.nome}
                                         </TableCell>
                                         <TableCell sx={{ color: '#ccc' }}>
                                             {deposito.viagem_titulo || 'N/A'}
@@ -1,17 +1,10 @@
 import { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 // import axios from 'axios'; // Não precisamos mais do axios direto
-import api from '../services/api'; // Esta é a nossa instância principal (para /api/...)
+import api, { salvarExpiracao } from '../services/api'; // Esta é a nossa instância principal (para /api/...)
 import { Container, Paper, TextField, Button, Typography, Box, Alert } from '@mui/material';
 import { useTheme } from '@mui/material/styles';
 
-// --- INÍCIO DA CORREÇÃO ---
-// 1. Criamos uma URL raiz separada SÓ PARA O LOGIN
-const rootURL = window.location.hostname === 'localhost' 
-    ? 'http://127.0.0.1:8000/' 
-    : 'https://hevile-prestacao-backend.onrender.com/';
-// --- FIM DA CORREÇÃO ---
-
 
 function Login() {
     const [username, setUsername] = useState('');
@@ -25,26 +18,21 @@ function Login() {
         setError('');
 
         try {
-            // --- INÍCIO DA CORREÇÃO ---
-            // 2. Fazemos a chamada de login para a ROTA RAIZ
-            //    usando a URL que acabamos de definir.
-            const response = await api.post(`${rootURL}api-token-auth/`, { 
+            // Uma chamada só: o token e os dados de users/me/ vêm juntos.
+            const response = await api.post('login/', { 
                 username, 
                 password 
             });
-            // --- FIM DA CORREÇÃO ---
             
             const token = response.data.token;
             localStorage.setItem('token', token);
+            salvarExpiracao(response.data.expira_em);
             api.defaults.headers.common['Authorization'] = `Token ${token}`;
 
-            // --- INÍCIO DA CORREÇÃO ---
-            // 3. Esta chamada usa a instância 'api' normal (que já tem /api/ na baseURL)
-            const userResponse = await api.get('users/me/'); 
-            // --- FIM DA CORREÇÃO ---
+            const usuario = response.data.usuario;
             
-            const isSuperUser = userResponse.data.is_superuser;
-            const userTipo = userResponse.data.perfil?.tipo; 
+            const isSuperUser = usuario.is_superuser;
+            const userTipo = usuario.perfil?.tipo; 
             
             localStorage.setItem('isAdmin', isSuperUser ? 'true' : 'false');
             
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { listarTodos } from '../services/api';
 import {
     Container, Typography, Paper, Box, Avatar, Grid, Chip, Tabs, Tab,
     Table, TableBody, TableCell, TableContainer, TableHead, TableRow,
@@ -108,8 +108,8 @@ function Perfil() {
             
         const userTipo = localStorage.getItem('userTipo');
         if (userTipo !== 'DIRETOR') {
-            api.get('despesas/')
-                .then(res => setMinhasDespesas(res.data))
+            listarTodos('despesas/')
+                .then(itens => setMinhasDespesas(itens))
                 .catch(err => console.error("Erro ao carregar despesas:", err));
         }
     };
@@ -175,8 +175,12 @@ function Perfil() {
         }
 
         api.post('despesas/', formData, { headers: { 'Content-Type': 'multipart/form-data' } })
-            .then(() => {
-                alert("Despesa lançada com sucesso!");
+            .then(res => {
+                if (res.data.duplicatas?.length) {
+                    alert("Despesa lançada, mas parece repetida: já existe despesa com o mesmo comprovante ou com o mesmo valor e data.");
+                } else {
+                    alert("Despesa lançada com sucesso!");
+                }
                 setDrawerDespesaOpen(false);
                 carregarTudo(); 
                 setNovaDespesa({ descricao: '', valor: '', data_despesa: new Date().toISOString().split('T')[0], categoria: 'OUTROS', comprovante: null });
@@ -50,18 +50,20 @@ function ViagemDetalhes() {
   const [usuario, setUsuario] = useState(null);
   const [loading, setLoading] = useState(true);
 
+  const [versao, setVersao] = useState(null);
+
   const fetchData = useCallback(async () => {
     setLoading(true); 
     try {
-        const [userRes, viagemRes, despesasRes] = await Promise.all([
+        const [userRes, painelRes] = await Promise.all([
             api.get('users/me/'),
-            api.get(`viagens/${id}/`),
-            api.get(`despesas/?viagem=${id}`) 
+            api.get(`viagens/${id}/painel/`)
         ]);
 
         setUsuario(userRes.data);
-        setViagem(viagemRes.data);
-        setDespesas(despesasRes.data); 
+        setViagem(painelRes.data.viagem);
+        setDespesas(painelRes.data.despesas); 
+        setVersao(painelRes.data.versao);
 
     } catch (error) {
         console.error("Erro ao carregar detalhes da viagem:", error);
@@ -70,6 +72,29 @@ function ViagemDetalhes() {
     }
   }, [id]);
 
+  // Depois de aprovar/rejeitar busca só as despesas alteradas desde a última versão.
+  const atualizarPainel = useCallback(async () => {
+    try {
+        const res = await api.get(`viagens/${id}/painel/`, { params: { since: versao } });
+        const alteradas = new Map(res.data.despesas.map(d => [d.id, d]));
+        const idsAtuais = new Set(res.data.despesas_ids);
+
+        setDespesas(atuais => {
+            const mantidas = atuais
+                .filter(d => idsAtuais.has(d.id))
+                .map(d => alteradas.get(d.id) || d);
+            const novas = res.data.despesas.filter(d => !atuais.some(a => a.id === d.id));
+            return [...mantidas, ...novas];
+        });
+        // viagem vem null quando não mudou desde a versão anterior.
+        if (res.data.viagem) setViagem(res.data.viagem);
+        setVersao(res.data.versao);
+    } catch (error) {
+        console.error("Erro ao atualizar a viagem:", error);
+        fetchData();
+    }
+  }, [id, versao, fetchData]);
+
   useEffect(() => {
     fetchData(); 
   }, [fetchData]);
@@ -110,7 +135,7 @@ function ViagemDetalhes() {
   const handleAprovar = async (despesaId) => {
     try {
       await api.post(`despesas/${despesaId}/aprovar/`);
-      fetchData(); 
+      atualizarPainel(); 
     } catch (error) {
       console.error("Erro ao aprovar despesa:", error.response?.data);
       alert("Erro ao aprovar despesa. Tente novamente.");
@@ -127,7 +152,7 @@ function ViagemDetalhes() {
       await api.post(`despesas/${despesaId}/rejeitar/`, { 
         observacao_rejeicao: motivo 
       });
-      fetchData(); 
+      atualizarPainel(); 
     } catch (error) {
       console.error("Erro ao rejeitar despesa:", error.response?.data);
       alert("Erro ao rejeitar despesa. Tente novamente.");
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { listarTodos } from '../services/api';
 import {
   Container,
   Typography,
@@ -85,14 +85,14 @@ function Viagens() {
 
   const loadViagens = () => {
     const filtro = mostrarTodos ? 'todos' : 'pendentes';
-    api.get(`viagens/?filtro=${filtro}`)
-      .then(response => setViagens(response.data))
+    listarTodos(`viagens/?filtro=${filtro}`)
+      .then(itens => setViagens(itens))
       .catch(error => console.error("Erro ao carregar viagens:", error));
   };
 
   const loadUsuarios = () => {
-    api.get('users/')
-      .then(response => setUsuarios(response.data))
+    listarTodos('users/')
+      .then(itens => setUsuarios(itens))
       .catch(error => console.error("Erro ao carregar usuários:", error));
   };
 
@@ -10,7 +10,47 @@ const api = axios.create({
     baseURL: window.location.hostname === 'localhost' ? developmentURL : productionURL,
 });
 
-api.interceptors.request.use((config) => {
+// Com validade de token no backend (TOKEN_VALIDADE), "expira_em" vem no login
+// e na renovação; sem validade vem null e nada é guardado. Passada metade da
+// validade, login/renovar/ estende o prazo do mesmo token (sem pedir a senha).
+export const salvarExpiracao = (expiraEm) => {
+    if (expiraEm) {
+        const agora = Date.now();
+        const renovarEm = agora + (new Date(expiraEm).getTime() - agora) / 2;
+        localStorage.setItem('tokenRenovarEm', String(renovarEm));
+    } else {
+        localStorage.removeItem('tokenRenovarEm');
+    }
+};
+
+// Requisições simultâneas aguardam a mesma renovação.
+let renovacao = null;
+
+const renovarSeNecessario = async () => {
+    const renovarEm = Number(localStorage.getItem('tokenRenovarEm'));
+    if (!renovarEm || Date.now() < renovarEm) {
+        return;
+    }
+    if (!renovacao) {
+        renovacao = axios.post(`${api.defaults.baseURL}login/renovar/`, null, {
+            headers: { Authorization: `Token ${localStorage.getItem('token')}` },
+        }).then((res) => {
+            localStorage.setItem('token', res.data.token);
+            salvarExpiracao(res.data.expira_em);
+        }).catch(() => {
+            // Token já expirado: a próxima requisição recebe 401.
+            localStorage.removeItem('tokenRenovarEm');
+        }).finally(() => {
+            renovacao = null;
+        });
+    }
+    await renovacao;
+};
+
+api.interceptors.request.use(async (config) => {
+    if (localStorage.getItem('token')) {
+        await renovarSeNecessario();
+    }
     const token = localStorage.getItem('token');
     if (token) {
         config.headers.Authorization = `Token ${token}`;
@@ -18,4 +58,17 @@ api.interceptors.request.use((config) => {
     return config;
 });
 
+// As listagens da API são paginadas por cursor ({ next, previous, results }).
+// Percorre as páginas seguindo "next" e devolve a lista completa.
+export const listarTodos = async (url, config) => {
+    const itens = [];
+    let proxima = url;
+    while (proxima) {
+        const res = await api.get(proxima, config);
+        itens.push(...res.data.results);
+        proxima = res.data.next;
+    }
+    return itens;
+};
+
 export default api;
\ No newline at end of file